@@ -37,4 +37,31 @@ class SimpleMemobj(MemObject):
 
     inst_port = SlavePort("CPU side port, receives requests")
     data_port = SlavePort("CPU side port, receives requests")
-    mem_side = MasterPort("Memory side port, sends requests")
+    mem_side = VectorMasterPort("Memory side ports, send requests. There "
+                                "must be a power of 2 of them")
+
+    interleave_size = Param.MemorySize('64B', "Number of contiguous bytes "
+                                       "sent to each mem_side port in turn")
+
+    latency = Param.Cycles(0, "Cycles each request and response spends "
+                              "passing through the memobj")
+    max_outstanding = Param.Unsigned(1, "Maximum number of requests in "
+                                        "flight at a time")
+
+    throttle = Param.Bool(False, "Limit the memory-side bandwidth with a "
+                                 "token bucket")
+    bandwidth = Param.MemoryBandwidth('12.8GB/s', "Bandwidth of the memory "
+                                      "side if throttle is set")
+    burst_size = Param.MemorySize('256B', "Most bytes that can be sent at "
+                                  "once after the link has been idle")
+
+    trace_file = Param.String("", "File in the output directory to record "
+                                  "a packet trace in. Empty to disable.")
+    trace_block_records = Param.Unsigned(8192, "Number of packets in each "
+                                         "compressed block of the trace")
+
+    coalesce = Param.Bool(False, "Merge outstanding reads to the same cache "
+                                 "line into one line-sized read. Needs "
+                                 "max_outstanding > 1 to have any effect.")
+
+    system = Param.System(Parent.any, "The system this memobj is part of")
@@ -0,0 +1,313 @@
+/*
+ * Copyright (c) 2017 Jason Lowe-Power
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ *
+ * Authors: Jason Lowe-Power
+ */
+
+#include "learning_gem5/simple_memobj/packet_trace.hh"
+
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#include <zlib.h>
+
+#include <cstring>
+
+#include "base/logging.hh"
+
+/**
+ * @return a little-endian word of 1 to 8 bytes
+ */
+static uint64_t
+loadWord(const uint8_t *data, unsigned bytes)
+{
+    uint64_t value = 0;
+    for (unsigned i = bytes; i-- > 0; ) {
+        value = (value << 8) | data[i];
+    }
+    return value;
+}
+
+/**
+ * Store the low bytes of a value as a little-endian word.
+ *
+ * @return the byte after the word
+ */
+static uint8_t *
+storeWord(uint8_t *data, uint64_t value, unsigned bytes)
+{
+    for (unsigned i = 0; i < bytes; i++) {
+        data[i] = value;
+        value >>= 8;
+    }
+    return data + bytes;
+}
+
+/**
+ * Write a little-endian 32-bit value to a file.
+ *
+ * @return false if the write failed
+ */
+static bool
+writeWord(std::FILE *file, uint32_t value)
+{
+    uint8_t bytes[4];
+    storeWord(bytes, value, 4);
+    return std::fwrite(bytes, 1, 4, file) == 4;
+}
+
+PacketTraceWriter::PacketTraceWriter(const std::string &path,
+                                     unsigned block_records) :
+    file(std::fopen(path.c_str(), "wb")), blockRecords(block_records),
+    pendingFull(false), closing(false), writeError(false)
+{
+    fatal_if(!file, "Can't open packet trace file %s", path);
+    fatal_if(blockRecords == 0, "Packet trace blocks need at least 1 record");
+
+    // Only the writer thread compresses, so these can be sized up front.
+    raw.resize(blockRecords * PacketTrace::recordSize);
+    compressed.resize(compressBound(raw.size()));
+    active.reserve(blockRecords);
+    pending.reserve(blockRecords);
+
+    bool ok = std::fwrite(PacketTrace::magic, 1, sizeof(PacketTrace::magic),
+                          file) == sizeof(PacketTrace::magic);
+    ok = ok && writeWord(file, PacketTrace::version);
+    ok = ok && writeWord(file, PacketTrace::recordSize);
+    ok = ok && writeWord(file, blockRecords);
+    ok = ok && writeWord(file, sizeof(PacketTrace::schema) - 1);
+    ok = ok && std::fwrite(PacketTrace::schema, 1,
+                           sizeof(PacketTrace::schema) - 1, file) ==
+               sizeof(PacketTrace::schema) - 1;
+    fatal_if(!ok, "Can't write packet trace header to %s", path);
+
+    writer = std::thread([this]{ writerLoop(); });
+}
+
+PacketTraceWriter::~PacketTraceWriter()
+{
+    close();
+}
+
+void
+PacketTraceWriter::record(const PacketTrace::Record &rec)
+{
+    panic_if(!file, "Recording to a closed packet trace");
+    active.push_back(rec);
+    if (active.size() == blockRecords) {
+        swapBuffers();
+    }
+}
+
+void
+PacketTraceWriter::swapBuffers()
+{
+    std::unique_lock<std::mutex> lock(mutex);
+    // Only wait if the writer is still busy with the last buffer.
+    cv.wait(lock, [this]{ return !pendingFull; });
+    fatal_if(writeError, "Failed to write to the packet trace");
+
+    std::swap(active, pending);
+    pendingFull = true;
+    cv.notify_all();
+    lock.unlock();
+
+    active.clear();
+}
+
+void
+PacketTraceWriter::writerLoop()
+{
+    std::unique_lock<std::mutex> lock(mutex);
+    while (true) {
+        cv.wait(lock, [this]{ return pendingFull || closing; });
+        if (!pendingFull) {
+            // Closing and everything has been written.
+            return;
+        }
+
+        // The simulation doesn't touch pending until pendingFull is clear,
+        // so it can be written without holding the lock.
+        lock.unlock();
+        bool ok = writeBlock(pending);
+        pending.clear();
+        lock.lock();
+
+        writeError = writeError || !ok;
+        pendingFull = false;
+        cv.notify_all();
+    }
+}
+
+bool
+PacketTraceWriter::writeBlock(const std::vector<PacketTrace::Record> &records)
+{
+    uint8_t *p = raw.data();
+    for (const auto &rec : records) {
+        p = storeWord(p, rec.tick, 8);
+        p = storeWord(p, rec.addr, 8);
+        p = storeWord(p, rec.pc, 8);
+        p = storeWord(p, rec.size, 4);
+        p = storeWord(p, rec.cmd, 2);
+        p = storeWord(p, rec.port, 1);
+        p = storeWord(p, rec.flags, 1);
+    }
+    uLong raw_size = p - raw.data();
+
+    uLongf compressed_size = compressed.size();
+    if (compress2(compressed.data(), &compressed_size, raw.data(), raw_size,
+                  Z_BEST_SPEED) != Z_OK) {
+        return false;
+    }
+
+    return writeWord(file, raw_size) &&
+           writeWord(file, compressed_size) &&
+           std::fwrite(compressed.data(), 1, compressed_size, file) ==
+               compressed_size;
+}
+
+void
+PacketTraceWriter::close()
+{
+    if (!file) {
+        return;
+    }
+
+    if (!active.empty()) {
+        swapBuffers();
+    }
+
+    {
+        std::lock_guard<std::mutex> lock(mutex);
+        closing = true;
+        cv.notify_all();
+    }
+    writer.join();
+
+    bool ok = std::fclose(file) == 0 && !writeError;
+    file = nullptr;
+    fatal_if(!ok, "Failed to write to the packet trace");
+}
+
+PacketTraceReader::PacketTraceReader(const std::string &path) :
+    path(path), data(nullptr), fileSize(0), nextBlock(0), blockRecords(0),
+    nextRecord(0)
+{
+    int fd = open(path.c_str(), O_RDONLY);
+    fatal_if(fd < 0, "Can't open packet trace file %s", path);
+
+    struct stat st;
+    fatal_if(fstat(fd, &st) != 0, "Can't stat packet trace file %s", path);
+    fileSize = st.st_size;
+
+    size_t header_size = sizeof(PacketTrace::magic) + 4 * 4;
+    fatal_if(fileSize < header_size, "%s isn't a packet trace", path);
+
+    void *map = mmap(nullptr, fileSize, PROT_READ, MAP_PRIVATE, fd, 0);
+    // The mapping stays valid after the file is closed
+    close(fd);
+    fatal_if(map == MAP_FAILED, "Can't map packet trace file %s", path);
+    data = static_cast<const uint8_t *>(map);
+
+    // The trace is only read from front to back
+    madvise(map, fileSize, MADV_SEQUENTIAL);
+
+    fatal_if(std::memcmp(data, PacketTrace::magic,
+                         sizeof(PacketTrace::magic)) != 0,
+             "%s isn't a packet trace", path);
+    const uint8_t *p = data + sizeof(PacketTrace::magic);
+    uint32_t version = loadWord(p, 4);
+    uint32_t record_size = loadWord(p + 4, 4);
+    blockRecords = loadWord(p + 8, 4);
+    uint32_t schema_size = loadWord(p + 12, 4);
+    fatal_if(version != PacketTrace::version ||
+             record_size != PacketTrace::recordSize,
+             "%s is a version %d packet trace with %d-byte records. "
+             "Expected version %d with %d-byte records.", path, version,
+             record_size, PacketTrace::version, PacketTrace::recordSize);
+    fatal_if(fileSize < header_size + schema_size,
+             "Packet trace %s is truncated", path);
+
+    nextBlock = header_size + schema_size;
+}
+
+PacketTraceReader::~PacketTraceReader()
+{
+    munmap(const_cast<uint8_t *>(data), fileSize);
+}
+
+bool
+PacketTraceReader::loadBlock()
+{
+    if (nextBlock == fileSize) {
+        return false;
+    }
+
+    fatal_if(fileSize - nextBlock < 8, "Packet trace %s is truncated", path);
+    uint32_t raw_size = loadWord(data + nextBlock, 4);
+    uint32_t compressed_size = loadWord(data + nextBlock + 4, 4);
+    nextBlock += 8;
+    fatal_if(fileSize - nextBlock < compressed_size,
+             "Packet trace %s is truncated", path);
+    fatal_if(raw_size > blockRecords * PacketTrace::recordSize ||
+             raw_size % PacketTrace::recordSize != 0,
+             "Packet trace %s has a corrupt block", path);
+
+    block.resize(raw_size);
+    uLongf size = raw_size;
+    int err = uncompress(block.data(), &size, data + nextBlock,
+                         compressed_size);
+    fatal_if(err != Z_OK || size != raw_size,
+             "Packet trace %s has a corrupt block", path);
+
+    nextBlock += compressed_size;
+    nextRecord = 0;
+    return true;
+}
+
+bool
+PacketTraceReader::next(PacketTrace::Record &rec)
+{
+    // Skip over any empty blocks
+    while (nextRecord == block.size()) {
+        if (!loadBlock()) {
+            return false;
+        }
+    }
+
+    const uint8_t *p = block.data() + nextRecord;
+    rec.tick = loadWord(p, 8);
+    rec.addr = loadWord(p + 8, 8);
+    rec.pc = loadWord(p + 16, 8);
+    rec.size = loadWord(p + 24, 4);
+    rec.cmd = loadWord(p + 28, 2);
+    rec.port = loadWord(p + 30, 1);
+    rec.flags = loadWord(p + 31, 1);
+    nextRecord += PacketTrace::recordSize;
+    return true;
+}
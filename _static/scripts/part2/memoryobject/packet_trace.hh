@@ -0,0 +1,239 @@
+/*
+ * Copyright (c) 2017 Jason Lowe-Power
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ *
+ * Authors: Jason Lowe-Power
+ */
+
+#ifndef __LEARNING_GEM5_SIMPLE_MEMOBJ_PACKET_TRACE_HH__
+#define __LEARNING_GEM5_SIMPLE_MEMOBJ_PACKET_TRACE_HH__
+
+#include <condition_variable>
+#include <cstddef>
+#include <cstdint>
+#include <cstdio>
+#include <mutex>
+#include <string>
+#include <thread>
+#include <vector>
+
+/**
+ * Packet traces captured by the SimpleMemobj. The file is:
+ *  - A header: the 8-byte magic "SMOBJTRC", then the format version, the
+ *    record size and the number of records per block as 32-bit values, then
+ *    the length of the schema string as a 32-bit value and the schema
+ *    string itself (without a terminator).
+ *  - Any number of blocks: the uncompressed and the compressed size in
+ *    bytes as 32-bit values, then the zlib-compressed records.
+ * Every record is recordSize bytes with the fields listed in the schema.
+ * All values are little endian.
+ */
+namespace PacketTrace
+{
+
+/// The first bytes of every trace file
+const char magic[8] = {'S', 'M', 'O', 'B', 'J', 'T', 'R', 'C'};
+
+/// The version of the file format
+const uint32_t version = 1;
+
+/// Bytes each record takes in the file
+const uint32_t recordSize = 32;
+
+/// Description of the record fields, in order, stored in the header
+const char schema[] =
+    "tick:u64 addr:u64 pc:u64 size:u32 cmd:u16 port:u8 flags:u8; "
+    "cmd is the MemCmd index; port 0 is inst_port, 1 is data_port; "
+    "flags bit 0 is set if pc is valid";
+
+/// One traced packet
+struct Record
+{
+    uint64_t tick;
+    uint64_t addr;
+    uint64_t pc;
+    uint32_t size;
+    uint16_t cmd;
+    uint8_t port;
+    uint8_t flags;
+};
+
+/// Set in Record::flags if the packet had a PC
+const uint8_t pcValid = 0x1;
+
+} // namespace PacketTrace
+
+/**
+ * Writes a packet trace without stalling the simulation on I/O. Records are
+ * collected in one buffer while a background thread compresses and writes
+ * the other. The simulation only waits if it fills a buffer before the
+ * thread has written the previous one, so memory use is bounded by the two
+ * buffers.
+ */
+class PacketTraceWriter
+{
+  private:
+    /// The trace file
+    std::FILE *file;
+
+    /// Number of records in each compressed block
+    const unsigned blockRecords;
+
+    /// Records being collected by the simulation
+    std::vector<PacketTrace::Record> active;
+
+    /// Records being written by the background thread
+    std::vector<PacketTrace::Record> pending;
+
+    /// True while pending is owned by the background thread
+    bool pendingFull;
+
+    /// True when the background thread should exit once pending is written
+    bool closing;
+
+    /// True if the background thread failed to write to the file
+    bool writeError;
+
+    /// Protects pendingFull, closing and writeError
+    std::mutex mutex;
+
+    /// Signalled whenever pendingFull or closing changes
+    std::condition_variable cv;
+
+    /// The background thread
+    std::thread writer;
+
+    /// Buffers for encoding and compressing a block. Writer thread only.
+    std::vector<uint8_t> raw;
+    std::vector<uint8_t> compressed;
+
+    /**
+     * Hand the active buffer to the background thread. Waits for it to
+     * finish with the previous buffer first.
+     */
+    void swapBuffers();
+
+    /**
+     * The background thread. Writes each buffer it is handed until closed.
+     */
+    void writerLoop();
+
+    /**
+     * Encode, compress and write a block of records to the file.
+     *
+     * @param the records in the block
+     * @return false if the write failed
+     */
+    bool writeBlock(const std::vector<PacketTrace::Record> &records);
+
+  public:
+    /**
+     * Create the trace file, write the header and start the background
+     * thread.
+     *
+     * @param path of the file to write
+     * @param number of records in each compressed block
+     */
+    PacketTraceWriter(const std::string &path, unsigned block_records);
+
+    /**
+     * Closes the trace if it isn't already closed.
+     */
+    ~PacketTraceWriter();
+
+    /**
+     * Add a record to the trace.
+     *
+     * @param the record
+     */
+    void record(const PacketTrace::Record &rec);
+
+    /**
+     * Write any remaining records, stop the background thread and close the
+     * file. Nothing can be recorded after this.
+     */
+    void close();
+};
+
+/**
+ * Reads a packet trace written by a PacketTraceWriter. The file is memory
+ * mapped and decompressed one block at a time, so memory use is bounded by
+ * one block no matter how long the trace is.
+ */
+class PacketTraceReader
+{
+  private:
+    /// The path of the trace, for error messages
+    const std::string path;
+
+    /// The mapped file
+    const uint8_t *data;
+
+    /// Size of the file in bytes
+    size_t fileSize;
+
+    /// Offset of the next block in the file
+    size_t nextBlock;
+
+    /// Maximum number of records in a block, from the header
+    uint32_t blockRecords;
+
+    /// The decompressed records of the current block
+    std::vector<uint8_t> block;
+
+    /// Offset of the next record in block
+    size_t nextRecord;
+
+    /**
+     * Decompress the next block of the file.
+     *
+     * @return false if there are no more blocks
+     */
+    bool loadBlock();
+
+  public:
+    /**
+     * Map the trace file and check its header.
+     *
+     * @param path of the file to read
+     */
+    PacketTraceReader(const std::string &path);
+
+    /**
+     * Unmaps the file.
+     */
+    ~PacketTraceReader();
+
+    /**
+     * Read the next record of the trace.
+     *
+     * @param the record to fill in
+     * @return false if the end of the trace has been reached
+     */
+    bool next(PacketTrace::Record &rec);
+};
+
+#endif // __LEARNING_GEM5_SIMPLE_MEMOBJ_PACKET_TRACE_HH__
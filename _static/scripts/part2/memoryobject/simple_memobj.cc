@@ -30,46 +30,98 @@
 
 #include "learning_gem5/simple_memobj/simple_memobj.hh"
 
+#include <algorithm>
+#include <cmath>
+
+#include "base/callback.hh"
+#include "base/intmath.hh"
+#include "base/output.hh"
+#include "debug/Drain.hh"
 #include "debug/SimpleMemobj.hh"
+#include "sim/sim_exit.hh"
+#include "sim/system.hh"
 
 SimpleMemobj::SimpleMemobj(SimpleMemobjParams *params) :
     MemObject(params),
-    instPort(params->name + ".inst_port", this),
-    dataPort(params->name + ".data_port", this),
-    memPort(params->name + ".mem_side", this),
-    blocked(false)
+    instPort(params->name + ".inst_port", 0, this),
+    dataPort(params->name + ".data_port", 1, this),
+    interleaveSize(params->interleave_size),
+    coalesce(params->coalesce),
+    lineSize(params->system->cacheLineSize()),
+    latency(params->latency),
+    maxOutstanding(params->max_outstanding),
+    throttle(params->throttle),
+    ticksPerByte(params->bandwidth),
+    burstSize(params->burst_size),
+    tokens(burstSize),
+    lastRefill(0),
+    throttledSince(MaxTick),
+    lastThrottled(nullptr),
+    outstanding(0),
+    requestEvent([this]{ sendRequests(); }, name() + ".requestEvent"),
+    responseEvent([this]{ sendResponses(); }, name() + ".responseEvent")
 {
+    fatal_if(maxOutstanding == 0, "SimpleMemobj needs max_outstanding > 0");
+    fatal_if(!isPowerOf2(interleaveSize),
+             "SimpleMemobj interleave_size must be a power of 2");
+    fatal_if(coalesce && interleaveSize < lineSize,
+             "SimpleMemobj can't coalesce lines split across mem_side ports");
+    fatal_if(throttle && burstSize == 0,
+             "SimpleMemobj needs burst_size > 0 to throttle");
+
+    // create the memory-side ports based on the number of connected ports
+    for (int i = 0; i < params->port_mem_side_connection_count; ++i) {
+        memPorts.emplace_back(name() + csprintf(".mem_side[%d]", i), this);
+    }
+    fatal_if(memPorts.empty(), "SimpleMemobj mem_side isn't connected");
+    // The memory controllers decode interleaved ranges by selecting bits
+    fatal_if(!isPowerOf2(memPorts.size()), "SimpleMemobj needs a power of 2 "
+             "number of mem_side ports (got %d)", memPorts.size());
+
+    if (!params->trace_file.empty()) {
+        // Put the trace in the output directory with the stats
+        traceWriter.reset(new PacketTraceWriter(
+            simout.resolve(params->trace_file), params->trace_block_records));
+
+        // SimObjects aren't destroyed when gem5 exits, so flush the trace
+        // from an exit callback.
+        registerExitCallback(
+            new MakeCallback<SimpleMemobj, &SimpleMemobj::closeTrace>(this));
+    }
 }
 
 Port&
 SimpleMemobj::getPort(const std::string& if_name, PortID idx)
 {
-    panic_if(idx != InvalidPortID, "This object doesn't support vector ports");
-
-    // This is the name from the Python SimObject declaration in SimpleCache.py
+    // This is the name from the Python SimObject declaration (SimpleMemobj.py)
     if (if_name == "inst_port") {
+        panic_if(idx != InvalidPortID, "inst_port isn't a vector port");
         return instPort;
     } else if (if_name == "data_port") {
+        panic_if(idx != InvalidPortID, "data_port isn't a vector port");
         return dataPort;
-    } else if (if_name == "mem_side") {
-        return memPort;
+    } else if (if_name == "mem_side" && idx < memPorts.size()) {
+        // We should have already created all of the ports in the constructor
+        return memPorts[idx];
     } else {
         // pass it along to our super class
         return MemObject::getPort(if_name, idx);
     }
 }
 
-void
+bool
 SimpleMemobj::CPUSidePort::sendPacket(PacketPtr pkt)
 {
-    // Note: This flow control is very simple since the memobj is blocking.
+    // Note: The memobj only sends a response when this port isn't blocked.
 
     panic_if(blockedPacket != nullptr, "Should never try to send if blocked!");
 
     // If we can't send the packet across the port, store it for later.
     if (!sendTimingResp(pkt)) {
         blockedPacket = pkt;
+        return false;
     }
+    return true;
 }
 
 AddrRangeList
@@ -84,11 +136,19 @@ SimpleMemobj::CPUSidePort::trySendRetry()
     if (needRetry && blockedPacket == nullptr) {
         // Only send a retry if the port is now completely free
         needRetry = false;
-        DPRINTF(SimpleMemobj, "Sending retry req for %d\n", id);
+        DPRINTF(SimpleMemobj, "Sending retry req for %s\n", name());
         sendRetryReq();
     }
 }
 
+Tick
+SimpleMemobj::CPUSidePort::recvAtomic(PacketPtr pkt)
+{
+    // Just forward to the memobj.
+    owner->tracePacket(pkt, id);
+    return owner->handleAtomic(pkt);
+}
+
 void
 SimpleMemobj::CPUSidePort::recvFunctional(PacketPtr pkt)
 {
@@ -104,6 +164,8 @@ SimpleMemobj::CPUSidePort::recvTimingReq(PacketPtr pkt)
         needRetry = true;
         return false;
     } else {
+        // Only trace requests once they are accepted, not each retry.
+        owner->tracePacket(pkt, id);
         return true;
     }
 }
@@ -119,20 +181,28 @@ SimpleMemobj::CPUSidePort::recvRespRetry()
     blockedPacket = nullptr;
 
     // Try to resend it. It's possible that it fails again.
-    sendPacket(pkt);
+    if (sendPacket(pkt)) {
+        // The response has left the memobj now.
+        owner->packetDone();
+    }
+
+    // Other responses may have been waiting for this port to unblock.
+    owner->sendResponses();
 }
 
-void
+bool
 SimpleMemobj::MemSidePort::sendPacket(PacketPtr pkt)
 {
-    // Note: This flow control is very simple since the memobj is blocking.
+    // Note: The memobj only sends a request when this port isn't blocked.
 
     panic_if(blockedPacket != nullptr, "Should never try to send if blocked!");
 
     // If we can't send the packet across the port, store it for later.
     if (!sendTimingReq(pkt)) {
         blockedPacket = pkt;
+        return false;
     }
+    return true;
 }
 
 bool
@@ -152,8 +222,18 @@ SimpleMemobj::MemSidePort::recvReqRetry()
     PacketPtr pkt = blockedPacket;
     blockedPacket = nullptr;
 
+    // Check before sending. The memory side may delete the packet if it
+    // doesn't need a response.
+    bool needs_response = pkt->needsResponse();
+
     // Try to resend it. It's possible that it fails again.
-    sendPacket(pkt);
+    if (sendPacket(pkt) && !needs_response) {
+        // Nothing will come back for this request, so it is done.
+        owner->packetDone();
+    }
+
+    // Keep draining the request queue behind it.
+    owner->sendRequests();
 }
 
 void
@@ -165,62 +245,375 @@ SimpleMemobj::MemSidePort::recvRangeChange()
 bool
 SimpleMemobj::handleRequest(PacketPtr pkt)
 {
-    if (blocked) {
-        // There is currently an outstanding request. Stall.
+    if (outstanding >= maxOutstanding) {
+        // All of the request slots are in use. Stall.
+        DPRINTF(SimpleMemobj, "Stalling request for addr %#x\n",
+                pkt->getAddr());
+        stalledRequests++;
         return false;
     }
 
     DPRINTF(SimpleMemobj, "Got request for addr %#x\n", pkt->getAddr());
+    panic_if(routeAddr(pkt->getAddr()) !=
+             routeAddr(pkt->getAddr() + pkt->getSize() - 1),
+             "Request for %#x crosses an interleaving boundary",
+             pkt->getAddr());
+    requests++;
+
+    // This request holds a slot until its response leaves the memobj.
+    outstanding++;
+    occupancy = outstanding;
+
+    if (canCoalesce(pkt)) {
+        pkt = coalesceRead(pkt);
+        if (!pkt) {
+            // It will be responded to with the line
+            return true;
+        }
+    } else if (coalesce && pkt->isWrite()) {
+        // Later reads must see this write, so they can't join a line read
+        // that was sent before it.
+        openLineReads.erase(pkt->getBlockAddr(lineSize));
+    }
 
-    // This memobj is now blocked waiting for the response to this packet.
-    blocked = true;
-
-    // Simply forward to the memory port
-    memPort.sendPacket(pkt);
+    // Queue the packet until it has spent the pipeline latency.
+    requestQueue.push_back({pkt, clockEdge(latency)});
+    if (!requestEvent.scheduled()) {
+        schedule(requestEvent, requestQueue.back().readyTick);
+    }
 
     return true;
 }
 
+PacketPtr
+SimpleMemobj::coalesceRead(PacketPtr pkt)
+{
+    Addr line_addr = pkt->getBlockAddr(lineSize);
+    panic_if(pkt->getAddr() + pkt->getSize() > line_addr + lineSize,
+             "Read for %#x crosses a cache line", pkt->getAddr());
+
+    auto it = openLineReads.find(line_addr);
+    if (it != openLineReads.end()) {
+        DPRINTF(SimpleMemobj, "Coalescing read for addr %#x\n",
+                pkt->getAddr());
+        lineReads[it->second].push_back(pkt);
+        coalescedReads++;
+        return nullptr;
+    }
+
+    // Read the whole line so reads to any part of it can join.
+    RequestPtr req = std::make_shared<Request>(line_addr, lineSize,
+                                               pkt->req->getFlags(),
+                                               pkt->req->masterId());
+    PacketPtr line_pkt = new Packet(req, MemCmd::ReadReq);
+    line_pkt->allocate();
+
+    openLineReads[line_addr] = line_pkt;
+    lineReads[line_pkt].push_back(pkt);
+    lineReadsSent++;
+    return line_pkt;
+}
+
+void
+SimpleMemobj::respondCoalesced(PacketPtr line_pkt,
+                               const std::vector<PacketPtr> &targets)
+{
+    Addr line_addr = line_pkt->getAddr();
+    for (auto pkt : targets) {
+        pkt->makeResponse();
+        if (line_pkt->isError()) {
+            pkt->copyError(line_pkt);
+        } else {
+            pkt->setData(line_pkt->getConstPtr<uint8_t>() +
+                         (pkt->getAddr() - line_addr));
+        }
+
+        // Queue the packet until it has spent the pipeline latency.
+        responseQueue.push_back({pkt, clockEdge(latency)});
+    }
+
+    delete line_pkt;
+}
+
 bool
 SimpleMemobj::handleResponse(PacketPtr pkt)
 {
-    assert(blocked);
     DPRINTF(SimpleMemobj, "Got response for addr %#x\n", pkt->getAddr());
 
-    // The packet is now done. We're about to put it in the port, no need for
-    // this object to continue to stall.
-    // We need to free the resource before sending the packet in case the CPU
-    // tries to send another request immediately (e.g., in the same callchain).
-    blocked = false;
+    auto it = lineReads.find(pkt);
+    if (it != lineReads.end()) {
+        // Nothing else can join this line read now.
+        auto open = openLineReads.find(pkt->getAddr());
+        if (open != openLineReads.end() && open->second == pkt) {
+            openLineReads.erase(open);
+        }
+
+        std::vector<PacketPtr> targets = std::move(it->second);
+        lineReads.erase(it);
+        respondCoalesced(pkt, targets);
+
+        if (!responseEvent.scheduled()) {
+            schedule(responseEvent, responseQueue.back().readyTick);
+        }
+        return true;
+    }
+
+    // Queue the packet until it has spent the pipeline latency.
+    responseQueue.push_back({pkt, clockEdge(latency)});
+    if (!responseEvent.scheduled()) {
+        schedule(responseEvent, responseQueue.back().readyTick);
+    }
 
-    // Simply forward to the memory port
-    if (pkt->req->isInstFetch()) {
-        instPort.sendPacket(pkt);
-    } else {
-        dataPort.sendPacket(pkt);
+    return true;
+}
+
+void
+SimpleMemobj::sendRequests()
+{
+    // Note: Sending a request may free a slot and cause the CPU to send
+    // another request in the same callchain. That is appended to the queue.
+    auto it = requestQueue.begin();
+    while (it != requestQueue.end()) {
+        if (it->readyTick > curTick()) {
+            // The rest of the queue arrived later, so it isn't ready either.
+            if (!requestEvent.scheduled()) {
+                schedule(requestEvent, it->readyTick);
+            }
+            return;
+        }
+
+        PacketPtr pkt = it->pkt;
+        unsigned port_id = routeAddr(pkt->getAddr());
+        if (memPorts[port_id].isBlocked()) {
+            // Wait for the retry from this port, but don't hold up requests
+            // to the other ports.
+            ++it;
+            continue;
+        }
+
+        if (throttle && !acquireTokens(pkt)) {
+            // The link is shared by all of the ports, so everything waits
+            // for tokens in order.
+            return;
+        }
+
+        requestQueueingDelay.sample(curTick() - it->readyTick);
+        it = requestQueue.erase(it);
+
+        // Check before sending. The memory side may delete the packet if it
+        // doesn't need a response.
+        bool needs_response = pkt->needsResponse();
+
+        DPRINTF(SimpleMemobj, "Sending request for addr %#x to port %d\n",
+                pkt->getAddr(), port_id);
+        portRequests[port_id]++;
+        if (memPorts[port_id].sendPacket(pkt) && !needs_response) {
+            // Nothing will come back for this request, so it is done. If
+            // it was blocked, it is done once the retry succeeds.
+            packetDone();
+        }
     }
+}
+
+bool
+SimpleMemobj::acquireTokens(PacketPtr pkt)
+{
+    unsigned bytes = pkt->getSize();
+
+    // Refill the bucket for the time since it was last refilled.
+    tokens = std::min(burstSize,
+                      tokens + (curTick() - lastRefill) / ticksPerByte);
+    lastRefill = curTick();
+
+    // A request bigger than the bucket goes as soon as it is full and
+    // leaves the bucket in debt.
+    double needed = std::min(double(bytes), burstSize);
+    if (tokens < needed) {
+        Tick wake = curTick() +
+            std::max(Tick(1), Tick(std::ceil((needed - tokens) *
+                                             ticksPerByte)));
+        DPRINTF(SimpleMemobj, "Throttling %d byte request until %d\n",
+                bytes, wake);
+        if (throttledSince == MaxTick) {
+            throttledSince = curTick();
+        }
+        // The same request is checked again each time the event wakes up.
+        if (pkt != lastThrottled) {
+            lastThrottled = pkt;
+            throttledRequests++;
+        }
+        if (!requestEvent.scheduled()) {
+            schedule(requestEvent, wake);
+        } else if (requestEvent.when() > wake) {
+            reschedule(requestEvent, wake);
+        }
+        return false;
+    }
+
+    if (throttledSince != MaxTick) {
+        throttleStallTicks += curTick() - throttledSince;
+        throttledSince = MaxTick;
+    }
+    if (pkt == lastThrottled) {
+        lastThrottled = nullptr;
+    }
+    tokens -= bytes;
+    return true;
+}
+
+void
+SimpleMemobj::sendResponses()
+{
+    // Note: Sending a response or a retry may cause the CPU to send another
+    // request in the same callchain. That only touches the request queue.
+    auto it = responseQueue.begin();
+    while (it != responseQueue.end()) {
+        if (it->readyTick > curTick()) {
+            // The rest of the queue arrived later, so it isn't ready either.
+            if (!responseEvent.scheduled()) {
+                schedule(responseEvent, it->readyTick);
+            }
+            return;
+        }
+
+        PacketPtr pkt = it->pkt;
+        CPUSidePort &port = pkt->req->isInstFetch() ? instPort : dataPort;
+        if (port.isBlocked()) {
+            // Wait for the retry from this port, but don't hold up the other
+            // port's responses.
+            ++it;
+            continue;
+        }
+
+        responseQueueingDelay.sample(curTick() - it->readyTick);
+        it = responseQueue.erase(it);
+
+        DPRINTF(SimpleMemobj, "Sending response for addr %#x\n",
+                pkt->getAddr());
+        if (port.sendPacket(pkt)) {
+            packetDone();
+        }
+        // Otherwise the slot is freed when the retry succeeds.
+    }
+}
+
+void
+SimpleMemobj::packetDone()
+{
+    assert(outstanding > 0);
+    outstanding--;
+    occupancy = outstanding;
 
     // For each of the cpu ports, if it needs to send a retry, it should do it
-    // now since this memory object may be unblocked now.
+    // now since this memory object has a free slot.
     instPort.trySendRetry();
     dataPort.trySendRetry();
 
-    return true;
+    if (drainState() == DrainState::Draining && outstanding == 0) {
+        DPRINTF(Drain, "SimpleMemobj done draining\n");
+        signalDrainDone();
+    }
+}
+
+void
+SimpleMemobj::tracePacket(PacketPtr pkt, PortID port_id)
+{
+    if (!traceWriter) {
+        return;
+    }
+
+    PacketTrace::Record rec;
+    rec.tick = curTick();
+    rec.addr = pkt->getAddr();
+    rec.pc = pkt->req->hasPC() ? pkt->req->getPC() : 0;
+    rec.size = pkt->getSize();
+    rec.cmd = pkt->cmdToIndex();
+    rec.port = port_id;
+    rec.flags = pkt->req->hasPC() ? PacketTrace::pcValid : 0;
+    traceWriter->record(rec);
+
+    tracedPackets++;
+}
+
+void
+SimpleMemobj::closeTrace()
+{
+    if (traceWriter) {
+        traceWriter->close();
+    }
 }
 
 void
 SimpleMemobj::handleFunctional(PacketPtr pkt)
 {
-    // Just pass this on to the memory side to handle for now.
-    memPort.sendFunctional(pkt);
+    // Writes that are still queued are newer than what is in memory.
+    // Check the newest first, then the ones waiting for a retry.
+    for (auto it = requestQueue.rbegin(); it != requestQueue.rend(); ++it) {
+        if (pkt->trySatisfyFunctional(it->pkt)) {
+            return;
+        }
+    }
+    for (const auto& port : memPorts) {
+        if (port.checkFunctional(pkt)) {
+            return;
+        }
+    }
+
+    // Read responses that haven't been sent back yet hold data too.
+    for (auto &entry : responseQueue) {
+        if (pkt->trySatisfyFunctional(entry.pkt)) {
+            return;
+        }
+    }
+    if (instPort.checkFunctional(pkt) || dataPort.checkFunctional(pkt)) {
+        return;
+    }
+
+    // Just pass this on to the memory side to handle.
+    memPorts[routeAddr(pkt->getAddr())].sendFunctional(pkt);
+}
+
+Tick
+SimpleMemobj::handleAtomic(PacketPtr pkt)
+{
+    // Atomic accesses complete immediately, so the memobj is never blocked.
+    // Just pass this on to the memory side.
+    return memPorts[routeAddr(pkt->getAddr())].sendAtomic(pkt);
 }
 
 AddrRangeList
 SimpleMemobj::getAddrRanges() const
 {
     DPRINTF(SimpleMemobj, "Sending new ranges\n");
-    // Just use the same ranges as whatever is on the memory side.
-    return memPort.getAddrRanges();
+    // Use the union of the ranges on the memory side. Each memory usually
+    // owns one interleaved slice of a range, so merge the slices back into
+    // a single range. Slices must come from the ports in interleaving order.
+    AddrRangeList ranges;
+    std::vector<std::vector<AddrRange>> slices;
+    for (const auto& port : memPorts) {
+        for (const auto& range : port.getAddrRanges()) {
+            if (!range.interleaved()) {
+                if (std::find(ranges.begin(), ranges.end(), range) ==
+                    ranges.end()) {
+                    ranges.push_back(range);
+                }
+                continue;
+            }
+            auto it = std::find_if(slices.begin(), slices.end(),
+                [&range](const std::vector<AddrRange>& s) {
+                    return s.front().mergesWith(range);
+                });
+            if (it == slices.end()) {
+                slices.push_back({range});
+            } else {
+                it->push_back(range);
+            }
+        }
+    }
+    for (const auto& s : slices) {
+        ranges.push_back(AddrRange(s));
+    }
+    return ranges;
 }
 
 void
@@ -230,6 +623,74 @@ SimpleMemobj::sendRangeChange()
     dataPort.sendRangeChange();
 }
 
+void
+SimpleMemobj::regStats()
+{
+    // If you don't do this you get errors about uninitialized stats.
+    MemObject::regStats();
+
+    requests.name(name() + ".requests")
+        .desc("Number of requests accepted from the CPU side")
+        ;
+
+    portRequests.name(name() + ".portRequests")
+        .desc("Number of requests sent to each memory-side port")
+        .init(memPorts.size())
+        ;
+
+    stalledRequests.name(name() + ".stalledRequests")
+        .desc("Number of requests rejected because all slots were in use")
+        ;
+
+    occupancy.name(name() + ".occupancy")
+        .desc("Average number of requests in flight")
+        ;
+
+    requestQueueingDelay.name(name() + ".requestQueueingDelay")
+        .desc("Ticks requests waited beyond the latency to be sent")
+        .init(16) // number of buckets
+        ;
+
+    responseQueueingDelay.name(name() + ".responseQueueingDelay")
+        .desc("Ticks responses waited beyond the latency to be sent")
+        .init(16) // number of buckets
+        ;
+
+    tracedPackets.name(name() + ".tracedPackets")
+        .desc("Number of requests recorded in the packet trace")
+        ;
+
+    coalescedReads.name(name() + ".coalescedReads")
+        .desc("Number of reads merged into an outstanding line read "
+              "(memory-side requests saved)")
+        ;
+
+    lineReadsSent.name(name() + ".lineReadsSent")
+        .desc("Number of line reads sent for coalescing")
+        ;
+
+    throttledRequests.name(name() + ".throttledRequests")
+        .desc("Number of requests that found too few bandwidth tokens "
+              "when they were ready to send")
+        ;
+
+    throttleStallTicks.name(name() + ".throttleStallTicks")
+        .desc("Ticks requests spent waiting for bandwidth tokens")
+        ;
+}
+
+DrainState
+SimpleMemobj::drain()
+{
+    if (outstanding == 0) {
+        return DrainState::Drained;
+    }
+
+    DPRINTF(Drain, "SimpleMemobj not drained. %d requests outstanding\n",
+            outstanding);
+    return DrainState::Draining;
+}
+
 
 
 SimpleMemobj*
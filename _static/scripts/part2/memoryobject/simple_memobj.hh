@@ -31,16 +31,32 @@
 #ifndef __LEARNING_GEM5_SIMPLE_MEMOBJ_SIMPLE_MEMOBJ_HH__
 #define __LEARNING_GEM5_SIMPLE_MEMOBJ_SIMPLE_MEMOBJ_HH__
 
+#include <list>
+#include <memory>
+#include <unordered_map>
 #include <vector>
 
+#include "base/statistics.hh"
+#include "learning_gem5/simple_memobj/packet_trace.hh"
 #include "mem/mem_object.hh"
 #include "params/SimpleMemobj.hh"
 
 /**
  * A very simple memory object. Current implementation doesn't even cache
  * anything it just forwards requests and responses.
- * This memobj is fully blocking (not non-blocking). Only a single request can
- * be outstanding at a time.
+ * The memory side can be a vector of ports. Requests are interleaved across
+ * them every interleave_size bytes.
+ * If trace_file is set, every request the CPU side sends is also recorded
+ * in a compressed packet trace (see packet_trace.hh).
+ * If coalesce is set, reads to the same cache line from either CPU-side
+ * port share a single line-sized read to the memory side.
+ * If throttle is set, the memory side is limited to the given bandwidth
+ * with a token bucket. Each request takes a token for each byte it reads or
+ * writes and waits in the request queue until there are enough.
+ * Up to max_outstanding requests can be in flight at a time. Each request and
+ * each response waits in a queue for the configured latency before it is
+ * passed on. With the default parameters the memobj is fully blocking and
+ * only a single request can be outstanding at a time.
  */
 class SimpleMemobj : public MemObject
 {
@@ -66,9 +82,11 @@ class SimpleMemobj : public MemObject
       public:
         /**
          * Constructor. Just calls the superclass constructor.
+         * The id is recorded in packet traces (0 for inst, 1 for data).
          */
-        CPUSidePort(const std::string& name, SimpleMemobj *owner) :
-            SlavePort(name, owner), owner(owner), needRetry(false),
+        CPUSidePort(const std::string& name, PortID id,
+                    SimpleMemobj *owner) :
+            SlavePort(name, owner, id), owner(owner), needRetry(false),
             blockedPacket(nullptr)
         { }
 
@@ -77,8 +95,26 @@ class SimpleMemobj : public MemObject
          * all of the flow control is hanled in this function.
          *
          * @param packet to send.
+         * @return true if the peer took the packet, false if it is held
+         *         here until the peer sends a retry
          */
-        void sendPacket(PacketPtr pkt);
+        bool sendPacket(PacketPtr pkt);
+
+        /**
+         * @return true if a response is waiting for a retry from the peer
+         */
+        bool isBlocked() const { return blockedPacket != nullptr; }
+
+        /**
+         * Check a functional access against the response waiting for a retry.
+         *
+         * @param the functional packet
+         * @return true if the access was fully satisfied
+         */
+        bool checkFunctional(PacketPtr pkt) const
+        {
+            return blockedPacket && pkt->trySatisfyFunctional(blockedPacket);
+        }
 
         /**
          * Get a list of the non-overlapping address ranges the owner is
@@ -91,17 +127,19 @@ class SimpleMemobj : public MemObject
 
         /**
          * Send a retry to the peer port only if it is needed. This is called
-         * from the SimpleCache whenever it is unblocked.
+         * from the SimpleMemobj whenever a request slot frees up.
          */
         void trySendRetry();
 
       protected:
         /**
          * Receive an atomic request packet from the master port.
-         * No need to implement in this simple memobj.
+         * Just forwards to the memobj.
+         *
+         * @param packet the requestor sent.
+         * @return the latency of the access
          */
-        Tick recvAtomic(PacketPtr pkt) override
-        { panic("recvAtomic unimpl."); }
+        Tick recvAtomic(PacketPtr pkt) override;
 
         /**
          * Receive a functional request packet from the master port.
@@ -132,6 +170,7 @@ class SimpleMemobj : public MemObject
     /**
      * Port on the memory-side that receives responses.
      * Mostly just forwards requests to the owner
+     * Part of a vector of ports. One for each interleaved memory.
      */
     class MemSidePort : public MasterPort
     {
@@ -155,8 +194,26 @@ class SimpleMemobj : public MemObject
          * all of the flow control is hanled in this function.
          *
          * @param packet to send.
+         * @return true if the peer took the packet, false if it is held
+         *         here until the peer sends a retry
+         */
+        bool sendPacket(PacketPtr pkt);
+
+        /**
+         * @return true if a request is waiting for a retry from the peer
          */
-        void sendPacket(PacketPtr pkt);
+        bool isBlocked() const { return blockedPacket != nullptr; }
+
+        /**
+         * Check a functional access against the request waiting for a retry.
+         *
+         * @param the functional packet
+         * @return true if the access was fully satisfied
+         */
+        bool checkFunctional(PacketPtr pkt) const
+        {
+            return blockedPacket && pkt->trySatisfyFunctional(blockedPacket);
+        }
 
       protected:
         /**
@@ -181,6 +238,18 @@ class SimpleMemobj : public MemObject
         void recvRangeChange() override;
     };
 
+    /**
+     * A packet waiting in one of the internal queues.
+     */
+    struct QueuedPacket
+    {
+        /// The packet to pass on
+        PacketPtr pkt;
+
+        /// The tick the packet has spent the pipeline latency and can leave
+        Tick readyTick;
+    };
+
     /**
      * Handle the request from the CPU side
      *
@@ -199,6 +268,90 @@ class SimpleMemobj : public MemObject
      */
     bool handleResponse(PacketPtr pkt);
 
+    /**
+     * Try to merge a read into an outstanding read of its cache line. If
+     * there isn't one, start a line read the following reads can join.
+     *
+     * @param the read from the CPU side
+     * @return the packet to send to the memory side, or null if the read
+     *         joined an outstanding line read
+     */
+    PacketPtr coalesceRead(PacketPtr pkt);
+
+    /**
+     * Respond to every read waiting on a line read.
+     *
+     * @param the response to the line read. It is deleted.
+     * @param the reads waiting for it
+     */
+    void respondCoalesced(PacketPtr line_pkt,
+                          const std::vector<PacketPtr> &targets);
+
+    /**
+     * @return true if this request can share a line read with others
+     */
+    bool canCoalesce(PacketPtr pkt) const
+    {
+        return coalesce && pkt->cmd == MemCmd::ReadReq &&
+               !pkt->req->isUncacheable() && !pkt->req->isLLSC();
+    }
+
+    /**
+     * Take tokens for a request from the token bucket. If there aren't
+     * enough, schedule the request event for when there will be.
+     *
+     * @param the request
+     * @return true if the request can be sent now
+     */
+    bool acquireTokens(PacketPtr pkt);
+
+    /**
+     * Send every request whose latency has elapsed to the memory side, in
+     * order. Requests for a blocked memory-side port wait without stalling
+     * requests for the other ports. If the oldest waiting request isn't
+     * ready yet, schedule an event for it.
+     */
+    void sendRequests();
+
+    /**
+     * Find the memory-side port responsible for an address.
+     *
+     * @param the address of the access
+     * @return the index of the port in memPorts
+     */
+    unsigned routeAddr(Addr addr) const
+    {
+        return (addr / interleaveSize) % memPorts.size();
+    }
+
+    /**
+     * Send every response whose latency has elapsed to its CPU-side port.
+     * Responses for a blocked port wait without stalling responses for the
+     * other port.
+     */
+    void sendResponses();
+
+    /**
+     * Called when a packet leaves the memobj, i.e., when the peer port
+     * takes the response, or the request if it doesn't need a response.
+     * Frees its request slot and sends retries to any CPU-side port that
+     * was stalled.
+     */
+    void packetDone();
+
+    /**
+     * Record a request in the packet trace, if tracing is on.
+     *
+     * @param the request
+     * @param the id of the CPU-side port it came from
+     */
+    void tracePacket(PacketPtr pkt, PortID port_id);
+
+    /**
+     * Write out the rest of the packet trace. Called when gem5 exits.
+     */
+    void closeTrace();
+
     /**
      * Handle a packet functionally. Update the data on a write and get the
      * data on a read.
@@ -207,9 +360,18 @@ class SimpleMemobj : public MemObject
      */
     void handleFunctional(PacketPtr pkt);
 
+    /**
+     * Handle an atomic access. Just forwards the packet to the memory side.
+     *
+     * @param packet to handle
+     * @return the latency of the access
+     */
+    Tick handleAtomic(PacketPtr pkt);
+
     /**
      * Return the address ranges this memobj is responsible for. Just use the
-     * same as the next upper level of the hierarchy.
+     * same as the next upper level of the hierarchy, merging the interleaved
+     * ranges of the memory-side ports.
      *
      * @return the address ranges this memobj is responsible for
      */
@@ -224,11 +386,81 @@ class SimpleMemobj : public MemObject
     CPUSidePort instPort;
     CPUSidePort dataPort;
 
-    /// Instantiation of the memory-side port
-    MemSidePort memPort;
+    /// Instantiation of the memory-side ports
+    std::vector<MemSidePort> memPorts;
+
+    /// Number of contiguous bytes sent to each memory-side port in turn
+    const Addr interleaveSize;
+
+    /// True if reads to the same line share a single memory-side read
+    const bool coalesce;
+
+    /// The size of the lines reads are coalesced in
+    const unsigned lineSize;
+
+    /// Number of cycles each packet spends passing through in each direction
+    const Cycles latency;
+
+    /// Maximum number of requests that can be in flight at a time
+    const unsigned maxOutstanding;
 
-    /// True if this is currently blocked waiting for a response.
-    bool blocked;
+    /// True if the memory-side bandwidth is limited
+    const bool throttle;
+
+    /// The bandwidth limit, as the ticks it takes to transfer a byte
+    const double ticksPerByte;
+
+    /// The most tokens (in bytes) the bucket can hold
+    const double burstSize;
+
+    /// Tokens (in bytes) in the bucket the last time it was refilled
+    double tokens;
+
+    /// The tick the bucket was last refilled
+    Tick lastRefill;
+
+    /// The tick requests started waiting for tokens, MaxTick if they aren't
+    Tick throttledSince;
+
+    /// The last request that found too few tokens, so it's counted once
+    PacketPtr lastThrottled;
+
+    /// Number of requests accepted that haven't been responded to yet
+    unsigned outstanding;
+
+    /// Requests waiting to be sent to the memory side, in arrival order
+    std::list<QueuedPacket> requestQueue;
+
+    /// Responses waiting to be sent to the CPU side, in arrival order
+    std::list<QueuedPacket> responseQueue;
+
+    /// The line read that reads to each line can still join
+    std::unordered_map<Addr, PacketPtr> openLineReads;
+
+    /// The reads waiting for each outstanding line read
+    std::unordered_map<PacketPtr, std::vector<PacketPtr>> lineReads;
+
+    /// Event to send requests from the request queue
+    EventFunctionWrapper requestEvent;
+
+    /// Event to send responses from the response queue
+    EventFunctionWrapper responseEvent;
+
+    /// The packet trace being captured, or null if tracing is off
+    std::unique_ptr<PacketTraceWriter> traceWriter;
+
+    /// Memobj statistics
+    Stats::Scalar requests;
+    Stats::Vector portRequests;
+    Stats::Scalar stalledRequests;
+    Stats::Average occupancy;
+    Stats::Histogram requestQueueingDelay;
+    Stats::Histogram responseQueueingDelay;
+    Stats::Scalar tracedPackets;
+    Stats::Scalar coalescedReads;
+    Stats::Scalar lineReadsSent;
+    Stats::Scalar throttledRequests;
+    Stats::Scalar throttleStallTicks;
 
   public:
 
@@ -236,6 +468,19 @@ class SimpleMemobj : public MemObject
      */
     SimpleMemobj(SimpleMemobjParams *params);
 
+    /**
+     * Register the stats
+     */
+    void regStats() override;
+
+    /**
+     * Drain the memobj before a checkpoint or CPU switch. Waits for all of
+     * the outstanding requests to be responded to.
+     *
+     * @return Drained if nothing is outstanding, else Draining
+     */
+    DrainState drain() override;
+
     /**
      * Get a port with a given name and index. This is used at
      * binding time and returns a reference to a protocol-agnostic
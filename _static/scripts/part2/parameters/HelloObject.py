@@ -48,3 +48,5 @@ class GoodbyeObject(SimObject):
                                    "Size of buffer to fill with goodbye")
     write_bandwidth = Param.MemoryBandwidth('100MB/s', "Bandwidth to fill "
                                             "the buffer")
+    fill_interval = Param.Latency('1us', "Simulated time each event filling "
+                                  "the buffer covers")
@@ -30,14 +30,22 @@
 
 #include "learning_gem5/goodbye_object.hh"
 
+#include <algorithm>
+#include <cstring>
+
 #include "debug/Hello.hh"
 #include "sim/sim_exit.hh"
 
 GoodbyeObject::GoodbyeObject(GoodbyeObjectParams *params) :
     SimObject(params), event(*this), bandwidth(params->write_bandwidth),
+    fillInterval(params->fill_interval), messagesPerFill(1),
     bufferSize(params->buffer_size), buffer(nullptr), bufferUsed(0)
 {
     buffer = new char[bufferSize];
+    // The last byte is never filled. Terminate the message there.
+    if (bufferSize > 0) {
+        buffer[bufferSize - 1] = '\0';
+    }
     DPRINTF(Hello, "Created the goodbye object\n");
 }
 
@@ -60,6 +68,12 @@ GoodbyeObject::sayGoodbye(std::string other_name)
 
     message = "Goodbye " + other_name + "!! ";
 
+    // Copy as many whole messages each event as the bandwidth allows in one
+    // fill interval, but always make progress and never more than fit.
+    double messages = fillInterval / (bandwidth * message.length());
+    double max_messages = bufferSize / message.length() + 1;
+    messagesPerFill = std::max(1, int(std::min(messages, max_messages)));
+
     fillBuffer();
 }
 
@@ -69,27 +83,58 @@ GoodbyeObject::fillBuffer()
     // There better be a message
     assert(message.length() > 0);
 
-    // Copy from the message to the buffer per byte.
-    int bytes_copied = 0;
-    for (auto it = message.begin();
-         it < message.end() && bufferUsed < bufferSize - 1;
-         it++, bufferUsed++, bytes_copied++) {
-        // Copy the character into the buffer
-        buffer[bufferUsed] = *it;
+    int msg_len = message.length();
+    int start = bufferUsed;
+    int end = std::min(bufferSize - 1,
+                       bufferUsed + messagesPerFill * msg_len);
+
+    // Copy the first message into the buffer. The buffer is the message
+    // repeated, so after that copy from the start of the buffer, doubling
+    // the amount copied each time. The buffer is only ever filled up to a
+    // multiple of the message length, except at the very end.
+    if (bufferUsed == 0 && end > 0) {
+        bufferUsed = std::min(msg_len, end);
+        std::memcpy(buffer, message.data(), bufferUsed);
+    }
+    while (bufferUsed < end) {
+        int bytes = std::min(bufferUsed, end - bufferUsed);
+        std::memcpy(buffer + bufferUsed, buffer, bytes);
+        bufferUsed += bytes;
     }
 
+    // Add up the time it would have taken to copy each message on its own,
+    // so the buffer is done at the same tick whatever the fill interval.
+    Tick when = curTick();
+    int copied = start;
+    do {
+        when = when + bandwidth * std::min(msg_len, bufferUsed - copied);
+        copied += msg_len;
+    } while (copied < bufferUsed);
+
     if (bufferUsed < bufferSize - 1) {
         // Wait for the next copy for as long as it would have taken
         DPRINTF(Hello, "Scheduling another fillBuffer in %d ticks\n",
-                bandwidth * bytes_copied);
-        schedule(event, curTick() + bandwidth * bytes_copied);
+                when - curTick());
+        schedule(event, when);
+        fillEvents++;
     } else {
         DPRINTF(Hello, "Goodbye done copying!\n");
         // Be sure to take into account the time for the last bytes
-        exitSimLoop(buffer, 0, curTick() + bandwidth * bytes_copied);
+        exitSimLoop(buffer, 0, when);
     }
 }
 
+void
+GoodbyeObject::regStats()
+{
+    // If you don't do this you get errors about uninitialized stats.
+    SimObject::regStats();
+
+    fillEvents.name(name() + ".fillEvents")
+        .desc("Number of events scheduled to fill the buffer")
+        ;
+}
+
 GoodbyeObject*
 GoodbyeObjectParams::create()
 {
@@ -33,6 +33,7 @@
 
 #include <string>
 
+#include "base/statistics.hh"
 #include "params/GoodbyeObject.hh"
 #include "sim/sim_object.hh"
 
@@ -42,16 +43,23 @@ class GoodbyeObject : public SimObject
     void processEvent();
 
     /**
-     * Fills the buffer for one iteration. If the buffer isn't full, this
-     * function will enqueue another event to continue filling.
+     * Fills the buffer for one iteration. Copies as many whole messages as
+     * the bandwidth allows in one fill interval. If the buffer isn't full,
+     * this function will enqueue another event to continue filling.
      */
     void fillBuffer();
 
     EventWrapper<GoodbyeObject, &GoodbyeObject::processEvent> event;
 
-    /// The bytes processed per tick
+    /// The ticks taken to process each byte
     float bandwidth;
 
+    /// The simulated time each fill event covers
+    Tick fillInterval;
+
+    /// The number of whole messages copied by each fill event
+    int messagesPerFill;
+
     /// The size of the buffer we are going to fill
     int bufferSize;
 
@@ -64,10 +72,18 @@ class GoodbyeObject : public SimObject
     /// The amount of the buffer we've used so far.
     int bufferUsed;
 
+    /// Number of fill events scheduled
+    Stats::Scalar fillEvents;
+
   public:
     GoodbyeObject(GoodbyeObjectParams *p);
     ~GoodbyeObject();
 
+    /**
+     * Register the stats
+     */
+    void regStats() override;
+
     /**
      * Called by an outside object. Starts off the events to fill the buffer
      * with a goodbye message.
@@ -32,6 +32,12 @@ from m5.proxy import *
 from MemObject import MemObject
 
 class SimpleCache(MemObject):
+    """A simple cache for the learning_gem5 tutorial.
+
+    Checkpoints store the cache contents in a separate binary file,
+    <name>.cache, next to m5.cpt. That file has to be copied along with the
+    rest of the checkpoint directory.
+    """
     type = 'SimpleCache'
     cxx_header = "learning_gem5/simple_cache/simple_cache.hh"
 
@@ -42,4 +48,75 @@ class SimpleCache(MemObject):
 
     size = Param.MemorySize('16kB', "The size of the cache")
 
+    # The original SimpleCache was fully associative. It is now 8-way set
+    # associative by default so that lookups only search a few ways.
+    assoc = Param.Unsigned(8, "The associativity of the cache")
+
+    replacement_policy = Param.String('random', "Replacement policy: random, "
+                                      "lru, nmru, tree_plru, or srrip")
+
+    sectors = Param.Unsigned(1, "Number of sectors in each block. Each "
+                             "sector has its own valid and dirty bits")
+
     system = Param.System(Parent.any, "The system this cache is part of")
+
+    warm_tags_only = Param.Bool(False, "In atomic mode, only update the tags "
+                                "and send all accesses on to memory. Useful "
+                                "for quickly warming the cache when "
+                                "fast-forwarding. Blocks are kept clean "
+                                "and the victim buffer is bypassed while "
+                                "warming.")
+
+    clean_evict = Param.Bool(False, "Send a CleanEvict downstream when a "
+                             "clean block is evicted instead of dropping it")
+
+    banks = Param.Unsigned(1, "Number of address-interleaved banks. Each "
+                           "bank can start one access per cycle")
+
+    port_queue_depth = Param.Unsigned(1, "Number of requests each CPU-side "
+                                         "port can buffer before the "
+                                         "requestor must retry")
+
+    mshrs = Param.Unsigned(1, "Number of outstanding misses (MSHRs)")
+
+    tgts_per_mshr = Param.Unsigned(8, "Number of requests that can wait on "
+                                      "a single outstanding miss")
+
+    write_buffers = Param.Unsigned(8, "Number of evictions (or blocks of "
+                                      "stores) that can wait to be written "
+                                      "to memory")
+
+    victim_entries = Param.Unsigned(0, "Number of blocks in a fully-"
+                                    "associative victim buffer for evicted "
+                                    "blocks. 0 disables it")
+
+    write_policy = Param.String('writeback', "Write policy: writeback or "
+                                "writethrough (every write is also sent on "
+                                "to memory)")
+
+    write_allocate = Param.Bool(True, "Fetch the block on a write miss. If "
+                                "False, the write is sent on to memory "
+                                "without allocating the block")
+
+    write_combine_latency = Param.Cycles(4, "Cycles that buffered stores "
+                                         "wait for more stores to the same "
+                                         "block before they are sent")
+
+    compressed = Param.Bool(False, "Store the data compressed (zero, "
+                            "repeated value and base-delta encodings) so "
+                            "that large caches use less host memory")
+
+    coherent = Param.Bool(False, "Snoop the memory side so that this cache "
+                          "stays coherent with other coherent caches on the "
+                          "same crossbar (e.g., private per-CPU caches). "
+                          "A coherent cache can only be restored from a "
+                          "checkpoint taken while it held no blocks")
+
+    prefetcher = Param.String('none', "Prefetcher: none, stride (per-PC "
+                              "stride table), stream (next-N-line stream "
+                              "detector), or stride_stream (both)")
+
+    prefetch_degree = Param.Unsigned(2, "Number of blocks to prefetch ahead")
+
+    stride_table_entries = Param.Unsigned(64, "Number of PCs the stride "
+                                              "prefetcher tracks")
@@ -0,0 +1,285 @@
+/*
+ * Copyright (c) 2017 Jason Lowe-Power
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ *
+ * Authors: Jason Lowe-Power
+ */
+
+#include "learning_gem5/simple_cache/compressed_store.hh"
+
+#include <algorithm>
+#include <cstring>
+
+#include "base/logging.hh"
+
+const unsigned SimpleCompressedStore::slotsPerChunk;
+
+/**
+ * @return a little-endian word of 1 to 8 bytes
+ */
+static uint64_t
+loadWord(const uint8_t *data, unsigned bytes)
+{
+    uint64_t value = 0;
+    for (unsigned i = bytes; i-- > 0; ) {
+        value = (value << 8) | data[i];
+    }
+    return value;
+}
+
+/**
+ * Store the low bytes of a value as a little-endian word.
+ */
+static void
+storeWord(uint8_t *data, uint64_t value, unsigned bytes)
+{
+    for (unsigned i = 0; i < bytes; i++) {
+        data[i] = value;
+        value >>= 8;
+    }
+}
+
+/**
+ * @return the low bits of a value sign extended to 64 bits
+ */
+static uint64_t
+signExtend(uint64_t value, unsigned bits)
+{
+    uint64_t sign = 1ULL << (bits - 1);
+    value &= (sign << 1) - 1;
+    return (value ^ sign) - sign;
+}
+
+SimpleCompressedStore::SimpleCompressedStore(unsigned num_blocks,
+                                             unsigned block_size) :
+    blockSize(block_size), blocks(num_blocks), pools(NumEncodings),
+    storedBytes(0), encoded(block_size)
+{
+    fatal_if(blockSize % 8 != 0, "SimpleCache compression needs blocks that "
+             "are a multiple of 8 bytes (got %d)", blockSize);
+
+    for (unsigned e = 0; e < NumEncodings; e++) {
+        pools[e].slotSize = encodedSize(Encoding(e));
+    }
+
+    // Try the smallest encodings first. Ones that are no smaller than the
+    // block itself (with tiny blocks) are never worth it.
+    for (unsigned e = Base8Delta1; e <= Base4Delta2; e++) {
+        if (encodedSize(Encoding(e)) < blockSize) {
+            baseDeltaOrder.push_back(Encoding(e));
+        }
+    }
+    std::stable_sort(baseDeltaOrder.begin(), baseDeltaOrder.end(),
+                     [this](Encoding a, Encoding b)
+                     { return encodedSize(a) < encodedSize(b); });
+}
+
+unsigned
+SimpleCompressedStore::wordBytes(Encoding encoding)
+{
+    return encoding <= Base8Delta4 ? 8 : 4;
+}
+
+unsigned
+SimpleCompressedStore::deltaBytes(Encoding encoding)
+{
+    switch (encoding) {
+      case Base8Delta1:
+      case Base4Delta1:
+        return 1;
+      case Base8Delta2:
+      case Base4Delta2:
+        return 2;
+      default:
+        return 4;
+    }
+}
+
+unsigned
+SimpleCompressedStore::encodedSize(Encoding encoding) const
+{
+    switch (encoding) {
+      case Zero:
+        return 0;
+      case Repeated:
+        return 8;
+      case Uncompressed:
+        return blockSize;
+      default:
+        return wordBytes(encoding) +
+               deltaBytes(encoding) * (blockSize / wordBytes(encoding));
+    }
+}
+
+bool
+SimpleCompressedStore::encodeBaseDelta(const uint8_t *data,
+                                       Encoding encoding,
+                                       uint8_t *out) const
+{
+    unsigned word_bytes = wordBytes(encoding);
+    unsigned delta_bytes = deltaBytes(encoding);
+
+    uint64_t base = loadWord(data, word_bytes);
+    storeWord(out, base, word_bytes);
+    out += word_bytes;
+
+    for (unsigned i = 0; i < blockSize; i += word_bytes) {
+        // Deltas wrap around at the word size like the words do
+        uint64_t delta = signExtend(loadWord(data + i, word_bytes) - base,
+                                    word_bytes * 8);
+        if (signExtend(delta, delta_bytes * 8) != delta) {
+            return false;
+        }
+        storeWord(out, delta, delta_bytes);
+        out += delta_bytes;
+    }
+    return true;
+}
+
+uint8_t *
+SimpleCompressedStore::slotData(Encoding encoding, uint32_t slot) const
+{
+    const Pool &pool = pools[encoding];
+    return pool.chunks[slot / slotsPerChunk].get() +
+           (slot % slotsPerChunk) * pool.slotSize;
+}
+
+uint32_t
+SimpleCompressedStore::allocateSlot(Encoding encoding)
+{
+    Pool &pool = pools[encoding];
+    if (pool.slotSize == 0) {
+        return 0;
+    }
+
+    if (!pool.freeSlots.empty()) {
+        uint32_t slot = pool.freeSlots.back();
+        pool.freeSlots.pop_back();
+        return slot;
+    }
+
+    if (pool.usedSlots == pool.chunks.size() * slotsPerChunk) {
+        pool.chunks.emplace_back(new uint8_t[slotsPerChunk * pool.slotSize]);
+    }
+    return pool.usedSlots++;
+}
+
+SimpleCompressedStore::Encoding
+SimpleCompressedStore::write(unsigned index, const uint8_t *data)
+{
+    Encoding encoding = Uncompressed;
+    const uint8_t *src = data;
+    if (std::memcmp(data, data + 8, blockSize - 8) == 0) {
+        // Every 8-byte word is the same
+        encoding = loadWord(data, 8) == 0 ? Zero : Repeated;
+    } else {
+        for (auto base_delta : baseDeltaOrder) {
+            if (encodeBaseDelta(data, base_delta, encoded.data())) {
+                encoding = base_delta;
+                src = encoded.data();
+                break;
+            }
+        }
+    }
+
+    Block &block = blocks[index];
+    if (block.encoding != encoding) {
+        clear(index);
+        block.encoding = encoding;
+        block.slot = allocateSlot(encoding);
+        storedBytes += encodedSize(encoding);
+    }
+    if (encoding != Zero) {
+        std::memcpy(slotData(encoding, block.slot), src,
+                    encodedSize(encoding));
+    }
+    return encoding;
+}
+
+void
+SimpleCompressedStore::read(unsigned index, uint8_t *data) const
+{
+    const Block &block = blocks[index];
+    Encoding encoding = Encoding(block.encoding);
+    if (encoding == Zero) {
+        std::memset(data, 0, blockSize);
+        return;
+    }
+
+    const uint8_t *src = slotData(encoding, block.slot);
+    if (encoding == Repeated) {
+        for (unsigned i = 0; i < blockSize; i += 8) {
+            std::memcpy(data + i, src, 8);
+        }
+    } else if (encoding == Uncompressed) {
+        std::memcpy(data, src, blockSize);
+    } else {
+        unsigned word_bytes = wordBytes(encoding);
+        unsigned delta_bytes = deltaBytes(encoding);
+        uint64_t base = loadWord(src, word_bytes);
+        src += word_bytes;
+        for (unsigned i = 0; i < blockSize; i += word_bytes) {
+            uint64_t delta = signExtend(loadWord(src, delta_bytes),
+                                        delta_bytes * 8);
+            storeWord(data + i, base + delta, word_bytes);
+            src += delta_bytes;
+        }
+    }
+}
+
+void
+SimpleCompressedStore::clear(unsigned index)
+{
+    Block &block = blocks[index];
+    Encoding encoding = Encoding(block.encoding);
+    if (encoding != Zero) {
+        pools[encoding].freeSlots.push_back(block.slot);
+        storedBytes -= encodedSize(encoding);
+    }
+    block.encoding = Zero;
+    block.slot = 0;
+}
+
+size_t
+SimpleCompressedStore::hostFootprint() const
+{
+    size_t bytes = blocks.capacity() * sizeof(Block) + encoded.capacity();
+    for (auto& pool : pools) {
+        bytes += pool.chunks.size() * slotsPerChunk * pool.slotSize +
+                 pool.freeSlots.capacity() * sizeof(uint32_t);
+    }
+    return bytes;
+}
+
+const char *
+SimpleCompressedStore::encodingName(Encoding encoding)
+{
+    static const char *names[NumEncodings] = {
+        "zero", "repeated", "base8_delta1", "base8_delta2", "base8_delta4",
+        "base4_delta1", "base4_delta2", "uncompressed"
+    };
+    return names[encoding];
+}
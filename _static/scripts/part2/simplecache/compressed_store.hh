@@ -0,0 +1,180 @@
+/*
+ * Copyright (c) 2017 Jason Lowe-Power
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ *
+ * Authors: Jason Lowe-Power
+ */
+
+#ifndef __LEARNING_GEM5_SIMPLE_CACHE_COMPRESSED_STORE_HH__
+#define __LEARNING_GEM5_SIMPLE_CACHE_COMPRESSED_STORE_HH__
+
+#include <cstddef>
+#include <cstdint>
+#include <memory>
+#include <vector>
+
+/**
+ * Compressed data storage for the SimpleCache. Each block is stored with
+ * the smallest of these encodings that can represent it:
+ *  - Zero: every byte is zero. Nothing is stored.
+ *  - Repeated: the block is one 8-byte value repeated.
+ *  - Base-delta: the block is split into 8- or 4-byte words and each word
+ *    is stored as a 1-, 2- or 4-byte signed delta from the first word.
+ *  - Uncompressed: the whole block.
+ * The encoded blocks of each size are kept in a pool of fixed-size slots
+ * that grows a chunk at a time, so host memory grows with the compressed
+ * size of the data instead of the capacity of the cache.
+ *
+ * Blocks are indexed by the cache's entry number. Every block starts out as
+ * all zeros.
+ */
+class SimpleCompressedStore
+{
+  public:
+    /// The encodings a block can be stored with
+    enum Encoding
+    {
+        Zero,
+        Repeated,
+        Base8Delta1,
+        Base8Delta2,
+        Base8Delta4,
+        Base4Delta1,
+        Base4Delta2,
+        Uncompressed,
+        NumEncodings
+    };
+
+  private:
+    /// Where a block is stored
+    struct Block
+    {
+        uint8_t encoding = Zero;
+        /// The block's slot in the pool for its encoding
+        uint32_t slot = 0;
+    };
+
+    /// Fixed-size slots for the blocks of one encoding
+    struct Pool
+    {
+        /// Bytes in each slot. 0 for zero blocks.
+        unsigned slotSize = 0;
+        /// The slot storage, allocated slotsPerChunk slots at a time
+        std::vector<std::unique_ptr<uint8_t[]>> chunks;
+        /// Slots that have been allocated and are free again
+        std::vector<uint32_t> freeSlots;
+        /// Slots handed out from the chunks so far
+        uint32_t usedSlots = 0;
+    };
+
+    /// Number of slots each pool chunk holds
+    static const unsigned slotsPerChunk = 256;
+
+    /// The size of each block (uncompressed)
+    const unsigned blockSize;
+
+    /// Where each block is stored
+    std::vector<Block> blocks;
+
+    /// The pool for each encoding
+    std::vector<Pool> pools;
+
+    /// The base-delta encodings, smallest first
+    std::vector<Encoding> baseDeltaOrder;
+
+    /// Sum of the encoded sizes of every block
+    size_t storedBytes;
+
+    /// Scratch space to encode a block in
+    std::vector<uint8_t> encoded;
+
+    /// @return the bytes of the word size and the delta size of a
+    ///         base-delta encoding
+    static unsigned wordBytes(Encoding encoding);
+    static unsigned deltaBytes(Encoding encoding);
+
+    /// @return the number of bytes a block takes with an encoding
+    unsigned encodedSize(Encoding encoding) const;
+
+    /**
+     * Try to encode a block with a base-delta encoding.
+     *
+     * @param the block's data
+     * @param the base-delta encoding
+     * @param where to put the encoded block
+     * @return true if every word's delta fits
+     */
+    bool encodeBaseDelta(const uint8_t *data, Encoding encoding,
+                         uint8_t *out) const;
+
+    /// @return a pointer to a slot's storage
+    uint8_t *slotData(Encoding encoding, uint32_t slot) const;
+
+    /// @return a free slot in the pool for an encoding
+    uint32_t allocateSlot(Encoding encoding);
+
+  public:
+    /**
+     * @param number of blocks to store
+     * @param the size of each block. Must be a multiple of 8 bytes.
+     */
+    SimpleCompressedStore(unsigned num_blocks, unsigned block_size);
+
+    /**
+     * Compress a block and store it, replacing the block's old data.
+     *
+     * @param the block's index
+     * @param the block's data (blockSize bytes)
+     * @return the encoding that was used
+     */
+    Encoding write(unsigned index, const uint8_t *data);
+
+    /**
+     * Decompress a block.
+     *
+     * @param the block's index
+     * @param where to put the data (blockSize bytes)
+     */
+    void read(unsigned index, uint8_t *data) const;
+
+    /**
+     * Reset a block to all zeros and release its storage.
+     *
+     * @param the block's index
+     */
+    void clear(unsigned index);
+
+    /// @return the sum of the encoded sizes of every block
+    size_t compressedBytes() const { return storedBytes; }
+
+    /// @return the bytes of host memory used by the store
+    size_t hostFootprint() const;
+
+    /// @return a name for an encoding to use in stats
+    static const char *encodingName(Encoding encoding);
+};
+
+#endif // __LEARNING_GEM5_SIMPLE_CACHE_COMPRESSED_STORE_HH__
@@ -0,0 +1,216 @@
+/*
+ * Copyright (c) 2017 Jason Lowe-Power
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ *
+ * Authors: Jason Lowe-Power
+ */
+
+#include "learning_gem5/simple_cache/replacement_policies.hh"
+
+#include "base/intmath.hh"
+#include "base/logging.hh"
+#include "base/random.hh"
+
+SimpleReplacementPolicy *
+SimpleReplacementPolicy::create(const std::string &name, unsigned num_sets,
+                                unsigned assoc)
+{
+    if (name == "random") {
+        return new RandomReplacementPolicy(num_sets, assoc);
+    } else if (name == "lru") {
+        return new LRUReplacementPolicy(num_sets, assoc);
+    } else if (name == "nmru") {
+        return new NMRUReplacementPolicy(num_sets, assoc);
+    } else if (name == "tree_plru") {
+        return new TreePLRUReplacementPolicy(num_sets, assoc);
+    } else if (name == "srrip") {
+        return new SRRIPReplacementPolicy(num_sets, assoc);
+    } else {
+        fatal("Unknown SimpleCache replacement policy '%s'", name);
+    }
+}
+
+unsigned
+RandomReplacementPolicy::getVictim(unsigned set)
+{
+    return random_mt.random<unsigned>(0, assoc - 1);
+}
+
+LRUReplacementPolicy::LRUReplacementPolicy(unsigned num_sets,
+                                           unsigned assoc) :
+    SimpleReplacementPolicy(num_sets, assoc), ranks(num_sets * assoc)
+{
+    fatal_if(assoc > 256, "LRU replacement supports at most 256 ways");
+
+    // Start with an arbitrary (but valid) recency order in every set
+    for (unsigned set = 0; set < numSets; set++) {
+        for (unsigned way = 0; way < assoc; way++) {
+            ranks[set * assoc + way] = way;
+        }
+    }
+}
+
+void
+LRUReplacementPolicy::touch(unsigned set, unsigned way)
+{
+    uint8_t *set_ranks = &ranks[set * assoc];
+    uint8_t old_rank = set_ranks[way];
+
+    // Everything that was more recently used than this way ages by one
+    for (unsigned i = 0; i < assoc; i++) {
+        if (set_ranks[i] < old_rank) {
+            set_ranks[i]++;
+        }
+    }
+    set_ranks[way] = 0;
+}
+
+unsigned
+LRUReplacementPolicy::getVictim(unsigned set)
+{
+    const uint8_t *set_ranks = &ranks[set * assoc];
+    for (unsigned way = 0; way < assoc; way++) {
+        if (set_ranks[way] == assoc - 1) {
+            return way;
+        }
+    }
+    panic("LRU ranks for set %d are corrupted", set);
+}
+
+NMRUReplacementPolicy::NMRUReplacementPolicy(unsigned num_sets,
+                                             unsigned assoc) :
+    SimpleReplacementPolicy(num_sets, assoc), mruWays(num_sets, 0)
+{
+    fatal_if(assoc > 65536, "NMRU replacement supports at most 65536 ways");
+}
+
+void
+NMRUReplacementPolicy::touch(unsigned set, unsigned way)
+{
+    mruWays[set] = way;
+}
+
+unsigned
+NMRUReplacementPolicy::getVictim(unsigned set)
+{
+    if (assoc == 1) {
+        return 0;
+    }
+
+    // Pick a random way out of the assoc - 1 ways that aren't the MRU way
+    unsigned way = random_mt.random<unsigned>(0, assoc - 2);
+    if (way >= mruWays[set]) {
+        way++;
+    }
+    return way;
+}
+
+TreePLRUReplacementPolicy::TreePLRUReplacementPolicy(unsigned num_sets,
+                                                     unsigned assoc) :
+    SimpleReplacementPolicy(num_sets, assoc), levels(floorLog2(assoc)),
+    trees(num_sets, 0)
+{
+    fatal_if(!isPowerOf2(assoc) || assoc > 64,
+             "Tree-PLRU replacement needs a power of two associativity that "
+             "is at most 64");
+}
+
+void
+TreePLRUReplacementPolicy::touch(unsigned set, unsigned way)
+{
+    uint64_t &tree = trees[set];
+
+    // Walk from the root to the leaf for this way. Point each node on the
+    // way down at the other half of its subtree.
+    unsigned node = 1;
+    for (int level = levels - 1; level >= 0; level--) {
+        unsigned right = (way >> level) & 1;
+        if (right) {
+            tree &= ~(1ULL << node);
+        } else {
+            tree |= (1ULL << node);
+        }
+        node = 2 * node + right;
+    }
+}
+
+unsigned
+TreePLRUReplacementPolicy::getVictim(unsigned set)
+{
+    uint64_t tree = trees[set];
+
+    // Follow the bits from the root down to the pseudo-LRU leaf
+    unsigned node = 1;
+    unsigned way = 0;
+    for (unsigned level = 0; level < levels; level++) {
+        unsigned right = (tree >> node) & 1;
+        way = (way << 1) | right;
+        node = 2 * node + right;
+    }
+    return way;
+}
+
+const uint8_t SRRIPReplacementPolicy::maxRRPV;
+
+SRRIPReplacementPolicy::SRRIPReplacementPolicy(unsigned num_sets,
+                                               unsigned assoc) :
+    SimpleReplacementPolicy(num_sets, assoc), rrpvs(num_sets * assoc, maxRRPV)
+{
+}
+
+void
+SRRIPReplacementPolicy::touch(unsigned set, unsigned way)
+{
+    // Predict a near-immediate re-reference on a hit
+    rrpvs[set * assoc + way] = 0;
+}
+
+void
+SRRIPReplacementPolicy::insert(unsigned set, unsigned way)
+{
+    // Predict a long re-reference interval for new blocks
+    rrpvs[set * assoc + way] = maxRRPV - 1;
+}
+
+unsigned
+SRRIPReplacementPolicy::getVictim(unsigned set)
+{
+    uint8_t *set_rrpvs = &rrpvs[set * assoc];
+
+    // Find a way with a distant re-reference. If there isn't one, age every
+    // way in the set and look again. This terminates after at most maxRRPV
+    // rounds.
+    while (true) {
+        for (unsigned way = 0; way < assoc; way++) {
+            if (set_rrpvs[way] == maxRRPV) {
+                return way;
+            }
+        }
+        for (unsigned way = 0; way < assoc; way++) {
+            set_rrpvs[way]++;
+        }
+    }
+}
@@ -0,0 +1,182 @@
+/*
+ * Copyright (c) 2017 Jason Lowe-Power
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ *
+ * Authors: Jason Lowe-Power
+ */
+
+#ifndef __LEARNING_GEM5_SIMPLE_CACHE_REPLACEMENT_POLICIES_HH__
+#define __LEARNING_GEM5_SIMPLE_CACHE_REPLACEMENT_POLICIES_HH__
+
+#include <cstdint>
+#include <string>
+#include <vector>
+
+/**
+ * Interface for the replacement policies of the SimpleCache. A policy only
+ * deals with ways within a set. The cache always fills invalid ways first,
+ * so a policy is only asked for a victim when every way in the set is valid.
+ * Each policy keeps a few bits of metadata per way (or per set) in flat
+ * arrays, just like the cache's tag array.
+ */
+class SimpleReplacementPolicy
+{
+  protected:
+    /// Number of sets in the cache
+    const unsigned numSets;
+
+    /// Number of ways in each set
+    const unsigned assoc;
+
+  public:
+    SimpleReplacementPolicy(unsigned num_sets, unsigned assoc) :
+        numSets(num_sets), assoc(assoc)
+    { }
+
+    virtual ~SimpleReplacementPolicy() { }
+
+    /**
+     * Update the metadata on a hit to a way.
+     */
+    virtual void touch(unsigned set, unsigned way) = 0;
+
+    /**
+     * Update the metadata when a new block is inserted into a way. By
+     * default this is the same as a hit.
+     */
+    virtual void insert(unsigned set, unsigned way) { touch(set, way); }
+
+    /**
+     * Choose a way to evict from a full set.
+     *
+     * @return the way to replace
+     */
+    virtual unsigned getVictim(unsigned set) = 0;
+
+    /**
+     * Create a replacement policy by name. Calls fatal() if the name is not
+     * known.
+     *
+     * @param one of random, lru, nmru, tree_plru, or srrip
+     */
+    static SimpleReplacementPolicy *create(const std::string &name,
+                                           unsigned num_sets, unsigned assoc);
+};
+
+/**
+ * Evict a random way. Has no metadata at all.
+ */
+class RandomReplacementPolicy : public SimpleReplacementPolicy
+{
+  public:
+    RandomReplacementPolicy(unsigned num_sets, unsigned assoc) :
+        SimpleReplacementPolicy(num_sets, assoc)
+    { }
+
+    void touch(unsigned set, unsigned way) override { }
+    unsigned getVictim(unsigned set) override;
+};
+
+/**
+ * True least recently used. Keeps a small recency rank for every way
+ * (0 is the most recently used and assoc - 1 is the least recently used).
+ */
+class LRUReplacementPolicy : public SimpleReplacementPolicy
+{
+  private:
+    /// Recency rank of each way, indexed by set * assoc + way
+    std::vector<uint8_t> ranks;
+
+  public:
+    LRUReplacementPolicy(unsigned num_sets, unsigned assoc);
+
+    void touch(unsigned set, unsigned way) override;
+    unsigned getVictim(unsigned set) override;
+};
+
+/**
+ * Not most recently used. Only remembers the MRU way of each set and
+ * evicts a random way other than that one. This is the same policy as the
+ * NMRU tags in _static/patches/nmru-tags.
+ */
+class NMRUReplacementPolicy : public SimpleReplacementPolicy
+{
+  private:
+    /// The most recently used way of each set
+    std::vector<uint16_t> mruWays;
+
+  public:
+    NMRUReplacementPolicy(unsigned num_sets, unsigned assoc);
+
+    void touch(unsigned set, unsigned way) override;
+    unsigned getVictim(unsigned set) override;
+};
+
+/**
+ * Tree pseudo-LRU. Keeps a binary tree of assoc - 1 bits for each set. Each
+ * bit points towards the half of its subtree that was used less recently.
+ * The associativity must be a power of two and at most 64.
+ */
+class TreePLRUReplacementPolicy : public SimpleReplacementPolicy
+{
+  private:
+    /// Number of levels in the tree (log2 of the associativity)
+    const unsigned levels;
+
+    /// The tree of each set. Node n's bit is bit n (the root is node 1)
+    std::vector<uint64_t> trees;
+
+  public:
+    TreePLRUReplacementPolicy(unsigned num_sets, unsigned assoc);
+
+    void touch(unsigned set, unsigned way) override;
+    unsigned getVictim(unsigned set) override;
+};
+
+/**
+ * Static re-reference interval prediction (Jaleel et al., ISCA 2010) with a
+ * 2-bit re-reference prediction value (RRPV) per way. New blocks are
+ * inserted with a long re-reference interval so that blocks that are never
+ * reused are evicted quickly.
+ */
+class SRRIPReplacementPolicy : public SimpleReplacementPolicy
+{
+  private:
+    /// The largest RRPV (a distant re-reference)
+    static const uint8_t maxRRPV = 3;
+
+    /// The RRPV of each way, indexed by set * assoc + way
+    std::vector<uint8_t> rrpvs;
+
+  public:
+    SRRIPReplacementPolicy(unsigned num_sets, unsigned assoc);
+
+    void touch(unsigned set, unsigned way) override;
+    void insert(unsigned set, unsigned way) override;
+    unsigned getVictim(unsigned set) override;
+};
+
+#endif // __LEARNING_GEM5_SIMPLE_CACHE_REPLACEMENT_POLICIES_HH__
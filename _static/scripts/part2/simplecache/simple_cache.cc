@@ -30,25 +30,173 @@
 
 #include "learning_gem5/simple_cache/simple_cache.hh"
 
-#include "base/random.hh"
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <cstring>
+#include <fstream>
+
+#include "base/bitfield.hh"
+#include "base/intmath.hh"
+#include "debug/Drain.hh"
 #include "debug/SimpleCache.hh"
+#include "sim/serialize.hh"
 #include "sim/system.hh"
 
+const uint32_t SimpleCache::checkpointMagic;
+const uint32_t SimpleCache::checkpointVersion;
+
 SimpleCache::SimpleCache(SimpleCacheParams *params) :
     MemObject(params),
+    system(params->system),
     latency(params->latency),
     blockSize(params->system->cacheLineSize()),
     capacity(params->size / blockSize),
+    assoc(params->assoc),
+    numSets(assoc ? capacity / assoc : 0),
+    setShift(floorLog2(blockSize)),
+    setMask(numSets - 1),
+    tagShift(setShift + (numSets ? floorLog2(numSets) : 0)),
+    numSectors(params->sectors),
+    sectorSize(numSectors ? blockSize / numSectors : 0),
+    allSectors(sectorRange(0, numSectors)),
     memPort(params->name + ".mem_side", this),
-    blocked(false), outstandingPacket(nullptr), waitingPortId(-1)
+    arbitrateEvent([this]{ arbitrate(); }, name() + ".arbitrateEvent"),
+    nextPort(0), nextGrantTick(0),
+    numBanks(params->banks), bankBusyUntil(numBanks, 0),
+    pendingAccesses(0),
+    numMSHRs(params->mshrs), tgtsPerMSHR(params->tgts_per_mshr),
+    mshrs(numMSHRs), allocatedMSHRs(0),
+    numWriteBuffers(params->write_buffers), needRespRetry(false),
+    outstandingWrites(0),
+    writeThrough(params->write_policy == "writethrough"),
+    writeAllocate(params->write_allocate),
+    writeCombineLatency(params->write_combine_latency),
+    writeCombineEvent([this]{ closeWriteCombining(); },
+                      name() + ".writeCombineEvent"),
+    victimBuffer(params->victim_entries), victimSequence(0),
+    prefetchQueueSize(4 * params->prefetch_degree),
+    warmTagsOnly(params->warm_tags_only), warming(false),
+    // The snoop filter needs to hear about every block we drop
+    sendCleanEvicts(params->clean_evict || params->coherent),
+    coherent(params->coherent),
+    snoopRespEvent([this]{ sendSnoopResponses(); },
+                   name() + ".snoopRespEvent"),
+    requestPoolNext(0)
 {
+    fatal_if(assoc == 0 || capacity % assoc != 0,
+             "SimpleCache size must be a multiple of assoc * block size");
+    fatal_if(!isPowerOf2(numSets), "SimpleCache must have a power of two "
+             "number of sets (got %d)", numSets);
+
+    fatal_if(!isPowerOf2(numSectors) || numSectors > 64 ||
+             numSectors > blockSize, "SimpleCache sectors must be a power of "
+             "two no larger than 64 or the block size (got %d)", numSectors);
+
+    tags.resize(capacity, 0);
+    valid.resize(capacity, 0);
+    sectorValid.resize(capacity, 0);
+    sectorDirty.resize(capacity, 0);
+    writable.resize(capacity, 0);
+    frames.resize(capacity, -1);
+
+    // Allocate all of the data storage at once. Blocks are handed out from
+    // the free list (lowest frame first) as they are inserted. Compressed
+    // blocks are allocated as they are written instead.
+    if (params->compressed) {
+        compressedStore.reset(new SimpleCompressedStore(capacity,
+                                                        blockSize));
+        blockScratch.resize(blockSize);
+    } else {
+        dataArena.resize(capacity * blockSize);
+    }
+    freeFrames.reserve(capacity);
+    for (int frame = capacity - 1; frame >= 0; frame--) {
+        freeFrames.push_back(frame);
+    }
+
+    replPolicy.reset(SimpleReplacementPolicy::create(
+        params->replacement_policy, numSets, assoc));
+
+    prefetched.resize(capacity, 0);
+    if (params->prefetcher != "none") {
+        prefetcher.reset(new SimplePrefetcher(params->prefetcher, blockSize,
+                                              params->prefetch_degree,
+                                              params->stride_table_entries));
+    }
+
+    fatal_if(numMSHRs == 0, "SimpleCache needs at least one MSHR");
+    fatal_if(tgtsPerMSHR == 0, "SimpleCache needs at least one target per "
+             "MSHR");
+    fatal_if(numWriteBuffers == 0, "SimpleCache needs at least one write "
+             "buffer");
+    fatal_if(!writeThrough && params->write_policy != "writeback",
+             "Unknown SimpleCache write policy %s", params->write_policy);
+    // A fill can need one entry for the victim and one for its targets'
+    // writes.
+    fatal_if(writeThrough && numWriteBuffers < 2, "SimpleCache needs at "
+             "least two write buffers for write-through");
+    fatal_if(!isPowerOf2(numBanks) || numBanks > numSets, "SimpleCache "
+             "banks must be a power of two no larger than the number of "
+             "sets (got %d)", numBanks);
+    fatal_if(params->port_queue_depth == 0, "SimpleCache needs room for at "
+             "least one request per port");
+    fatal_if(coherent && (numSectors != 1 || writeThrough || !writeAllocate ||
+                          warmTagsOnly || !victimBuffer.empty()),
+             "A coherent SimpleCache doesn't support sectors, write-through, "
+             "write-no-allocate, tag-only warming or a victim buffer");
+
+    for (auto& victim : victimBuffer) {
+        victim.data.resize(blockSize);
+    }
+    victimSwap.resize(victimBuffer.empty() ? 0 : blockSize);
+
+    // Reserve space for the targets up front so that merging secondary
+    // misses never allocates.
+    for (auto& mshr : mshrs) {
+        mshr.targets.reserve(tgtsPerMSHR);
+        mshr.data.resize(blockSize);
+    }
+    completedTargets.reserve(tgtsPerMSHR);
+
+    // Enough requests for every MSHR and writeback to have one outstanding,
+    // with some slack for split accesses.
+    requestPool.resize(2 * (numMSHRs + numWriteBuffers));
+
     // Since the CPU side ports are a vector of ports, create an instance of
     // the CPUSidePort for each connection. This member of params is
     // automatically created depending on the name of the vector port and
     // holds the number of connections to this port name
     for (int i = 0; i < params->port_cpu_side_connection_count; ++i) {
-        cpuPorts.emplace_back(name() + csprintf(".cpu_side[%d]", i), i, this);
+        cpuPorts.emplace_back(name() + csprintf(".cpu_side[%d]", i), i, this,
+                              params->port_queue_depth);
+    }
+}
+
+SimpleCache::~SimpleCache()
+{
+    // Pooled events may still be scheduled if the simulation ended with
+    // accesses in flight. An event can't be destroyed while scheduled.
+    for (auto &event : accessEvents) {
+        if (event->scheduled()) {
+            deschedule(event.get());
+        }
+    }
+    freeAccessEvents.clear();
+    accessEvents.clear();
+
+    // Pooled requests are shared, so anyone still holding one keeps it.
+    requestPool.clear();
+
+    // The packets in this storage have already been destroyed, so only
+    // the raw storage is left to release.
+    for (auto storage : freePackets) {
+        ::operator delete(storage);
     }
+    freePackets.clear();
 }
 
 Port&
@@ -69,15 +217,20 @@ SimpleCache::getPort(const std::string& if_name, PortID idx)
 void
 SimpleCache::CPUSidePort::sendPacket(PacketPtr pkt)
 {
-    // Note: This flow control is very simple since the cache is blocking.
-
-    panic_if(blockedPacket != nullptr, "Should never try to send if blocked!");
+    // Since the cache is non-blocking there may be more than one response
+    // waiting for this port. Keep them in order behind any blocked packets.
+    if (!blockedPackets.empty()) {
+        DPRINTF(SimpleCache, "Queueing %s behind blocked response\n",
+                pkt->print());
+        blockedPackets.push_back(pkt);
+        return;
+    }
 
     // If we can't send the packet across the port, store it for later.
     DPRINTF(SimpleCache, "Sending %s to CPU\n", pkt->print());
     if (!sendTimingResp(pkt)) {
         DPRINTF(SimpleCache, "failed!\n");
-        blockedPacket = pkt;
+        blockedPackets.push_back(pkt);
     }
 }
 
@@ -87,17 +240,36 @@ SimpleCache::CPUSidePort::getAddrRanges() const
     return owner->getAddrRanges();
 }
 
+SimpleCache::CPUSidePort::QueuedRequest
+SimpleCache::CPUSidePort::popRequest()
+{
+    assert(!requestQueue.empty());
+    QueuedRequest req = requestQueue.front();
+    requestQueue.pop_front();
+
+    // There is room for the request we turned away now
+    trySendRetry();
+
+    return req;
+}
+
 void
 SimpleCache::CPUSidePort::trySendRetry()
 {
-    if (needRetry && blockedPacket == nullptr) {
-        // Only send a retry if the port is now completely free
+    if (needRetry && requestQueue.size() < queueDepth) {
         needRetry = false;
         DPRINTF(SimpleCache, "Sending retry req.\n");
         sendRetryReq();
     }
 }
 
+Tick
+SimpleCache::CPUSidePort::recvAtomic(PacketPtr pkt)
+{
+    // Just forward to the cache.
+    return owner->handleAtomic(pkt);
+}
+
 void
 SimpleCache::CPUSidePort::recvFunctional(PacketPtr pkt)
 {
@@ -110,53 +282,86 @@ SimpleCache::CPUSidePort::recvTimingReq(PacketPtr pkt)
 {
     DPRINTF(SimpleCache, "Got request %s\n", pkt->print());
 
-    if (blockedPacket || needRetry) {
-        // The cache may not be able to send a reply if this is blocked
-        DPRINTF(SimpleCache, "Request blocked\n");
-        needRetry = true;
-        return false;
-    }
-    // Just forward to the cache.
-    if (!owner->handleRequest(pkt, id)) {
-        DPRINTF(SimpleCache, "Request failed\n");
-        // stalling
+    if (requestQueue.size() >= queueDepth) {
+        // No room. We'll send a retry when the arbiter takes a request.
+        DPRINTF(SimpleCache, "Request queue full\n");
         needRetry = true;
+        owner->portRetries[id]++;
         return false;
-    } else {
-        DPRINTF(SimpleCache, "Request succeeded\n");
-        return true;
     }
+
+    // Wait for the arbiter to pick this request.
+    DPRINTF(SimpleCache, "Request queued\n");
+    requestQueue.push_back({pkt, curTick()});
+    owner->scheduleArbitration();
+    return true;
 }
 
 void
 SimpleCache::CPUSidePort::recvRespRetry()
 {
     // We should have a blocked packet if this function is called.
-    assert(blockedPacket != nullptr);
-
-    // Grab the blocked packet.
-    PacketPtr pkt = blockedPacket;
-    blockedPacket = nullptr;
-
-    DPRINTF(SimpleCache, "Retrying response pkt %s\n", pkt->print());
-    // Try to resend it. It's possible that it fails again.
-    sendPacket(pkt);
+    assert(!blockedPackets.empty());
+
+    // Send as many of the blocked packets as the peer will take.
+    while (!blockedPackets.empty()) {
+        PacketPtr pkt = blockedPackets.front();
+        DPRINTF(SimpleCache, "Retrying response pkt %s\n", pkt->print());
+        if (!sendTimingResp(pkt)) {
+            // Still blocked. Wait for the next retry.
+            return;
+        }
+        blockedPackets.pop_front();
+    }
 
-    // We may now be able to accept new packets
-    trySendRetry();
+    owner->checkDrain();
 }
 
 void
 SimpleCache::MemSidePort::sendPacket(PacketPtr pkt)
 {
-    // Note: This flow control is very simple since the cache is blocking.
-
-    panic_if(blockedPacket != nullptr, "Should never try to send if blocked!");
+    // There may be multiple misses outstanding, so keep the packets in order
+    // behind any that are already blocked.
+    if (isBlocked()) {
+        blockedPackets.push_back(pkt);
+        return;
+    }
 
     // If we can't send the packet across the port, store it for later.
     if (!sendTimingReq(pkt)) {
-        blockedPacket = pkt;
+        needRetry = true;
+        blockedPackets.push_back(pkt);
+        return;
+    }
+    owner->requestSent(pkt);
+}
+
+void
+SimpleCache::MemSidePort::sendSnoopResp(PacketPtr pkt)
+{
+    // Keep the responses in order behind any that are blocked
+    if (!blockedSnoopResps.empty() || !sendTimingSnoopResp(pkt)) {
+        blockedSnoopResps.push_back(pkt);
+    }
+}
+
+PacketPtr
+SimpleCache::MemSidePort::findBlockedEviction(Addr block_addr) const
+{
+    for (auto pkt : blockedPackets) {
+        if (pkt->isEviction() && pkt->getAddr() == block_addr) {
+            return pkt;
+        }
     }
+    return nullptr;
+}
+
+void
+SimpleCache::MemSidePort::removeBlocked(PacketPtr pkt)
+{
+    auto it = std::find(blockedPackets.begin(), blockedPackets.end(), pkt);
+    assert(it != blockedPackets.end());
+    blockedPackets.erase(it);
 }
 
 bool
@@ -169,15 +374,71 @@ SimpleCache::MemSidePort::recvTimingResp(PacketPtr pkt)
 void
 SimpleCache::MemSidePort::recvReqRetry()
 {
-    // We should have a blocked packet if this function is called.
-    assert(blockedPacket != nullptr);
+    // Send as many of the blocked packets as the peer will take. A snoop
+    // may have removed the one that was refused, so there may be none.
+    needRetry = false;
+    while (!blockedPackets.empty()) {
+        PacketPtr pkt = blockedPackets.front();
+        if (!sendTimingReq(pkt)) {
+            // Still blocked. Wait for the next retry.
+            needRetry = true;
+            return;
+        }
+        blockedPackets.pop_front();
+        owner->requestSent(pkt);
+    }
+
+    // The port is free again, so the write buffer can make progress. That
+    // may make room for writes that stalled. Then any spare bandwidth can go
+    // to prefetches.
+    owner->drainWriteBuffer();
+    owner->retryStalledAccesses();
+    owner->scheduleArbitration();
+    owner->issuePrefetches();
+    owner->checkDrain();
+}
+
+void
+SimpleCache::MemSidePort::recvTimingSnoopReq(PacketPtr pkt)
+{
+    // Just forward to the cache.
+    owner->handleSnoop(pkt, true);
+}
+
+Tick
+SimpleCache::MemSidePort::recvAtomicSnoop(PacketPtr pkt)
+{
+    // Just forward to the cache.
+    owner->handleSnoop(pkt, false);
+    return owner->cyclesToTicks(owner->latency);
+}
+
+void
+SimpleCache::MemSidePort::recvFunctionalSnoop(PacketPtr pkt)
+{
+    // Just forward to the cache.
+    owner->handleFunctionalSnoop(pkt);
+}
+
+void
+SimpleCache::MemSidePort::recvRetrySnoopResp()
+{
+    // Send as many of the blocked responses as the peer will take.
+    while (!blockedSnoopResps.empty()) {
+        if (!sendTimingSnoopResp(blockedSnoopResps.front())) {
+            // Still blocked. Wait for the next retry.
+            return;
+        }
+        blockedSnoopResps.pop_front();
+    }
 
-    // Grab the blocked packet.
-    PacketPtr pkt = blockedPacket;
-    blockedPacket = nullptr;
+    owner->checkDrain();
+}
 
-    // Try to resend it. It's possible that it fails again.
-    sendPacket(pkt);
+bool
+SimpleCache::MemSidePort::isSnooping() const
+{
+    return owner->coherent;
 }
 
 void
@@ -186,253 +447,2058 @@ SimpleCache::MemSidePort::recvRangeChange()
     owner->sendRangeChange();
 }
 
-bool
-SimpleCache::handleRequest(PacketPtr pkt, int port_id)
+void
+SimpleCache::scheduleArbitration()
 {
-    if (blocked) {
-        // There is currently an outstanding request so we can't respond. Stall
-        return false;
+    if (arbitrateEvent.scheduled() || isBlocked()) {
+        // If we're blocked, the arbiter is restarted when an MSHR frees up
+        return;
     }
 
-    DPRINTF(SimpleCache, "Got request for addr %#x\n", pkt->getAddr());
+    for (auto& port : cpuPorts) {
+        if (port.hasRequest()) {
+            schedule(arbitrateEvent, std::max(clockEdge(), nextGrantTick));
+            return;
+        }
+    }
+}
+
+void
+SimpleCache::arbitrate()
+{
+    if (isBlocked()) {
+        // All of the MSHRs are in use (or there are misses waiting for one)
+        // so we can't take any more requests. The requests wait in the port
+        // queues.
+        return;
+    }
+
+    // Update the arbiter before popping any requests. Popping may send a
+    // retry and the new request shouldn't be considered until next cycle.
+    nextGrantTick = clockEdge(Cycles(1));
 
-    // This cache is now blocked waiting for the response to this packet.
-    blocked = true;
+    bool granted = false;
+    unsigned first_port = nextPort;
+    for (unsigned i = 0; i < cpuPorts.size(); i++) {
+        unsigned port_id = (first_port + i) % cpuPorts.size();
+        if (!cpuPorts[port_id].hasRequest()) {
+            continue;
+        }
+        if (isBlocked()) {
+            // A granted miss may have used the last MSHR
+            break;
+        }
 
-    // Store the port for when we get the response
-    assert(waitingPortId == -1);
-    waitingPortId = port_id;
+        // An access that crosses blocks needs the bank of each block
+        PacketPtr pkt = cpuPorts[port_id].peekRequest().pkt;
+        Addr first_block = pkt->getBlockAddr(blockSize);
+        Addr last_block = roundDown(pkt->getAddr() + pkt->getSize() - 1,
+                                    blockSize);
+        bool conflict = false;
+        for (Addr block = first_block; block <= last_block;
+             block += blockSize) {
+            unsigned bank = extractBank(block);
+            if (bankBusyUntil[bank] > curTick()) {
+                // Another port already has this bank this cycle. The
+                // request waits, but later ports may still use other banks.
+                DPRINTF(SimpleCache, "Bank %d conflict for port %d\n", bank,
+                        port_id);
+                bankConflicts[bank]++;
+                conflict = true;
+                break;
+            }
+        }
+        if (conflict) {
+            continue;
+        }
+        for (Addr block = first_block; block <= last_block;
+             block += blockSize) {
+            unsigned bank = extractBank(block);
+            bankBusyUntil[bank] = nextGrantTick;
+            bankAccesses[bank]++;
+        }
 
-    // Schedule an event after cache access latency to actually access
-    schedule(new AccessEvent(this, pkt), clockEdge(latency));
+        // The port after the first one granted goes first next time
+        if (!granted) {
+            nextPort = (port_id + 1) % cpuPorts.size();
+            granted = true;
+        }
 
-    return true;
+        CPUSidePort::QueuedRequest req = cpuPorts[port_id].popRequest();
+        portServed[port_id]++;
+        portQueueTicks[port_id] += curTick() - req.arrival;
+        handleRequest(req.pkt, port_id);
+    }
+
+    scheduleArbitration();
+}
+
+void
+SimpleCache::handleRequest(PacketPtr pkt, int port_id)
+{
+    DPRINTF(SimpleCache, "Got request for addr %#x\n", pkt->getAddr());
+
+    if (spansBlocks(pkt)) {
+        // Access each of the blocks separately. They can all miss (and be
+        // outstanding) at the same time. The response is sent once the last
+        // piece completes.
+        std::vector<PacketPtr> pieces = splitPacket(pkt);
+        DPRINTF(SimpleCache, "Splitting into %d accesses\n", pieces.size());
+        splitAccesses++;
+
+        SplitState *split = new SplitState(pkt, port_id, pieces.size());
+        for (auto piece : pieces) {
+            piece->senderState = split;
+            pendingAccesses++;
+            schedule(allocAccessEvent(piece, port_id),
+                     clockEdge(latency));
+        }
+        return;
+    }
+
+    // Schedule an event after cache access latency to actually access.
+    // Any number of requests can be in this pipeline at once.
+    pendingAccesses++;
+    schedule(allocAccessEvent(pkt, port_id), clockEdge(latency));
 }
 
 bool
 SimpleCache::handleResponse(PacketPtr pkt)
 {
-    assert(blocked);
     DPRINTF(SimpleCache, "Got response for addr %#x\n", pkt->getAddr());
 
+    if (pkt->cmd == MemCmd::WriteResp) {
+        // The response for a partial writeback or buffered stores. Nothing
+        // is waiting on it.
+        assert(outstandingWrites > 0);
+        outstandingWrites--;
+        freePacket(pkt);
+        checkDrain();
+        return true;
+    }
+
+    Addr block_addr = pkt->getBlockAddr(blockSize);
+    MSHR *mshr = findMSHR(block_addr);
+    panic_if(!mshr, "Got a response for %#x without an MSHR", pkt->getAddr());
+
+    // Inserting this block may need to evict another one. With
+    // write-through, the targets' writes go in the write buffer too.
+    if (writeBuffer.size() + (writeThrough ? 2 : 1) > numWriteBuffers) {
+        // There is no room. Make memory try again when there is.
+        DPRINTF(SimpleCache, "Write buffer full. Refusing response\n");
+        writeBufferFullStalls++;
+        needRespRetry = true;
+        return false;
+    }
+
     // For now assume that inserts are off of the critical path and don't count
     // for any added latency.
-    insert(pkt);
+    // If nothing is waiting on a prefetch, mark the block so we can tell
+    // whether the prefetch was useful.
+    bool unused_prefetch = mshr->isPrefetch && mshr->targets.empty();
+    WriteBufferEntry writeback = insert(pkt, mshr->fetchSectors,
+                                        unused_prefetch);
+    if (writeback.pkt) {
+        // Queue the write for memory
+        pushWriteBuffer(std::move(writeback));
+    }
+
+    missLatency.sample(curTick() - mshr->allocTime);
+
+    // Requests from other caches that were ordered after our fill may have
+    // taken the block from us. The targets still get to use the data.
+    bool post_invalidate = mshr->postInvalidate ||
+                           pkt->cmd == MemCmd::ReadRespWithInvalidate;
+    bool post_downgrade = mshr->postDowngrade;
+    if (coherent && !mshr->pendingModified &&
+        (post_invalidate || post_downgrade)) {
+        // We aren't the owner, so we can't write the block in the meantime
+        writable[findBlock(block_addr)] = 0;
+    }
+    completedSnoops.swap(mshr->deferredSnoops);
+
+    // The fill packet was created by this cache. We're done with it now.
+    freePacket(pkt);
+
+    // Free the MSHR before responding to the targets. We need to free the
+    // resource before sending the packets in case the CPU tries to send
+    // another request immediately (e.g., in the same callchain).
+    freeMSHR(mshr);
+
+    // Now we can functionally deal with every target. Without sectors they
+    // all hit. With sectors, a target may need sectors that weren't fetched
+    // and it misses again. In coherent mode, a write misses again if we
+    // didn't get a writable copy. The targets after it miss as well so that
+    // they stay in order. Take the targets out of the MSHR first since the
+    // new miss may reuse it.
+    completedTargets.swap(mshr->targets);
+    bool rerun = false;
+    for (auto& target : completedTargets) {
+        if (!rerun && accessFunctional(target.pkt)) {
+            DPRINTF(SimpleCache, "Copying data from fill to %s\n",
+                    target.pkt->print());
+            sendWriteThrough(target.pkt);
+            target.pkt->makeResponse();
+            sendResponse(target.pkt, target.portId);
+            continue;
+        }
+
+        panic_if(numSectors == 1 && !coherent,
+                 "Should always hit after inserting");
+        DPRINTF(SimpleCache, "%s misses again\n", target.pkt->print());
+        rerun = true;
+        if (!stalledAccesses.empty() ||
+            !handleMiss(target.pkt, target.portId)) {
+            mshrStalls++;
+            stalledAccesses.push_back(target);
+        }
+    }
+    completedTargets.clear();
+
+    // Now answer the snoops that were waiting for the data
+    for (auto snoop : completedSnoops) {
+        respondDeferredSnoop(snoop);
+    }
+    completedSnoops.clear();
+    int entry = findBlock(block_addr);
+    if (entry != -1 && post_invalidate) {
+        snoopInvalidations++;
+        invalidateBlock(entry);
+    } else if (entry != -1 && post_downgrade) {
+        writable[entry] = 0;
+    }
+
+    // There is at least one free MSHR now, so some stalled misses may be
+    // able to make progress.
+    retryStalledAccesses();
 
-    missLatency.sample(curTick() - missTime);
+    // The cache may be unblocked now, so restart the arbiter. Ports get a
+    // retry as the arbiter makes room in their queues.
+    scheduleArbitration();
 
-    if (outstandingPacket != nullptr) {
-        DPRINTF(SimpleCache, "Copying data from new packet to old\n");
-        // We had to upgrade a previous packet. We can functionally deal with
-        // the cache access now. It better be a hit.
-        bool hit M5_VAR_USED = accessFunctional(outstandingPacket);
-        panic_if(!hit, "Should always hit after inserting");
-        outstandingPacket->makeResponse();
-        delete pkt; // We may need to delay this, I'm not sure.
-        pkt = outstandingPacket;
-        outstandingPacket = nullptr;
-    } // else, pkt contains the data it needs
+    // The MSHR may be used for a prefetch if nothing else needs it
+    issuePrefetches();
 
-    sendResponse(pkt);
+    checkDrain();
 
     return true;
 }
 
-void SimpleCache::sendResponse(PacketPtr pkt)
+void SimpleCache::sendResponse(PacketPtr pkt, int port_id)
 {
-    assert(blocked);
-    DPRINTF(SimpleCache, "Sending resp for addr %#x\n", pkt->getAddr());
-
-    int port = waitingPortId;
+    SplitState *split = dynamic_cast<SplitState*>(pkt->senderState);
+    if (split) {
+        // This is one piece of a request that spans multiple blocks. The
+        // piece's data pointed into the original packet, so there's nothing
+        // to copy back.
+        freePacket(pkt);
+        assert(split->outstanding > 0);
+        if (--split->outstanding > 0) {
+            return;
+        }
 
-    // The packet is now done. We're about to put it in the port, no need for
-    // this object to continue to stall.
-    // We need to free the resource before sending the packet in case the CPU
-    // tries to send another request immediately (e.g., in the same callchain).
-    blocked = false;
-    waitingPortId = -1;
+        pkt = split->parent;
+        port_id = split->portId;
+        delete split;
+        pkt->makeResponse();
+    }
 
-    // Simply forward to the memory port
-    cpuPorts[port].sendPacket(pkt);
+    DPRINTF(SimpleCache, "Sending resp for addr %#x\n", pkt->getAddr());
 
-    // For each of the cpu ports, if it needs to send a retry, it should do it
-    // now since this memory object may be unblocked now.
-    for (auto& port : cpuPorts) {
-        port.trySendRetry();
-    }
+    // Simply forward to the right cpu-side port
+    cpuPorts[port_id].sendPacket(pkt);
 }
 
 void
 SimpleCache::handleFunctional(PacketPtr pkt)
 {
-    if (accessFunctional(pkt)) {
+    if (spansBlocks(pkt)) {
+        for (auto piece : splitPacket(pkt)) {
+            handleFunctional(piece);
+            freePacket(piece);
+        }
+        if (pkt->needsResponse()) {
+            pkt->makeResponse();
+        }
+        return;
+    }
+
+    // With write-through, memory must always see the write as well. In
+    // coherent mode, so must the other caches.
+    if (!((writeThrough || coherent) && pkt->isWrite()) &&
+        accessFunctional(pkt, false)) {
         pkt->makeResponse();
+        return;
+    }
+
+    // The cache has none (or only some sectors) of the data. Evicted blocks
+    // and stores in the write buffer are newer than memory and the cache is
+    // newer than both.
+    Addr block_addr = pkt->getBlockAddr(blockSize);
+    int entry = findBlock(block_addr);
+    std::vector<bool> valid_bytes;
+    if (entry != -1) {
+        sectorsToBytes(sectorValid[entry], valid_bytes);
+    }
+    VictimEntry *victim = findVictimEntry(block_addr);
+    std::vector<bool> victim_bytes;
+    if (victim) {
+        sectorsToBytes(victim->sectorValid, victim_bytes);
+    }
+    if (pkt->isWrite()) {
+        // Update every copy
+        for (auto& wb : writeBuffer) {
+            if (wb.pkt->getAddr() == block_addr && wb.pkt->hasData()) {
+                functionalOverlay(pkt, block_addr, wb.dirtyBytes,
+                                  wb.pkt->getPtr<uint8_t>());
+            }
+        }
+        if (victim) {
+            functionalOverlay(pkt, block_addr, victim_bytes,
+                              victim->data.data());
+        }
+        if (entry != -1) {
+            functionalOverlay(pkt, block_addr, valid_bytes,
+                              getBlockData(entry));
+            blockWritten(entry);
+        }
+        memPort.sendFunctional(pkt);
     } else {
+        // Start with memory's data and put the newer data on top of it
         memPort.sendFunctional(pkt);
+        for (auto& wb : writeBuffer) {
+            if (wb.pkt->getAddr() == block_addr && wb.pkt->hasData()) {
+                functionalOverlay(pkt, block_addr, wb.dirtyBytes,
+                                  wb.pkt->getPtr<uint8_t>());
+            }
+        }
+        if (victim) {
+            functionalOverlay(pkt, block_addr, victim_bytes,
+                              victim->data.data());
+        }
+        if (entry != -1) {
+            functionalOverlay(pkt, block_addr, valid_bytes,
+                              getBlockData(entry));
+        }
     }
 }
 
-void
-SimpleCache::accessTiming(PacketPtr pkt)
+Tick
+SimpleCache::handleAtomic(PacketPtr pkt)
 {
-    bool hit = accessFunctional(pkt);
+    if (spansBlocks(pkt)) {
+        // Access each block separately. The pieces would proceed in parallel
+        // in timing mode, so the latency is the longest of them.
+        splitAccesses++;
+        Tick max_latency = 0;
+        for (auto piece : splitPacket(pkt)) {
+            max_latency = std::max(max_latency, handleAtomic(piece));
+            freePacket(piece);
+        }
+        if (pkt->needsResponse()) {
+            pkt->makeResponse();
+        }
+        return max_latency;
+    }
 
-    DPRINTF(SimpleCache, "%s for packet: %s\n", hit ? "Hit" : "Miss",
-            pkt->print());
+    if (warming) {
+        return handleAtomicWarming(pkt);
+    }
 
-    if (hit) {
-        // Respond to the CPU side
-        hits++; // update stats
-        DDUMP(SimpleCache, pkt->getConstPtr<uint8_t>(), pkt->getSize());
-        pkt->makeResponse();
-        sendResponse(pkt);
-    } else {
-        misses++; // update stats
-        missTime = curTick();
-        // Forward to the memory side.
-        // We can't directly forward the packet unless it is exactly the size
-        // of the cache line, and aligned. Check for that here.
-        Addr addr = pkt->getAddr();
-        Addr block_addr = pkt->getBlockAddr(blockSize);
-        unsigned size = pkt->getSize();
-        if (addr == block_addr && size == blockSize) {
-            // Aligned and block size. We can just forward.
-            DPRINTF(SimpleCache, "forwarding packet\n");
-            memPort.sendPacket(pkt);
-        } else {
-            DPRINTF(SimpleCache, "Upgrading packet to block size\n");
-            panic_if(addr - block_addr + size > blockSize,
-                     "Cannot handle accesses that span multiple cache lines");
-            // Unaligned access to one cache block
-            assert(pkt->needsResponse());
-            MemCmd cmd;
-            if (pkt->isWrite() || pkt->isRead()) {
-                // Read the data from memory to write into the block.
-                // We'll write the data in the cache (i.e., a writeback cache)
-                cmd = MemCmd::ReadReq;
-            } else {
-                panic("Unknown packet type in upgrade size");
-            }
+    Tick access_latency = cyclesToTicks(latency);
 
-            // Create a new packet that is blockSize
-            PacketPtr new_pkt = new Packet(pkt->req, cmd, blockSize);
-            new_pkt->allocate();
+    accessVictimBuffer(pkt->getAddr());
+    if (accessFunctional(pkt)) {
+        DPRINTF(SimpleCache, "Atomic hit for packet: %s\n", pkt->print());
+        hits++;
+        respondAtomic(pkt);
+        return access_latency;
+    }
 
-            // Should now be block aligned
-            assert(new_pkt->getAddr() == new_pkt->getBlockAddr(blockSize));
+    if (allocateForWrite(pkt, true)) {
+        DPRINTF(SimpleCache, "Atomic write without fetch: %s\n",
+                pkt->print());
+        noFetchWrites++;
+        respondAtomic(pkt);
+        return access_latency;
+    }
 
-            // Save the old packet
-            outstandingPacket = pkt;
+    DPRINTF(SimpleCache, "Atomic miss for packet: %s\n", pkt->print());
+    misses++;
 
-            DPRINTF(SimpleCache, "forwarding packet\n");
-            memPort.sendPacket(new_pkt);
-        }
-    }
-}
+    assert(!spansBlocks(pkt));
+    panic_if(!pkt->isRead() && !pkt->isWrite(), "Unknown packet type!");
 
-bool
-SimpleCache::accessFunctional(PacketPtr pkt)
-{
     Addr block_addr = pkt->getBlockAddr(blockSize);
-    auto it = cacheStore.find(block_addr);
-    if (it != cacheStore.end()) {
-        if (pkt->isWrite()) {
-            // Write the data into the block in the cache
-            pkt->writeDataToBlock(it->second, blockSize);
-        } else if (pkt->isRead()) {
-            // Read the data out of the cache block into the packet
-            pkt->setDataFromBlock(it->second, blockSize);
+    int entry = findBlock(block_addr);
+    if (pkt->isWrite() && !writeAllocate && entry == -1) {
+        // Write around the cache. Like in timing mode, the write doesn't
+        // wait for memory.
+        uncachedWrites++;
+        memPort.sendAtomic(pkt);
+        return access_latency;
+    }
+
+    // Fetch the sectors we need (without sectors, the whole block).
+    uint64_t sectors = touchedSectors(pkt);
+    if (entry != -1) {
+        sectors &= ~sectorValid[entry];
+        if (sectors) {
+            sectorMisses++;
         } else {
-            panic("Unknown packet type!");
+            // We have the data but not a writable copy (coherent mode)
+            upgradeMisses++;
+            sectors = allSectors;
         }
-        return true;
     }
-    return false;
+    PacketPtr fill = createFill(block_addr, sectors, pkt->req->masterId(),
+                                needsWritableCopy(pkt));
+    fill->allocate();
+    Tick fill_latency = memPort.sendAtomic(fill);
+    missLatency.sample(fill_latency);
+
+    // Like in timing mode, assume the writeback is off the critical path.
+    WriteBufferEntry writeback = insert(fill, sectors);
+    if (writeback.pkt) {
+        sendWriteback(writeback, true);
+    }
+    freePacket(fill);
+
+    bool hit M5_VAR_USED = accessFunctional(pkt);
+    panic_if(!hit, "Should always hit after inserting");
+    respondAtomic(pkt);
+
+    return access_latency + fill_latency;
 }
 
 void
-SimpleCache::insert(PacketPtr pkt)
+SimpleCache::respondAtomic(PacketPtr pkt)
 {
-    // The packet should be aligned.
-    assert(pkt->getAddr() ==  pkt->getBlockAddr(blockSize));
-    // The address should not be in the cache
-    assert(cacheStore.find(pkt->getAddr()) == cacheStore.end());
-    // The pkt should be a response
-    assert(pkt->isResponse());
-
-    if (cacheStore.size() >= capacity) {
-        // Select random thing to evict. This is a little convoluted since we
-        // are using a std::unordered_map. See http://bit.ly/2hrnLP2
-        int bucket, bucket_size;
-        do {
-            bucket = random_mt.random(0, (int)cacheStore.bucket_count() - 1);
-        } while ( (bucket_size = cacheStore.bucket_size(bucket)) == 0 );
-        auto block = std::next(cacheStore.begin(bucket),
-                               random_mt.random(0, bucket_size - 1));
-
-        DPRINTF(SimpleCache, "Removing addr %#x\n", block->first);
+    if (writeThrough && pkt->isWrite()) {
+        // Memory needs the write too. It turns the packet into the response.
+        writeThroughs++;
+        memPort.sendAtomic(pkt);
+    } else if (pkt->needsResponse()) {
+        pkt->makeResponse();
+    }
+}
 
-        // Write back the data.
-        // Create a new request-packet pair
-        RequestPtr req(new Request(block->first, blockSize, 0, 0));
-        PacketPtr new_pkt = new Packet(req, MemCmd::WritebackDirty, blockSize);
-        new_pkt->dataDynamic(block->second); // This will be deleted later
+Tick
+SimpleCache::handleAtomicWarming(PacketPtr pkt)
+{
+    Tick access_latency = cyclesToTicks(latency);
 
-        DPRINTF(SimpleCache, "Writing packet back %s\n", pkt->print());
-        // Send the write to memory
-        memPort.sendTimingReq(new_pkt);
+    Addr addr = pkt->getAddr();
+    int entry = findBlock(addr);
+    bool hit = entry != -1;
 
-        // Delete this entry
-        cacheStore.erase(block->first);
+    if (hit) {
+        hits++;
+        replPolicy->touch(entry / assoc, entry % assoc);
+    } else if (pkt->isWrite() && !writeAllocate) {
+        // The write goes around the cache
+        misses++;
+        uncachedWrites++;
+    } else {
+        misses++;
+        // Memory is always up to date in this mode, so blocks are always
+        // clean and the victim is simply dropped. The victim buffer was
+        // emptied when we started warming and isn't used.
+        entry = allocateBlock(addr, nullptr);
+        sectorValid[entry] = allSectors;
     }
 
-    DPRINTF(SimpleCache, "Inserting %s\n", pkt->print());
-    DDUMP(SimpleCache, pkt->getConstPtr<uint8_t>(), blockSize);
+    // Memory does the actual data access.
+    Tick mem_latency = memPort.sendAtomic(pkt);
 
-    // Allocate space for the cache block data
-    uint8_t *data = new uint8_t[blockSize];
+    return hit ? access_latency : access_latency + mem_latency;
+}
 
-    // Insert the data and address into the cache store
-    cacheStore[pkt->getAddr()] = data;
+void
+SimpleCache::functionalWritebackAll()
+{
+    for (unsigned entry = 0; entry < capacity; entry++) {
+        if (!valid[entry] || !sectorDirty[entry]) {
+            continue;
+        }
+        Addr block_addr = regenerateBlockAddr(tags[entry], entry / assoc);
+        functionalWriteback(block_addr, readBlockData(entry),
+                            sectorDirty[entry]);
+        // Memory has the data now
+        sectorDirty[entry] = 0;
+    }
 
-    // Write the data into the cache
-    pkt->writeDataToBlock(data, blockSize);
+    // Victims aren't tracked while warming
+    for (auto& victim : victimBuffer) {
+        if (victim.valid) {
+            functionalWriteback(victim.blockAddr, victim.data.data(),
+                                victim.sectorDirty);
+            victim.valid = false;
+        }
+    }
 }
 
-AddrRangeList
-SimpleCache::getAddrRanges() const
+void
+SimpleCache::functionalWriteback(Addr block_addr, const uint8_t *data,
+                                 uint64_t dirty)
 {
-    DPRINTF(SimpleCache, "Sending new ranges\n");
-    // Just use the same ranges as whatever is on the memory side.
-    return memPort.getAddrRanges();
+    for (unsigned s = 0, n; (n = nextSectorRun(dirty, s)) != 0; s += n) {
+        RequestPtr req(new Request(block_addr + s * sectorSize,
+                                   n * sectorSize, 0, 0));
+        Packet pkt(req, MemCmd::WriteReq);
+        pkt.dataStaticConst(data + s * sectorSize);
+        memPort.sendFunctional(&pkt);
+    }
 }
 
 void
-SimpleCache::sendRangeChange() const
+SimpleCache::functionalRefillAll()
 {
-    for (auto& port : cpuPorts) {
-        port.sendRangeChange();
+    for (unsigned entry = 0; entry < capacity; entry++) {
+        if (!valid[entry]) {
+            continue;
+        }
+        Addr block_addr = regenerateBlockAddr(tags[entry], entry / assoc);
+        RequestPtr req(new Request(block_addr, blockSize, 0, 0));
+        Packet pkt(req, MemCmd::ReadReq);
+        pkt.dataStatic(getBlockData(entry));
+        memPort.sendFunctional(&pkt);
+        blockWritten(entry);
     }
 }
 
 void
-SimpleCache::regStats()
+SimpleCache::updateWarming()
 {
-    // If you don't do this you get errors about uninitialized stats.
-    MemObject::regStats();
+    bool should_warm = warmTagsOnly && system->isAtomicMode();
+
+    if (should_warm && !warming) {
+        DPRINTF(SimpleCache, "Entering tag-only warming mode\n");
+        // Make memory up to date since it's the only copy of the data
+        // from now on.
+        functionalWritebackAll();
+        warming = true;
+    } else if (!should_warm && warming) {
+        DPRINTF(SimpleCache, "Leaving tag-only warming mode\n");
+        functionalRefillAll();
+        warming = false;
+    }
+}
 
-    hits.name(name() + ".hits")
-        .desc("Number of hits")
-        ;
+void
+SimpleCache::accessTiming(PacketPtr pkt, int port_id)
+{
+    // The victim buffer is checked along with the tags. If it has the
+    // block, the block moves back into the cache.
+    accessVictimBuffer(pkt->getAddr());
+
+    // Remember what the prefetcher needs now. The packet belongs to the CPU
+    // side once we respond.
+    Addr addr = pkt->getAddr();
+    bool has_pc = pkt->req->hasPC();
+    Addr pc = has_pc ? pkt->req->getPC() : 0;
+
+    // A write that goes on to memory can't complete until there is room
+    // for it in the write buffer.
+    bool write_buffer_full = needsWriteBuffer(pkt) &&
+        !canBufferWrite(pkt->getBlockAddr(blockSize));
+    bool hit = !write_buffer_full && accessFunctional(pkt);
 
-    misses.name(name() + ".misses")
-        .desc("Number of misses")
-        ;
+    DPRINTF(SimpleCache, "%s for packet: %s\n", hit ? "Hit" : "Miss",
+            pkt->print());
 
-    missLatency.name(name() + ".missLatency")
-        .desc("Ticks for misses to the cache")
-        .init(16) // number of buckets
-        ;
+    if (hit) {
+        // Respond to the CPU side
+        hits++; // update stats
+        DDUMP(SimpleCache, pkt->getConstPtr<uint8_t>(), pkt->getSize());
+        sendWriteThrough(pkt);
+        pkt->makeResponse();
+        sendResponse(pkt, port_id);
+    } else if (write_buffer_full) {
+        // Wait with the stalled misses. They are retried as the write buffer
+        // drains.
+        DPRINTF(SimpleCache, "Write buffer full. Stalling\n");
+        writeBufferFullStalls++;
+        stalledAccesses.push_back({pkt, port_id});
+    } else if (accessWriteBuffer(pkt)) {
+        // The block was recently evicted and hasn't been written back yet
+        writeBufferHits++;
+        pkt->makeResponse();
+        sendResponse(pkt, port_id);
+    } else if (allocateForWrite(pkt, false)) {
+        // The write only had whole sectors missing. Nothing to fetch.
+        noFetchWrites++;
+        sendWriteThrough(pkt);
+        pkt->makeResponse();
+        sendResponse(pkt, port_id);
+    } else if (stalledAccesses.empty() && writeNoAllocate(pkt)) {
+        // The write went around the cache. Don't wait for memory.
+        misses++; // update stats
+        pkt->makeResponse();
+        sendResponse(pkt, port_id);
+    } else {
+        misses++; // update stats
+        // Keep the misses in order behind any that have already stalled.
+        if (!stalledAccesses.empty() || !handleMiss(pkt, port_id)) {
+            DPRINTF(SimpleCache, "No MSHR available. Stalling\n");
+            mshrStalls++;
+            stalledAccesses.push_back({pkt, port_id});
+        }
+    }
+
+    if (prefetcher) {
+        notifyPrefetcher(addr, has_pc, pc);
+        issuePrefetches();
+    }
+
+    checkDrain();
+}
+
+bool
+SimpleCache::handleMiss(PacketPtr pkt, int port_id)
+{
+    assert(!spansBlocks(pkt));
+    Addr block_addr = pkt->getBlockAddr(blockSize);
+
+    MSHR *mshr = findMSHR(block_addr);
+    if (mshr) {
+        // There is already a fill for this block. Wait on it.
+        if (mshr->targets.size() == tgtsPerMSHR) {
+            return false;
+        }
+        if (mshr->isPrefetch && mshr->targets.empty()) {
+            // We prefetched the right block, but not early enough
+            latePrefetches++;
+        }
+        DPRINTF(SimpleCache, "Merging with outstanding miss for %#x\n",
+                block_addr);
+        mergedTargets++;
+        mshr->targets.push_back({pkt, port_id});
+        return true;
+    }
+
+    if (allocatedMSHRs == numMSHRs) {
+        return false;
+    }
+
+    mshr = allocateMSHR(block_addr);
+    mshr->targets.push_back({pkt, port_id});
+
+    // Forward to the memory side.
+    // We always fetch with a new packet (even if the request is aligned and
+    // block sized) so that later misses to the same block can be merged onto
+    // this MSHR. Only fetch the sectors that this access needs and the
+    // cache doesn't have. Without sectors, that is the whole block.
+    assert(pkt->needsResponse());
+    panic_if(!pkt->isRead() && !pkt->isWrite(), "Unknown packet type!");
+    uint64_t sectors = touchedSectors(pkt);
+    int entry = findBlock(block_addr);
+    if (entry != -1) {
+        sectors &= ~sectorValid[entry];
+        if (sectors) {
+            sectorMisses++;
+        } else {
+            // We have the data but another cache may have a copy too
+            // (coherent mode). Ask for a writable copy of the whole block.
+            upgradeMisses++;
+            sectors = allSectors;
+        }
+    }
+    mshr->fetchSectors = sectors;
+
+    // The data goes straight into the MSHR's buffer.
+    PacketPtr new_pkt = createFill(block_addr, sectors,
+                                   pkt->req->masterId(),
+                                   needsWritableCopy(pkt));
+    new_pkt->dataStatic(mshr->data.data() +
+                        (new_pkt->getAddr() - block_addr));
+
+    // Stores to this block that are still in the write buffer must get to
+    // memory before the fill does.
+    flushWriteBuffer(block_addr);
+
+    DPRINTF(SimpleCache, "forwarding packet\n");
+    memPort.sendPacket(new_pkt);
+
+    return true;
+}
+
+void
+SimpleCache::retryStalledAccesses()
+{
+    while (!stalledAccesses.empty()) {
+        MSHR::Target target = stalledAccesses.front();
+        PacketPtr pkt = target.pkt;
+
+        if (needsWriteBuffer(pkt) &&
+            !canBufferWrite(pkt->getBlockAddr(blockSize))) {
+            // Wait for the write buffer to drain
+            break;
+        }
+
+        // Take the access off of the queue first. Sending a write to memory
+        // can let memory resend a fill, which retries the accesses again.
+        stalledAccesses.pop_front();
+
+        accessVictimBuffer(pkt->getAddr());
+        if (accessFunctional(pkt)) {
+            // The block was filled while this access was waiting.
+            sendWriteThrough(pkt);
+        } else if (accessWriteBuffer(pkt) || writeNoAllocate(pkt)) {
+            // Done without the cache
+        } else if (handleMiss(pkt, target.portId)) {
+            continue;
+        } else {
+            // Still no room. Keep the rest in order and wait for the next
+            // MSHR to be freed.
+            stalledAccesses.push_front(target);
+            break;
+        }
+
+        pkt->makeResponse();
+        sendResponse(pkt, target.portId);
+    }
+}
+
+void
+SimpleCache::requestSent(PacketPtr pkt)
+{
+    if (!coherent || !pkt->isRead()) {
+        return;
+    }
+
+    // Snoops for this block are for requests ordered after the fill now.
+    // We will get a writable copy if we asked for one or if another cache
+    // is passing us the only (dirty) copy of the block.
+    MSHR *mshr = findMSHR(pkt->getBlockAddr(blockSize));
+    assert(mshr);
+    mshr->inService = true;
+    mshr->pendingModified = pkt->needsWritable() ||
+        (pkt->cacheResponding() && !pkt->hasSharers());
+}
+
+void
+SimpleCache::handleSnoop(PacketPtr pkt, bool timing)
+{
+    DPRINTF(SimpleCache, "Got snoop %s\n", pkt->print());
+    Addr block_addr = pkt->getBlockAddr(blockSize);
+    int entry = findBlock(block_addr);
+
+    // Tell the crossbar how long the lookup took
+    pkt->snoopDelay = std::max<uint32_t>(pkt->snoopDelay,
+                                         cyclesToTicks(latency));
+
+    if (pkt->isEviction()) {
+        // Another cache is dropping the block. The snoop filter only needs
+        // to know if anyone else still has it.
+        if (entry != -1 || inWriteBuffer(block_addr) ||
+            memPort.findBlockedEviction(block_addr)) {
+            pkt->setBlockCached();
+        }
+        return;
+    }
+
+    bool invalidate = pkt->needsWritable() || pkt->isInvalidate();
+    MSHR *mshr = findMSHR(block_addr);
+    if (mshr && mshr->inService) {
+        // The snoop is for a request that was ordered after our fill. Deal
+        // with it once the fill returns.
+        if (mshr->pendingModified && !mshr->postInvalidate &&
+            pkt->needsResponse()) {
+            // We will be the owner, so we have to respond. The original
+            // snoop is gone by then, so keep a copy.
+            DPRINTF(SimpleCache, "Deferring snoop until our fill returns\n");
+            deferredSnoops++;
+            pkt->setCacheResponding();
+            pkt->setResponderHadWritable();
+            mshr->deferredSnoops.push_back(new Packet(pkt, true, true));
+        }
+        if (invalidate) {
+            mshr->postInvalidate = true;
+        } else {
+            mshr->postDowngrade = true;
+            pkt->setHasSharers();
+        }
+        return;
+    }
+
+    if (entry != -1) {
+        snoopHits++;
+        bool had_writable = writable[entry];
+        // Only reads and upgrades are answered with our data. Merging a
+        // plain write into a dirty block isn't supported.
+        bool respond = sectorDirty[entry] && pkt->needsResponse();
+        panic_if(respond && pkt->hasData() && !pkt->isRead(),
+                 "Can't handle snooped %s to a dirty block", pkt->print());
+        if (!invalidate) {
+            // The requester and this cache share the block. If we have dirty
+            // data, we still own it and will write it back.
+            pkt->setHasSharers();
+            writable[entry] = 0;
+        }
+        if (respond) {
+            // We have the only up-to-date copy. Keep memory from responding.
+            pkt->setCacheResponding();
+            if (had_writable) {
+                pkt->setResponderHadWritable();
+            }
+            supplySnoopData(pkt, getBlockData(entry), timing);
+        }
+        if (invalidate) {
+            DPRINTF(SimpleCache, "Invalidating %#x\n", block_addr);
+            snoopInvalidations++;
+            invalidateBlock(entry);
+        }
+    }
+
+    // Our evictions for the block haven't reached memory yet
+    for (auto it = writeBuffer.begin(); it != writeBuffer.end(); ) {
+        if (it->pkt->getAddr() == block_addr &&
+            snoopEviction(pkt, it->pkt, timing)) {
+            freePacket(it->pkt);
+            it = writeBuffer.erase(it);
+        } else {
+            it++;
+        }
+    }
+    PacketPtr blocked = memPort.findBlockedEviction(block_addr);
+    if (blocked && snoopEviction(pkt, blocked, timing)) {
+        memPort.removeBlocked(blocked);
+        freePacket(blocked);
+    }
+}
+
+bool
+SimpleCache::snoopEviction(PacketPtr pkt, PacketPtr eviction, bool timing)
+{
+    bool invalidate = pkt->needsWritable() || pkt->isInvalidate();
+    if (eviction->cmd == MemCmd::WritebackDirty) {
+        snoopHits++;
+        if (pkt->needsResponse() && !pkt->cacheResponding()) {
+            panic_if(pkt->hasData() && !pkt->isRead(),
+                     "Can't handle snooped %s to a dirty block",
+                     pkt->print());
+            pkt->setCacheResponding();
+            supplySnoopData(pkt, eviction->getConstPtr<uint8_t>(), timing);
+        }
+        if (!invalidate) {
+            // The writeback still makes memory up to date, but the
+            // requester keeps a copy.
+            pkt->setHasSharers();
+            eviction->setHasSharers();
+        }
+    }
+
+    if (invalidate) {
+        // The requester takes over the block (and its dirty data), so the
+        // snoop filter must not hear that we dropped it.
+        DPRINTF(SimpleCache, "Dropping %s for snoop\n", eviction->print());
+        snoopInvalidations++;
+        return true;
+    }
+    return false;
+}
+
+void
+SimpleCache::handleFunctionalSnoop(PacketPtr pkt)
+{
+    // Our copies of the data are newer than memory. Port proxies access
+    // one block at a time, but an access may still span blocks. Then a read
+    // is only updated and memory is left to respond.
+    std::vector<bool> all_bytes(blockSize, true);
+    bool have_data = false;
+    Addr end = pkt->getAddr() + pkt->getSize();
+    for (Addr block_addr = pkt->getBlockAddr(blockSize); block_addr < end;
+         block_addr += blockSize) {
+        int entry = findBlock(block_addr);
+        if (entry != -1 && (pkt->isWrite() || sectorDirty[entry])) {
+            functionalOverlay(pkt, block_addr, all_bytes,
+                              getBlockData(entry));
+            if (pkt->isWrite()) {
+                blockWritten(entry);
+            }
+            have_data = true;
+        }
+        for (auto& wb : writeBuffer) {
+            if (wb.pkt->getAddr() == block_addr && wb.pkt->hasData()) {
+                functionalOverlay(pkt, block_addr, wb.dirtyBytes,
+                                  wb.pkt->getPtr<uint8_t>());
+                have_data = true;
+            }
+        }
+        PacketPtr blocked = memPort.findBlockedEviction(block_addr);
+        if (blocked && blocked->hasData()) {
+            functionalOverlay(pkt, block_addr, all_bytes,
+                              blocked->getPtr<uint8_t>());
+            have_data = true;
+        }
+    }
+
+    if (pkt->isRead() && have_data && !spansBlocks(pkt)) {
+        pkt->makeResponse();
+    }
+}
+
+void
+SimpleCache::supplySnoopData(PacketPtr pkt, const uint8_t *data, bool timing)
+{
+    DPRINTF(SimpleCache, "Supplying data for snoop %s\n", pkt->print());
+    snoopDataResponses++;
+
+    if (!timing) {
+        pkt->makeAtomicResponse();
+        if (pkt->isRead()) {
+            pkt->setDataFromBlock(data, blockSize);
+        }
+        return;
+    }
+
+    // The original snoop goes on to the other caches, so respond with a
+    // copy. The requester deletes it.
+    PacketPtr resp = new Packet(pkt, false, pkt->isRead());
+    resp->makeTimingResponse();
+    if (resp->isRead()) {
+        resp->setDataFromBlock(data, blockSize);
+    }
+    resp->headerDelay = resp->payloadDelay = 0;
+    queueSnoopResp(resp);
+}
+
+void
+SimpleCache::respondDeferredSnoop(PacketPtr snoop)
+{
+    int entry = findBlock(snoop->getAddr());
+    assert(entry != -1);
+    DPRINTF(SimpleCache, "Responding to deferred snoop %s\n",
+            snoop->print());
+
+    // The copy lost the original's flags. The requester needs them to
+    // know how to treat the response.
+    bool invalidate = snoop->needsWritable() || snoop->isInvalidate();
+    snoop->setCacheResponding();
+    snoop->setResponderHadWritable();
+    if (!invalidate) {
+        snoop->setHasSharers();
+        writable[entry] = 0;
+    }
+
+    snoopDataResponses++;
+    snoop->makeTimingResponse();
+    if (snoop->isRead()) {
+        snoop->setDataFromBlock(getBlockData(entry), blockSize);
+    }
+    snoop->headerDelay = snoop->payloadDelay = 0;
+    queueSnoopResp(snoop);
+
+    if (invalidate) {
+        snoopInvalidations++;
+        invalidateBlock(entry);
+    }
+}
+
+void
+SimpleCache::queueSnoopResp(PacketPtr pkt)
+{
+    pendingSnoopResps.push_back({pkt, clockEdge(latency)});
+    if (!snoopRespEvent.scheduled()) {
+        schedule(snoopRespEvent, pendingSnoopResps.front().ready);
+    }
+}
+
+void
+SimpleCache::sendSnoopResponses()
+{
+    while (!pendingSnoopResps.empty() &&
+           pendingSnoopResps.front().ready <= curTick()) {
+        memPort.sendSnoopResp(pendingSnoopResps.front().pkt);
+        pendingSnoopResps.pop_front();
+    }
+
+    if (!pendingSnoopResps.empty()) {
+        schedule(snoopRespEvent, pendingSnoopResps.front().ready);
+    }
+
+    checkDrain();
+}
+
+std::vector<PacketPtr>
+SimpleCache::splitPacket(PacketPtr pkt)
+{
+    panic_if(!pkt->isRead() && !pkt->isWrite(),
+             "Can only split reads and writes across blocks");
+    panic_if(pkt->isLLSC(),
+             "Can't split a locked access across blocks");
+
+    std::vector<PacketPtr> pieces;
+    Addr addr = pkt->getAddr();
+    Addr end = addr + pkt->getSize();
+    for (Addr piece_addr = addr; piece_addr < end; ) {
+        Addr next_block = roundDown(piece_addr, blockSize) + blockSize;
+        unsigned piece_size = std::min(next_block, end) - piece_addr;
+
+        RequestPtr req = allocRequest(piece_addr, piece_size,
+                                      pkt->req->getFlags(),
+                                      pkt->req->masterId());
+        PacketPtr piece = allocPacket(req, pkt->cmd);
+        // Point at the original packet's data so that reads fill it in and
+        // writes don't need a copy.
+        piece->dataStatic(pkt->getPtr<uint8_t>() + (piece_addr - addr));
+        pieces.push_back(piece);
+
+        piece_addr += piece_size;
+    }
+    return pieces;
+}
+
+bool
+SimpleCache::isBlocked() const
+{
+    return allocatedMSHRs == numMSHRs || !stalledAccesses.empty();
+}
+
+bool
+SimpleCache::accessWriteBuffer(PacketPtr pkt)
+{
+    Addr block_addr = pkt->getBlockAddr(blockSize);
+    for (auto it = writeBuffer.begin(); it != writeBuffer.end(); it++) {
+        WriteBufferEntry &wb = *it;
+        if (wb.pkt->getAddr() != block_addr) {
+            continue;
+        }
+
+        if (!wb.pkt->hasData()) {
+            // Just a CleanEvict. We're about to get the block again, so
+            // memory shouldn't hear that we got rid of it.
+            DPRINTF(SimpleCache, "Dropping queued %s\n", wb.pkt->print());
+            freePacket(wb.pkt);
+            writeBuffer.erase(it);
+            return false;
+        }
+
+        panic_if(!pkt->isRead() && !pkt->isWrite(), "Unknown packet type!");
+        auto first = wb.dirtyBytes.begin() + (pkt->getAddr() - block_addr);
+        if (pkt->isWrite() && coherent) {
+            // Other caches may have the block now. Send our data to memory
+            // and get a writable copy.
+            flushWriteBuffer(block_addr);
+            return false;
+        } else if (pkt->isWrite()) {
+            DPRINTF(SimpleCache, "Merging write into queued writeback\n");
+            mergeWrite(pkt, wb);
+        } else if (std::find(first, first + pkt->getSize(), false) ==
+                   first + pkt->getSize()) {
+            DPRINTF(SimpleCache, "Reading from queued writeback\n");
+            pkt->setDataFromBlock(wb.pkt->getConstPtr<uint8_t>(), blockSize);
+        } else {
+            // Only some of the data is here. Send it to memory now so that
+            // it gets there before the fill for the rest.
+            flushWriteBuffer(block_addr);
+            return false;
+        }
+        return true;
+    }
+    return false;
+}
+
+bool
+SimpleCache::inWriteBuffer(Addr block_addr) const
+{
+    for (auto& wb : writeBuffer) {
+        if (wb.pkt->getAddr() == block_addr) {
+            return true;
+        }
+    }
+    return false;
+}
+
+void
+SimpleCache::notifyPrefetcher(Addr addr, bool has_pc, Addr pc)
+{
+    prefetchCandidates.clear();
+    prefetcher->notify(addr, has_pc, pc, prefetchCandidates);
+
+    for (Addr candidate : prefetchCandidates) {
+        // Don't bother with blocks we already have or are getting
+        if (findBlock(candidate) != -1 || findMSHR(candidate) ||
+            findVictimEntry(candidate)) {
+            continue;
+        }
+        if (std::find(prefetchQueue.begin(), prefetchQueue.end(),
+                      candidate) != prefetchQueue.end()) {
+            continue;
+        }
+        if (prefetchQueue.size() == prefetchQueueSize) {
+            // Newer candidates are more likely to be timely
+            prefetchQueue.pop_front();
+        }
+        DPRINTF(SimpleCache, "Queueing prefetch for %#x\n", candidate);
+        prefetchQueue.push_back(candidate);
+    }
+}
+
+void
+SimpleCache::issuePrefetches()
+{
+    if (drainState() == DrainState::Draining) {
+        // Don't start anything new. The queue is kept for after resuming.
+        return;
+    }
+
+    while (!prefetchQueue.empty() && !memPort.isBlocked() &&
+           stalledAccesses.empty() && allocatedMSHRs + 1 < numMSHRs) {
+        Addr addr = prefetchQueue.front();
+        prefetchQueue.pop_front();
+
+        // Things may have changed since this was queued
+        if (findBlock(addr) != -1 || findMSHR(addr) || inWriteBuffer(addr) ||
+            findVictimEntry(addr)) {
+            continue;
+        }
+
+        MSHR *mshr = allocateMSHR(addr);
+        mshr->isPrefetch = true;
+        mshr->fetchSectors = allSectors;
+        fetchedBytes += blockSize;
+
+        RequestPtr req = allocRequest(addr, blockSize, Request::PREFETCH);
+        PacketPtr pkt = allocPacket(req, coherent ? MemCmd::ReadSharedReq :
+                                                    MemCmd::ReadReq);
+        pkt->dataStatic(mshr->data.data());
+
+        DPRINTF(SimpleCache, "Issuing prefetch %s\n", pkt->print());
+        prefetchesIssued++;
+        memPort.sendPacket(pkt);
+    }
+}
+
+void
+SimpleCache::sendWriteback(const WriteBufferEntry &wb, bool atomic)
+{
+    if (!wb.pkt->hasData() ||
+        std::find(wb.dirtyBytes.begin(), wb.dirtyBytes.end(), false) ==
+        wb.dirtyBytes.end()) {
+        // A CleanEvict or a write of the whole block
+        DPRINTF(SimpleCache, "Sending writeback %s\n", wb.pkt->print());
+        if (atomic) {
+            memPort.sendAtomic(wb.pkt);
+            freePacket(wb.pkt);
+        } else {
+            if (wb.pkt->needsResponse()) {
+                // Buffered stores are a WriteReq. The response is dropped in
+                // handleResponse.
+                outstandingWrites++;
+            }
+            memPort.sendPacket(wb.pkt);
+        }
+        return;
+    }
+
+    // Only some of the block has data to write. Writebacks are always for a
+    // whole block, so write each run of bytes with a normal write instead.
+    partialWritebacks++;
+    Addr block_addr = wb.pkt->getAddr();
+    for (unsigned b = 0, n; (n = nextByteRun(wb.dirtyBytes, b)) != 0;
+         b += n) {
+        RequestPtr req = allocRequest(block_addr + b, n, 0,
+                                      wb.pkt->req->masterId());
+        PacketPtr pkt = allocPacket(req, MemCmd::WriteReq);
+        pkt->allocate();
+        pkt->setData(wb.pkt->getConstPtr<uint8_t>() + b);
+        DPRINTF(SimpleCache, "Sending partial writeback %s\n", pkt->print());
+        if (atomic) {
+            memPort.sendAtomic(pkt);
+            freePacket(pkt);
+        } else {
+            // The response is dropped in handleResponse
+            outstandingWrites++;
+            memPort.sendPacket(pkt);
+        }
+    }
+    freePacket(wb.pkt);
+}
+
+void
+SimpleCache::drainWriteBuffer()
+{
+    // Only hand the memory port a writeback when it isn't already waiting
+    // on a retry. Otherwise, new misses would queue behind every writeback.
+    while (!writeBuffer.empty() && !writeBuffer.front().open &&
+           !memPort.isBlocked()) {
+        WriteBufferEntry wb = std::move(writeBuffer.front());
+        writeBuffer.pop_front();
+        sendWriteback(wb, false);
+    }
+
+    if (needRespRetry && writeBuffer.size() < numWriteBuffers) {
+        // There's room for a writeback now. Memory can send the fill again.
+        needRespRetry = false;
+        memPort.sendRetryResp();
+    }
+}
+
+void
+SimpleCache::pushWriteBuffer(WriteBufferEntry &&wb)
+{
+    if (!writeBuffer.empty()) {
+        // Only the newest entry can be held back for more stores
+        writeBuffer.back().open = false;
+    }
+    if (wb.open) {
+        reschedule(writeCombineEvent, clockEdge(writeCombineLatency), true);
+    }
+    writeBuffer.push_back(std::move(wb));
+    drainWriteBuffer();
+}
+
+void
+SimpleCache::flushWriteBuffer(Addr block_addr)
+{
+    for (auto it = writeBuffer.begin(); it != writeBuffer.end(); ) {
+        if (it->pkt->getAddr() == block_addr) {
+            DPRINTF(SimpleCache, "Flushing queued %s\n", it->pkt->print());
+            sendWriteback(*it, false);
+            it = writeBuffer.erase(it);
+        } else {
+            it++;
+        }
+    }
+}
+
+void
+SimpleCache::mergeWrite(PacketPtr pkt, WriteBufferEntry &wb)
+{
+    assert(wb.pkt->hasData());
+    pkt->writeDataToBlock(wb.pkt->getPtr<uint8_t>(), blockSize);
+    auto first = wb.dirtyBytes.begin() +
+                 (pkt->getAddr() - pkt->getBlockAddr(blockSize));
+    std::fill(first, first + pkt->getSize(), true);
+    writeBufferMerges++;
+}
+
+bool
+SimpleCache::canBufferWrite(Addr block_addr) const
+{
+    if (writeBuffer.size() < numWriteBuffers) {
+        return true;
+    }
+    for (auto& wb : writeBuffer) {
+        if (wb.pkt->getAddr() == block_addr && wb.pkt->hasData()) {
+            return true;
+        }
+    }
+    return false;
+}
+
+void
+SimpleCache::bufferWrite(PacketPtr pkt)
+{
+    Addr block_addr = pkt->getBlockAddr(blockSize);
+    for (auto& wb : writeBuffer) {
+        if (wb.pkt->getAddr() == block_addr && wb.pkt->hasData()) {
+            DPRINTF(SimpleCache, "Combining %s with queued writes\n",
+                    pkt->print());
+            mergeWrite(pkt, wb);
+            return;
+        }
+    }
+
+    // Start a new entry for the block. It waits a little while for more
+    // stores before it is sent.
+    assert(writeBuffer.size() < numWriteBuffers);
+    RequestPtr req = allocRequest(block_addr, blockSize, 0,
+                                  pkt->req->masterId());
+    WriteBufferEntry wb = {allocPacket(req, MemCmd::WriteReq),
+                           std::vector<bool>(blockSize, false),
+                           writeCombineLatency != 0};
+    wb.pkt->allocate();
+    pkt->writeDataToBlock(wb.pkt->getPtr<uint8_t>(), blockSize);
+    auto first = wb.dirtyBytes.begin() + (pkt->getAddr() - block_addr);
+    std::fill(first, first + pkt->getSize(), true);
+    DPRINTF(SimpleCache, "Buffering %s\n", pkt->print());
+    pushWriteBuffer(std::move(wb));
+}
+
+void
+SimpleCache::sendWriteThrough(PacketPtr pkt)
+{
+    if (writeThrough && pkt->isWrite()) {
+        writeThroughs++;
+        bufferWrite(pkt);
+    }
+}
+
+bool
+SimpleCache::writeNoAllocate(PacketPtr pkt)
+{
+    if (writeAllocate || !pkt->isWrite()) {
+        return false;
+    }
+
+    Addr block_addr = pkt->getBlockAddr(blockSize);
+    if (findBlock(block_addr) != -1 || findMSHR(block_addr)) {
+        // Some of the block is (or is about to be) in the cache. Write it
+        // there so the cache and memory don't disagree.
+        return false;
+    }
+
+    DPRINTF(SimpleCache, "Writing %s around the cache\n", pkt->print());
+    uncachedWrites++;
+    bufferWrite(pkt);
+    return true;
+}
+
+bool
+SimpleCache::needsWriteBuffer(PacketPtr pkt) const
+{
+    if (!pkt->isWrite()) {
+        return false;
+    }
+    // Writes that miss with write-no-allocate go around the cache
+    return writeThrough ||
+           (!writeAllocate && findBlock(pkt->getAddr()) == -1);
+}
+
+void
+SimpleCache::closeWriteCombining()
+{
+    if (!writeBuffer.empty()) {
+        writeBuffer.back().open = false;
+    }
+    drainWriteBuffer();
+
+    // There may be room for stalled writes now
+    retryStalledAccesses();
+    scheduleArbitration();
+    checkDrain();
+}
+
+SimpleCache::AccessEvent*
+SimpleCache::allocAccessEvent(PacketPtr pkt, int port_id)
+{
+    AccessEvent *event;
+    if (!freeAccessEvents.empty()) {
+        poolHits[EventPool]++;
+        event = freeAccessEvents.back();
+        freeAccessEvents.pop_back();
+    } else {
+        poolAllocs[EventPool]++;
+        event = new AccessEvent(this);
+        accessEvents.emplace_back(event);
+    }
+    event->setAccess(pkt, port_id);
+    return event;
+}
+
+RequestPtr
+SimpleCache::allocRequest(Addr addr, unsigned size, Request::Flags flags,
+                          MasterID master_id)
+{
+    for (unsigned i = 0; i < requestPool.size(); i++) {
+        RequestPtr &req = requestPool[requestPoolNext];
+        requestPoolNext = (requestPoolNext + 1) % requestPool.size();
+
+        if (!req) {
+            // Fill the pool lazily
+            poolAllocs[RequestPool]++;
+            req.reset(new Request(addr, size, flags, master_id));
+            return req;
+        }
+        if (req.use_count() == 1) {
+            // Nothing else is using this request anymore
+            poolHits[RequestPool]++;
+            req->setPhys(addr, size, flags, master_id);
+            return req;
+        }
+    }
+
+    // Every pooled request is still in flight
+    poolAllocs[RequestPool]++;
+    return RequestPtr(new Request(addr, size, flags, master_id));
+}
+
+PacketPtr
+SimpleCache::allocPacket(const RequestPtr &req, MemCmd cmd,
+                         unsigned block_size)
+{
+    void *storage;
+    if (!freePackets.empty()) {
+        poolHits[PacketPool]++;
+        storage = freePackets.back();
+        freePackets.pop_back();
+    } else {
+        // Allocate the storage the same way new Packet would so that
+        // packets that leave the cache can be deleted normally.
+        poolAllocs[PacketPool]++;
+        storage = ::operator new(sizeof(Packet));
+    }
+
+    if (block_size) {
+        return new (storage) Packet(req, cmd, block_size);
+    } else {
+        return new (storage) Packet(req, cmd);
+    }
+}
+
+void
+SimpleCache::freePacket(PacketPtr pkt)
+{
+    pkt->~Packet();
+    freePackets.push_back(pkt);
+}
+
+bool
+SimpleCache::isDrained() const
+{
+    if (allocatedMSHRs != 0 || !stalledAccesses.empty() ||
+        !writeBuffer.empty() || memPort.isBlocked() || pendingAccesses != 0 ||
+        outstandingWrites != 0 || !pendingSnoopResps.empty() ||
+        memPort.hasBlockedSnoopResps()) {
+        return false;
+    }
+
+    for (auto& victim : victimBuffer) {
+        if (victim.valid) {
+            return false;
+        }
+    }
+
+    for (auto& port : cpuPorts) {
+        if (!port.isIdle()) {
+            return false;
+        }
+    }
+    return true;
+}
+
+void
+SimpleCache::checkDrain()
+{
+    if (drainState() != DrainState::Draining) {
+        return;
+    }
+
+    // Spill any victims that didn't fit in the write buffer before
+    spillVictimBuffer();
+
+    if (isDrained()) {
+        DPRINTF(Drain, "SimpleCache done draining\n");
+        signalDrainDone();
+    }
+}
+
+SimpleCache::MSHR*
+SimpleCache::findMSHR(Addr block_addr)
+{
+    for (auto& mshr : mshrs) {
+        if (mshr.valid && mshr.blockAddr == block_addr) {
+            return &mshr;
+        }
+    }
+    return nullptr;
+}
+
+SimpleCache::MSHR*
+SimpleCache::allocateMSHR(Addr block_addr)
+{
+    assert(!findMSHR(block_addr));
+    for (auto& mshr : mshrs) {
+        if (!mshr.valid) {
+            mshr.valid = true;
+            mshr.blockAddr = block_addr;
+            mshr.allocTime = curTick();
+            mshr.isPrefetch = false;
+            mshr.fetchSectors = 0;
+            mshr.targets.clear();
+            mshr.inService = false;
+            mshr.pendingModified = false;
+            mshr.postInvalidate = false;
+            mshr.postDowngrade = false;
+            mshr.deferredSnoops.clear();
+
+            allocatedMSHRs++;
+            mshrOccupancy = allocatedMSHRs;
+            return &mshr;
+        }
+    }
+    panic("Tried to allocate an MSHR when none are free");
+}
+
+void
+SimpleCache::freeMSHR(MSHR *mshr)
+{
+    assert(mshr->valid);
+    mshr->valid = false;
+
+    assert(allocatedMSHRs > 0);
+    allocatedMSHRs--;
+    mshrOccupancy = allocatedMSHRs;
+}
+
+bool
+SimpleCache::accessFunctional(PacketPtr pkt, bool demand)
+{
+    int entry = findBlock(pkt->getAddr());
+    uint64_t sectors = touchedSectors(pkt);
+    if (entry != -1 && (sectorValid[entry] & sectors) == sectors) {
+        if (demand && needsWritableCopy(pkt) && !writable[entry]) {
+            // Other caches may have a copy. We have to get a writable copy
+            // first, which is a miss.
+            return false;
+        }
+        if (demand) {
+            replPolicy->touch(entry / assoc, entry % assoc);
+            if (prefetched[entry]) {
+                usefulPrefetches++;
+                prefetched[entry] = 0;
+            }
+        }
+        if (pkt->isWrite()) {
+            // Write the data into the block in the cache
+            pkt->writeDataToBlock(getBlockData(entry), blockSize);
+            blockWritten(entry);
+            // With write-through, memory gets the write too (see
+            // sendWriteThrough), so the block stays clean.
+            if (!writeThrough) {
+                sectorDirty[entry] |= sectors;
+            }
+        } else if (pkt->isRead()) {
+            // Read the data out of the cache block into the packet
+            pkt->setDataFromBlock(getBlockData(entry), blockSize);
+        } else {
+            panic("Unknown packet type!");
+        }
+        return true;
+    }
+    return false;
+}
+
+SimpleCache::WriteBufferEntry
+SimpleCache::insert(PacketPtr pkt, uint64_t sectors, bool prefetched_block)
+{
+    Addr block_addr = pkt->getBlockAddr(blockSize);
+    // The pkt should be a response
+    assert(pkt->isResponse());
+
+    WriteBufferEntry writeback = {nullptr, {}, false};
+    int entry = findBlock(block_addr);
+    if (entry == -1) {
+        entry = allocateBlock(block_addr, &writeback);
+        prefetched[entry] = prefetched_block;
+    }
+
+    DPRINTF(SimpleCache, "Inserting %s\n", pkt->print());
+    DDUMP(SimpleCache, pkt->getConstPtr<uint8_t>(), pkt->getSize());
+
+    // Write the data into the cache. Only fill sectors that are still
+    // missing. The others may have been written since the fill was sent.
+    uint64_t fill = sectors & ~sectorValid[entry];
+    unsigned offset = pkt->getAddr() - block_addr;
+    uint8_t *data = getBlockData(entry);
+    for (unsigned s = 0, n; (n = nextSectorRun(fill, s)) != 0; s += n) {
+        assert(s * sectorSize >= offset &&
+               (s + n) * sectorSize <= offset + pkt->getSize());
+        std::memcpy(data + s * sectorSize,
+                    pkt->getConstPtr<uint8_t>() + s * sectorSize - offset,
+                    n * sectorSize);
+    }
+    if (fill) {
+        blockWritten(entry);
+    }
+    sectorValid[entry] |= fill;
+
+    if (coherent && !pkt->hasSharers()) {
+        // No other cache kept a copy, so we can write the block. If another
+        // cache passed its dirty copy to us, we have to write it back now.
+        writable[entry] = 1;
+        if (pkt->cacheResponding()) {
+            sectorDirty[entry] = allSectors;
+        }
+    }
+
+    return writeback;
+}
+
+int
+SimpleCache::allocateBlock(Addr addr, WriteBufferEntry *writeback)
+{
+    // If the victim buffer has the block, take it out first. Then the block
+    // evicted to make room takes its place.
+    VictimEntry *hit = findVictimEntry(addr);
+    VictimEntry swapped;
+    if (hit) {
+        DPRINTF(SimpleCache, "Swapping %#x in from the victim buffer\n",
+                hit->blockAddr);
+        victimHits++;
+        swapped.sectorValid = hit->sectorValid;
+        swapped.sectorDirty = hit->sectorDirty;
+        swapped.prefetched = hit->prefetched;
+        victimSwap.swap(hit->data);
+        hit->valid = false;
+    }
+
+    int entry = evictBlock(addr, writeback);
+
+    // Take a frame in the data arena for the cache block data
+    assert(!freeFrames.empty());
+    frames[entry] = freeFrames.back();
+    freeFrames.pop_back();
+
+    // Insert the address into the tag array
+    tags[entry] = extractTag(addr);
+    valid[entry] = 1;
+    sectorValid[entry] = 0;
+    sectorDirty[entry] = 0;
+    writable[entry] = 0;
+    prefetched[entry] = 0;
+    replPolicy->insert(entry / assoc, entry % assoc);
+
+    if (hit) {
+        sectorValid[entry] = swapped.sectorValid;
+        sectorDirty[entry] = swapped.sectorDirty;
+        prefetched[entry] = swapped.prefetched;
+        std::memcpy(getBlockData(entry), victimSwap.data(), blockSize);
+        blockWritten(entry);
+    }
+
+    return entry;
+}
+
+bool
+SimpleCache::allocateForWrite(PacketPtr pkt, bool atomic)
+{
+    if (numSectors == 1 || !pkt->isWrite()) {
+        return false;
+    }
+
+    Addr block_addr = pkt->getBlockAddr(blockSize);
+    if (findMSHR(block_addr)) {
+        // The fill could land on top of this write. Wait for it instead.
+        return false;
+    }
+
+    int entry = findBlock(block_addr);
+    uint64_t missing = touchedSectors(pkt);
+    if (entry != -1) {
+        missing &= ~sectorValid[entry];
+    }
+    if (missing & ~coveredSectors(pkt)) {
+        // Part of a missing sector is not written. It must be fetched.
+        return false;
+    }
+
+    if (entry == -1) {
+        if (!writeAllocate) {
+            // Write misses don't allocate
+            return false;
+        }
+        if (!atomic && writeBuffer.size() + (writeThrough ? 2 : 1) >
+            numWriteBuffers) {
+            // No room for the victim's writeback (and the write itself with
+            // write-through)
+            return false;
+        }
+        WriteBufferEntry writeback = {nullptr, {}, false};
+        entry = allocateBlock(block_addr, &writeback);
+        if (writeback.pkt && atomic) {
+            sendWriteback(writeback, true);
+        } else if (writeback.pkt) {
+            pushWriteBuffer(std::move(writeback));
+        }
+    }
+
+    DPRINTF(SimpleCache, "Writing sectors %#x of %#x without a fetch\n",
+            missing, block_addr);
+    sectorValid[entry] |= missing;
+    bool hit M5_VAR_USED = accessFunctional(pkt);
+    assert(hit);
+    return true;
+}
+
+PacketPtr
+SimpleCache::createFill(Addr block_addr, uint64_t sectors,
+                        MasterID master_id, bool writable)
+{
+    assert(sectors);
+    unsigned first = findLsbSet(sectors);
+    unsigned last = findMsbSet(sectors);
+    unsigned size = (last - first + 1) * sectorSize;
+    fetchedBytes += size;
+
+    RequestPtr req = allocRequest(block_addr + first * sectorSize, size, 0,
+                                  master_id);
+    MemCmd cmd = MemCmd::ReadReq;
+    if (coherent) {
+        // Tell the other caches whether we are going to write the block
+        cmd = writable ? MemCmd::ReadExReq : MemCmd::ReadSharedReq;
+    }
+    return allocPacket(req, cmd);
+}
+
+void
+SimpleCache::functionalOverlay(PacketPtr pkt, Addr block_addr,
+                               const std::vector<bool> &bytes,
+                               uint8_t *block_data)
+{
+    Addr start = pkt->getAddr();
+    Addr end = start + pkt->getSize();
+    for (unsigned b = 0, n; (n = nextByteRun(bytes, b)) != 0; b += n) {
+        Addr run_start = std::max(start, block_addr + b);
+        Addr run_end = std::min(end, block_addr + b + n);
+        if (run_start >= run_end) {
+            continue;
+        }
+        uint8_t *cache_data = block_data + (run_start - block_addr);
+        uint8_t *pkt_data = pkt->getPtr<uint8_t>() + (run_start - start);
+        if (pkt->isWrite()) {
+            std::memcpy(cache_data, pkt_data, run_end - run_start);
+        } else {
+            std::memcpy(pkt_data, cache_data, run_end - run_start);
+        }
+    }
+}
+
+unsigned
+SimpleCache::nextSectorRun(uint64_t mask, unsigned &sector) const
+{
+    while (sector < numSectors && !(mask & (1ULL << sector))) {
+        sector++;
+    }
+    unsigned end = sector;
+    while (end < numSectors && (mask & (1ULL << end))) {
+        end++;
+    }
+    return end - sector;
+}
+
+unsigned
+SimpleCache::nextByteRun(const std::vector<bool> &bytes, unsigned &byte)
+{
+    while (byte < bytes.size() && !bytes[byte]) {
+        byte++;
+    }
+    unsigned end = byte;
+    while (end < bytes.size() && bytes[end]) {
+        end++;
+    }
+    return end - byte;
+}
+
+void
+SimpleCache::sectorsToBytes(uint64_t sectors, std::vector<bool> &bytes) const
+{
+    bytes.assign(blockSize, false);
+    for (unsigned s = 0, n; (n = nextSectorRun(sectors, s)) != 0; s += n) {
+        std::fill(bytes.begin() + s * sectorSize,
+                  bytes.begin() + (s + n) * sectorSize, true);
+    }
+}
+
+int
+SimpleCache::evictBlock(Addr addr, WriteBufferEntry *writeback)
+{
+    int entry = findVictim(addr);
+    if (!valid[entry]) {
+        // Nothing to evict
+        return entry;
+    }
+
+    Addr victim_addr = regenerateBlockAddr(tags[entry], extractSet(addr));
+    bool is_dirty = sectorDirty[entry] != 0;
+    DPRINTF(SimpleCache, "Removing %s addr %#x\n",
+            is_dirty ? "dirty" : "clean", victim_addr);
+
+    if (is_dirty) {
+        dirtyEvictions++;
+    } else {
+        cleanEvictions++;
+    }
+
+    if (writeback && !victimBuffer.empty()) {
+        // Keep the block around in case it is needed again soon
+        insertVictim(entry, victim_addr, writeback);
+    } else if (writeback) {
+        makeWriteback(victim_addr, readBlockData(entry), sectorDirty[entry],
+                      coherent && !writable[entry], writeback);
+    }
+
+    invalidateBlock(entry);
+    return entry;
+}
+
+void
+SimpleCache::makeWriteback(Addr block_addr, const uint8_t *data,
+                           uint64_t dirty, bool has_sharers,
+                           WriteBufferEntry *writeback)
+{
+    if (dirty) {
+        // Write back the data.
+        // Create a new request-packet pair
+        RequestPtr req = allocRequest(block_addr, blockSize, 0);
+        PacketPtr new_pkt = allocPacket(req, MemCmd::WritebackDirty,
+                                        blockSize);
+        // Copy the data out. The storage is reused right away.
+        new_pkt->allocate();
+        new_pkt->setData(data);
+        if (has_sharers) {
+            // Other caches still have (clean) copies of the block
+            new_pkt->setHasSharers();
+        }
+
+        DPRINTF(SimpleCache, "Writing packet back %s\n", new_pkt->print());
+        writebackBytes += popCount(dirty) * sectorSize;
+        writeback->pkt = new_pkt;
+        sectorsToBytes(dirty, writeback->dirtyBytes);
+    } else if (sendCleanEvicts) {
+        // Memory already has this data. Just let the rest of the system know
+        // that we don't have the block anymore.
+        RequestPtr req = allocRequest(block_addr, blockSize, 0);
+        writeback->pkt = allocPacket(req, MemCmd::CleanEvict);
+        DPRINTF(SimpleCache, "Sending clean evict %s\n",
+                writeback->pkt->print());
+    }
+    // Otherwise, a clean block is just dropped.
+}
+
+void
+SimpleCache::insertVictim(int entry, Addr block_addr,
+                          WriteBufferEntry *writeback)
+{
+    // Use a free victim entry if there is one. Otherwise replace the oldest.
+    VictimEntry *victim = &victimBuffer[0];
+    for (auto& candidate : victimBuffer) {
+        if (!candidate.valid) {
+            victim = &candidate;
+            break;
+        }
+        if (candidate.inserted < victim->inserted) {
+            victim = &candidate;
+        }
+    }
+
+    if (victim->valid) {
+        DPRINTF(SimpleCache, "Spilling %#x from the victim buffer\n",
+                victim->blockAddr);
+        victimsSpilled++;
+        if (victim->prefetched) {
+            // Nothing ever used this prefetch
+            unusedPrefetches++;
+        }
+        makeWriteback(victim->blockAddr, victim->data.data(),
+                      victim->sectorDirty, false, writeback);
+    }
+
+    DPRINTF(SimpleCache, "Moving %#x to the victim buffer\n", block_addr);
+    victimsInserted++;
+    victim->valid = true;
+    victim->blockAddr = block_addr;
+    victim->sectorValid = sectorValid[entry];
+    victim->sectorDirty = sectorDirty[entry];
+    victim->prefetched = prefetched[entry];
+    victim->inserted = victimSequence++;
+    std::memcpy(victim->data.data(), readBlockData(entry), blockSize);
+
+    // The victim buffer keeps track of the prefetch now
+    prefetched[entry] = 0;
+}
+
+bool
+SimpleCache::accessVictimBuffer(Addr addr)
+{
+    if (victimBuffer.empty() || findBlock(addr) != -1 ||
+        !findVictimEntry(addr)) {
+        return false;
+    }
+
+    WriteBufferEntry writeback = {nullptr, {}, false};
+    allocateBlock(addr, &writeback);
+    // The swapped block's victim entry was free, so nothing was spilled
+    assert(!writeback.pkt);
+    return true;
+}
+
+void
+SimpleCache::spillVictimBuffer()
+{
+    for (auto& victim : victimBuffer) {
+        if (!victim.valid) {
+            continue;
+        }
+        if (writeBuffer.size() >= numWriteBuffers) {
+            // Wait for the write buffer to drain some more
+            return;
+        }
+        if (victim.prefetched) {
+            unusedPrefetches++;
+        }
+        victimsSpilled++;
+        WriteBufferEntry writeback = {nullptr, {}, false};
+        makeWriteback(victim.blockAddr, victim.data.data(),
+                      victim.sectorDirty, false, &writeback);
+        victim.valid = false;
+        if (writeback.pkt) {
+            pushWriteBuffer(std::move(writeback));
+        }
+    }
+}
+
+SimpleCache::VictimEntry*
+SimpleCache::findVictimEntry(Addr addr)
+{
+    Addr block_addr = roundDown(addr, blockSize);
+    for (auto& victim : victimBuffer) {
+        if (victim.valid && victim.blockAddr == block_addr) {
+            return &victim;
+        }
+    }
+    return nullptr;
+}
+
+void
+SimpleCache::invalidateBlock(int entry)
+{
+    if (prefetched[entry]) {
+        // Nothing ever used this prefetch
+        unusedPrefetches++;
+        prefetched[entry] = 0;
+    }
+
+    // Invalidate this entry and give its frame back
+    valid[entry] = 0;
+    sectorValid[entry] = 0;
+    sectorDirty[entry] = 0;
+    writable[entry] = 0;
+    freeFrames.push_back(frames[entry]);
+    frames[entry] = -1;
+    if (compressedStore) {
+        compressedStore->clear(entry);
+    }
+}
+
+const uint8_t *
+SimpleCache::readBlockData(int entry) const
+{
+    if (!compressedStore) {
+        return &dataArena[frames[entry] * blockSize];
+    }
+    compressedStore->read(entry, blockScratch.data());
+    return blockScratch.data();
+}
+
+void
+SimpleCache::blockWritten(int entry)
+{
+    if (compressedStore) {
+        compressedWrites[compressedStore->write(entry, blockScratch.data())]++;
+    }
+}
+
+double
+SimpleCache::dataCompressionRatio() const
+{
+    if (!compressedStore) {
+        return 1;
+    }
+    size_t valid_bytes = std::count(valid.begin(), valid.end(), 1) *
+                         blockSize;
+    // Count at least one byte so that a cache of zero blocks is finite
+    return double(valid_bytes) /
+           std::max<size_t>(compressedStore->compressedBytes(), 1);
+}
+
+double
+SimpleCache::hostBytesSavedByCompression() const
+{
+    if (!compressedStore) {
+        return 0;
+    }
+    return double(capacity) * blockSize - compressedStore->hostFootprint() -
+           blockScratch.capacity();
+}
+
+int
+SimpleCache::findBlock(Addr addr) const
+{
+    Addr tag = extractTag(addr);
+    unsigned first = extractSet(addr) * assoc;
+    for (unsigned entry = first; entry < first + assoc; entry++) {
+        if (valid[entry] && tags[entry] == tag) {
+            return entry;
+        }
+    }
+    return -1;
+}
+
+int
+SimpleCache::findVictim(Addr addr)
+{
+    unsigned set = extractSet(addr);
+    unsigned first = set * assoc;
+
+    // Use an empty way if there is one
+    for (unsigned entry = first; entry < first + assoc; entry++) {
+        if (!valid[entry]) {
+            return entry;
+        }
+    }
+
+    // Otherwise let the replacement policy decide.
+    unsigned way = replPolicy->getVictim(set);
+    assert(way < assoc);
+    return first + way;
+}
+
+size_t
+SimpleCache::hostMemoryFootprint() const
+{
+    return dataArena.capacity() +
+           (compressedStore ? compressedStore->hostFootprint() +
+                              blockScratch.capacity() : 0) +
+           frames.capacity() * sizeof(int) +
+           freeFrames.capacity() * sizeof(int) +
+           tags.capacity() * sizeof(Addr) +
+           valid.capacity() + prefetched.capacity() + writable.capacity() +
+           (sectorValid.capacity() + sectorDirty.capacity()) *
+               sizeof(uint64_t) +
+           mshrs.capacity() * (sizeof(MSHR) +
+                               tgtsPerMSHR * sizeof(MSHR::Target)) +
+           victimBuffer.size() * (sizeof(VictimEntry) + blockSize) +
+           victimSwap.capacity();
+}
+
+AddrRangeList
+SimpleCache::getAddrRanges() const
+{
+    DPRINTF(SimpleCache, "Sending new ranges\n");
+    // Just use the same ranges as whatever is on the memory side.
+    return memPort.getAddrRanges();
+}
+
+void
+SimpleCache::sendRangeChange() const
+{
+    for (auto& port : cpuPorts) {
+        port.sendRangeChange();
+    }
+}
+
+void
+SimpleCache::regStats()
+{
+    // If you don't do this you get errors about uninitialized stats.
+    MemObject::regStats();
+
+    hits.name(name() + ".hits")
+        .desc("Number of hits")
+        ;
+
+    misses.name(name() + ".misses")
+        .desc("Number of misses")
+        ;
+
+    missLatency.name(name() + ".missLatency")
+        .desc("Ticks for misses to the cache")
+        .init(16) // number of buckets
+        ;
 
     hitRatio.name(name() + ".hitRatio")
         .desc("The ratio of hits to the total accesses to the cache")
@@ -440,8 +2506,421 @@ SimpleCache::regStats()
 
     hitRatio = hits / (hits + misses);
 
+    mshrOccupancy.name(name() + ".mshrOccupancy")
+        .desc("Average number of MSHRs in use")
+        ;
+
+    mergedTargets.name(name() + ".mergedTargets")
+        .desc("Number of misses merged onto an outstanding MSHR")
+        ;
+
+    mshrStalls.name(name() + ".mshrStalls")
+        .desc("Number of misses that waited for a free MSHR or target")
+        ;
+
+    cleanEvictions.name(name() + ".cleanEvictions")
+        .desc("Number of clean blocks evicted")
+        ;
+
+    dirtyEvictions.name(name() + ".dirtyEvictions")
+        .desc("Number of dirty blocks evicted")
+        ;
+
+    writebackBytes.name(name() + ".writebackBytes")
+        .desc("Bytes of dirty data written back to memory")
+        ;
+
+    splitAccesses.name(name() + ".splitAccesses")
+        .desc("Number of accesses split because they span multiple blocks")
+        ;
+
+    sectorMisses.name(name() + ".sectorMisses")
+        .desc("Number of misses to a block in the cache with missing sectors")
+        ;
+
+    noFetchWrites.name(name() + ".noFetchWrites")
+        .desc("Number of writes to missing sectors that didn't need a fetch")
+        ;
+
+    partialWritebacks.name(name() + ".partialWritebacks")
+        .desc("Number of writebacks (or buffered stores) of only part of a "
+              "block")
+        ;
+
+    fetchedBytes.name(name() + ".fetchedBytes")
+        .desc("Bytes fetched from memory for misses and prefetches")
+        ;
+
+    prefetchesIssued.name(name() + ".prefetchesIssued")
+        .desc("Number of prefetches sent to memory")
+        ;
+
+    usefulPrefetches.name(name() + ".usefulPrefetches")
+        .desc("Number of prefetched blocks that were hit before eviction")
+        ;
+
+    latePrefetches.name(name() + ".latePrefetches")
+        .desc("Number of demand misses to a block that was being prefetched")
+        ;
+
+    unusedPrefetches.name(name() + ".unusedPrefetches")
+        .desc("Number of prefetched blocks evicted without being used")
+        ;
+
+    prefetchAccuracy.name(name() + ".prefetchAccuracy")
+        .desc("Fraction of prefetches that were used (including late ones)")
+        ;
+
+    prefetchAccuracy = (usefulPrefetches + latePrefetches) / prefetchesIssued;
+
+    prefetchCoverage.name(name() + ".prefetchCoverage")
+        .desc("Fraction of would-be misses that a prefetch turned into hits")
+        ;
+
+    prefetchCoverage = usefulPrefetches / (usefulPrefetches + misses);
+
+    writeBufferHits.name(name() + ".writeBufferHits")
+        .desc("Number of accesses served from the write buffer")
+        ;
+
+    writeBufferMerges.name(name() + ".writeBufferMerges")
+        .desc("Number of writes combined into a queued writeback or stores")
+        ;
+
+    writeBufferFullStalls.name(name() + ".writeBufferFullStalls")
+        .desc("Number of fills and writes stalled because the write buffer "
+              "was full")
+        ;
+
+    writeThroughs.name(name() + ".writeThroughs")
+        .desc("Number of writes sent on to memory by the write-through "
+              "policy")
+        ;
+
+    uncachedWrites.name(name() + ".uncachedWrites")
+        .desc("Number of write misses sent around the cache (no allocate)")
+        ;
+
+    snoopHits.name(name() + ".snoopHits")
+        .desc("Number of snoops for a block in the cache or write buffer")
+        ;
+
+    snoopDataResponses.name(name() + ".snoopDataResponses")
+        .desc("Number of snoops this cache supplied the data for")
+        ;
+
+    snoopInvalidations.name(name() + ".snoopInvalidations")
+        .desc("Number of blocks invalidated by snoops")
+        ;
+
+    deferredSnoops.name(name() + ".deferredSnoops")
+        .desc("Number of snoops that waited for this cache's fill to "
+              "return")
+        ;
+
+    upgradeMisses.name(name() + ".upgradeMisses")
+        .desc("Number of writes to a block that other caches may share")
+        ;
+
+    victimHits.name(name() + ".victimHits")
+        .desc("Number of blocks swapped back in from the victim buffer")
+        ;
+
+    victimsInserted.name(name() + ".victimsInserted")
+        .desc("Number of evicted blocks moved to the victim buffer")
+        ;
+
+    victimsSpilled.name(name() + ".victimsSpilled")
+        .desc("Number of blocks spilled from the victim buffer to memory")
+        ;
+
+    hostMemory.name(name() + ".hostMemory")
+        .desc("Bytes of host memory used for tags and data")
+        .method(this, &SimpleCache::hostMemoryFootprint)
+        ;
+
+    compressionRatio.name(name() + ".compressionRatio")
+        .desc("Uncompressed size of the valid blocks over their compressed "
+              "size")
+        .method(this, &SimpleCache::dataCompressionRatio)
+        ;
+
+    compressionBytesSaved.name(name() + ".compressionBytesSaved")
+        .desc("Bytes of host memory saved by compressing the data")
+        .method(this, &SimpleCache::hostBytesSavedByCompression)
+        ;
+
+    compressedWrites.name(name() + ".compressedWrites")
+        .desc("Number of blocks compressed with each encoding")
+        .init(SimpleCompressedStore::NumEncodings)
+        ;
+
+    for (unsigned e = 0; e < SimpleCompressedStore::NumEncodings; e++) {
+        compressedWrites.subname(e, SimpleCompressedStore::encodingName(
+            SimpleCompressedStore::Encoding(e)));
+    }
+
+    portServed.name(name() + ".portServed")
+        .desc("Number of requests granted by the arbiter for each CPU port")
+        .init(cpuPorts.size())
+        ;
+
+    portRetries.name(name() + ".portRetries")
+        .desc("Number of requests refused because the port queue was full")
+        .init(cpuPorts.size())
+        ;
+
+    portQueueTicks.name(name() + ".portQueueTicks")
+        .desc("Total ticks requests waited in each CPU port queue")
+        .init(cpuPorts.size())
+        ;
+
+    portQueueDelay.name(name() + ".portQueueDelay")
+        .desc("Average ticks a request waited in each CPU port queue")
+        ;
+
+    portQueueDelay = portQueueTicks / portServed;
+
+    for (unsigned i = 0; i < cpuPorts.size(); i++) {
+        std::string port_name = csprintf("cpu_side%d", i);
+        portServed.subname(i, port_name);
+        portRetries.subname(i, port_name);
+        portQueueTicks.subname(i, port_name);
+        portQueueDelay.subname(i, port_name);
+    }
+
+    bankAccesses.name(name() + ".bankAccesses")
+        .desc("Number of requests granted to each bank")
+        .init(numBanks)
+        ;
+
+    bankConflicts.name(name() + ".bankConflicts")
+        .desc("Number of times a request waited because its bank was busy")
+        .init(numBanks)
+        ;
+
+    poolHits.name(name() + ".poolHits")
+        .desc("Number of events, requests and packets reused from a pool")
+        .init(NumPoolTypes)
+        .subname(EventPool, "events")
+        .subname(RequestPool, "requests")
+        .subname(PacketPool, "packets")
+        ;
+
+    poolAllocs.name(name() + ".poolAllocs")
+        .desc("Number of events, requests and packets that had to be "
+              "allocated on the heap")
+        .init(NumPoolTypes)
+        .subname(EventPool, "events")
+        .subname(RequestPool, "requests")
+        .subname(PacketPool, "packets")
+        ;
+
+}
+
+
+void
+SimpleCache::startup()
+{
+    MemObject::startup();
+    updateWarming();
 }
 
+void
+SimpleCache::drainResume()
+{
+    MemObject::drainResume();
+    updateWarming();
+
+    // Pick up where we left off with any queued prefetches
+    issuePrefetches();
+}
+
+DrainState
+SimpleCache::drain()
+{
+    // Don't hold any stores back for combining
+    if (writeCombineEvent.scheduled()) {
+        deschedule(writeCombineEvent);
+    }
+    if (!writeBuffer.empty()) {
+        writeBuffer.back().open = false;
+        drainWriteBuffer();
+    }
+
+    // Victims aren't saved in checkpoints, so write them back now
+    spillVictimBuffer();
+
+    if (isDrained()) {
+        return DrainState::Drained;
+    }
+
+    DPRINTF(Drain, "SimpleCache not drained. %d MSHRs, %d writebacks\n",
+            allocatedMSHRs, writeBuffer.size());
+    return DrainState::Draining;
+}
+
+void
+SimpleCache::serialize(CheckpointOut &cp) const
+{
+    std::string filename = name() + ".cache";
+    std::string filepath = CheckpointIn::dir() + "/" + filename;
+
+    CheckpointHeader header;
+    header.magic = checkpointMagic;
+    header.version = checkpointVersion;
+    header.blockSize = blockSize;
+    header.capacity = capacity;
+    header.assoc = assoc;
+    header.sectors = numSectors;
+    header.padding = 0;
+    // When only warming the tags, memory has the only good copy of the data
+    header.hasData = !warming;
+    header.validBlocks = std::count(valid.begin(), valid.end(), 1);
+
+    std::ofstream out(filepath, std::ios::out | std::ios::binary);
+    fatal_if(!out, "Can't open SimpleCache checkpoint file %s", filepath);
+
+    out.write((const char*)&header, sizeof(header));
+    out.write((const char*)tags.data(), capacity * sizeof(Addr));
+    out.write((const char*)valid.data(), capacity);
+    out.write((const char*)sectorValid.data(), capacity * sizeof(uint64_t));
+    out.write((const char*)sectorDirty.data(), capacity * sizeof(uint64_t));
+    if (header.hasData) {
+        for (unsigned entry = 0; entry < capacity; entry++) {
+            if (valid[entry]) {
+                out.write((const char*)readBlockData(entry), blockSize);
+            }
+        }
+    }
+    fatal_if(!out, "Error writing SimpleCache checkpoint file %s", filepath);
+
+    SERIALIZE_SCALAR(filename);
+
+    // Also record the geometry with the checkpoint itself so that it can be
+    // checked before the cache file is read.
+    unsigned block_size = blockSize;
+    unsigned num_blocks = capacity;
+    unsigned ways = assoc;
+    unsigned sectors = numSectors;
+    bool compressed = compressedStore != nullptr;
+    SERIALIZE_SCALAR(block_size);
+    SERIALIZE_SCALAR(num_blocks);
+    SERIALIZE_SCALAR(ways);
+    SERIALIZE_SCALAR(sectors);
+    SERIALIZE_SCALAR(compressed);
+}
+
+void
+SimpleCache::unserialize(CheckpointIn &cp)
+{
+    unsigned block_size;
+    unsigned num_blocks;
+    unsigned ways;
+    unsigned sectors;
+    bool compressed;
+    UNSERIALIZE_SCALAR(block_size);
+    UNSERIALIZE_SCALAR(num_blocks);
+    UNSERIALIZE_SCALAR(ways);
+    UNSERIALIZE_SCALAR(sectors);
+    UNSERIALIZE_SCALAR(compressed);
+    fatal_if(block_size != blockSize || num_blocks != capacity ||
+             ways != assoc || sectors != numSectors ||
+             compressed != (compressedStore != nullptr),
+             "SimpleCache %s checkpoint geometry (%d blocks of %d bytes, "
+             "%d-way, %d sectors, %scompressed) doesn't match the cache's "
+             "parameters", name(), num_blocks, block_size, ways, sectors,
+             compressed ? "" : "not ");
+
+    std::string filename;
+    UNSERIALIZE_SCALAR(filename);
+    std::string filepath = cp.getCptDir() + "/" + filename;
+
+    int fd = open(filepath.c_str(), O_RDONLY);
+    fatal_if(fd < 0, "Can't open SimpleCache checkpoint file %s", filepath);
+
+    struct stat file_stat;
+    fatal_if(fstat(fd, &file_stat) < 0, "Can't stat %s", filepath);
+    size_t file_size = file_stat.st_size;
+    fatal_if(file_size < sizeof(CheckpointHeader),
+             "SimpleCache checkpoint file %s is truncated", filepath);
+
+    const uint8_t *file = (const uint8_t*)mmap(nullptr, file_size, PROT_READ,
+                                               MAP_PRIVATE, fd, 0);
+    close(fd);
+    fatal_if(file == MAP_FAILED, "Can't mmap %s", filepath);
+
+    CheckpointHeader header;
+    std::memcpy(&header, file, sizeof(header));
+    fatal_if(header.magic != checkpointMagic ||
+             header.version != checkpointVersion,
+             "%s is not a version %d SimpleCache checkpoint", filepath,
+             checkpointVersion);
+    fatal_if(header.blockSize != blockSize || header.capacity != capacity ||
+             header.assoc != assoc || header.sectors != numSectors,
+             "SimpleCache checkpoint geometry (%d blocks of %d bytes, %d-way, "
+             "%d sectors) doesn't match this cache", header.capacity,
+             header.blockSize, header.assoc, header.sectors);
+    // The snoop filter starts out empty after a restore, so it would never
+    // send us snoops for the blocks in the checkpoint.
+    fatal_if(coherent && header.validBlocks != 0,
+             "Can't restore %d blocks into coherent SimpleCache %s. The "
+             "snoop filter doesn't know about them", header.validBlocks,
+             name());
+
+    size_t expected_size = sizeof(header) +
+        capacity * (sizeof(Addr) + 1 + 2 * sizeof(uint64_t));
+    if (header.hasData) {
+        expected_size += header.validBlocks * blockSize;
+    }
+    fatal_if(file_size != expected_size,
+             "SimpleCache checkpoint file %s is %d bytes, expected %d",
+             filepath, file_size, expected_size);
+
+    const uint8_t *ptr = file + sizeof(header);
+    std::memcpy(tags.data(), ptr, capacity * sizeof(Addr));
+    ptr += capacity * sizeof(Addr);
+    std::memcpy(valid.data(), ptr, capacity);
+    ptr += capacity;
+    std::memcpy(sectorValid.data(), ptr, capacity * sizeof(uint64_t));
+    ptr += capacity * sizeof(uint64_t);
+    std::memcpy(sectorDirty.data(), ptr, capacity * sizeof(uint64_t));
+    ptr += capacity * sizeof(uint64_t);
+
+    // Hand out the frames again from scratch
+    freeFrames.clear();
+    for (int frame = capacity - 1; frame >= 0; frame--) {
+        freeFrames.push_back(frame);
+    }
+    std::fill(frames.begin(), frames.end(), -1);
+    std::fill(prefetched.begin(), prefetched.end(), 0);
+    std::fill(writable.begin(), writable.end(), 0);
+
+    for (unsigned entry = 0; entry < capacity; entry++) {
+        if (compressedStore) {
+            // Start from zeros like a newly inserted block
+            compressedStore->clear(entry);
+        }
+        if (!valid[entry]) {
+            continue;
+        }
+        frames[entry] = freeFrames.back();
+        freeFrames.pop_back();
+        replPolicy->insert(entry / assoc, entry % assoc);
+
+        if (header.hasData) {
+            std::memcpy(getBlockData(entry), ptr, blockSize);
+            blockWritten(entry);
+            ptr += blockSize;
+        }
+    }
+
+    munmap((void*)file, file_size);
+
+    // Without data, act as if we were warming. Then the data is read from
+    // memory at startup unless we are still warming.
+    warming = !header.hasData;
+}
 
 SimpleCache*
 SimpleCacheParams::create()
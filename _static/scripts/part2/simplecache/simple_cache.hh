@@ -31,17 +31,59 @@
 #ifndef __LEARNING_GEM5_SIMPLE_CACHE_SIMPLE_CACHE_HH__
 #define __LEARNING_GEM5_SIMPLE_CACHE_SIMPLE_CACHE_HH__
 
-#include <unordered_map>
+#include <deque>
+#include <memory>
+#include <vector>
 
+#include "base/intmath.hh"
+#include "learning_gem5/simple_cache/compressed_store.hh"
+#include "learning_gem5/simple_cache/replacement_policies.hh"
+#include "learning_gem5/simple_cache/simple_prefetcher.hh"
 #include "mem/mem_object.hh"
 #include "params/SimpleCache.hh"
 
 /**
- * A very simple cache object. Has a fully-associative data store with random
- * replacement.
- * This cache is fully blocking (not non-blocking). Only a single request can
- * be outstanding at a time.
- * This cache is a writeback cache.
+ * A very simple cache object. Has a set-associative data store with a
+ * configurable replacement policy (see replacement_policies.hh).
+ * This cache is non-blocking. Each miss allocates an MSHR and hits can be
+ * serviced while misses are outstanding. Secondary misses to a block that is
+ * already being fetched are merged onto the existing MSHR.
+ * By default, this cache is a writeback cache. Only dirty blocks are written
+ * back. Clean blocks are dropped or, optionally, announced with a CleanEvict.
+ * It can instead be write-through and/or write-no-allocate. Then stores go
+ * to memory through the write buffer, where stores to the same block are
+ * combined while they wait.
+ * Evictions wait in a bounded write buffer until the memory side is free.
+ * Optionally, evicted blocks first go to a small fully-associative victim
+ * buffer. A miss that finds its block there swaps it back into the cache
+ * instead of going to memory. The oldest victim is spilled to the write
+ * buffer to make room.
+ * Accesses to a block that is still in the write buffer are served from it.
+ * Accesses that span multiple blocks are split into one access per block.
+ * Blocks can optionally be split into sectors, each with its own valid and
+ * dirty bits. Then misses only fetch the sectors they need, writes of whole
+ * sectors don't fetch anything, and only dirty sectors are written back.
+ * Each CPU-side port has a small queue of requests. A round-robin arbiter
+ * picks queued requests so that no port can starve the others.
+ * The cache is split into address-interleaved banks. Each bank can start one
+ * access per cycle, so requests to different banks proceed concurrently.
+ * An optional prefetcher (see simple_prefetcher.hh) issues prefetches when
+ * the memory side is idle and there are spare MSHRs.
+ * The AccessEvents, requests and packets that the cache creates itself are
+ * recycled through small pools to keep malloc off the common paths.
+ * The tags and data can be saved in a checkpoint. They are written to a
+ * separate binary file next to the checkpoint, which is mmapped on restore.
+ * In atomic mode, the cache can optionally only keep its tags warm (see the
+ * warm_tags_only parameter). Then, memory always has the up-to-date data and
+ * the block data is read back in when the system switches to timing mode.
+ * The data can optionally be stored compressed (see compressed_store.hh).
+ * Then host memory grows with the compressed size of the data instead of
+ * the capacity of the cache, and blocks are decompressed on each access.
+ * With the coherent parameter, the cache snoops the crossbar on its memory
+ * side so that several private SimpleCaches (e.g., one per CPU) stay
+ * coherent. Blocks are Modified, Owned, Exclusive, Shared or Invalid like in
+ * gem5's classic caches. The crossbar must be the point of ordering. Express
+ * snoops from caches below this one are not supported.
  */
 class SimpleCache : public MemObject
 {
@@ -63,18 +105,54 @@ class SimpleCache : public MemObject
         /// True if the port needs to send a retry req.
         bool needRetry;
 
-        /// If we tried to send a packet and it was blocked, store it here
-        PacketPtr blockedPacket;
+        /// Responses that we tried to send but were blocked, in order
+        std::deque<PacketPtr> blockedPackets;
+
+      public:
+        /// A request waiting for the arbiter
+        struct QueuedRequest
+        {
+            PacketPtr pkt;
+            /// When the request arrived at this port
+            Tick arrival;
+        };
+
+      private:
+        /// Requests that have been accepted but not yet granted, in order
+        std::deque<QueuedRequest> requestQueue;
+
+        /// Maximum number of requests in requestQueue
+        const unsigned queueDepth;
 
       public:
         /**
          * Constructor. Just calls the superclass constructor.
          */
-        CPUSidePort(const std::string& name, int id, SimpleCache *owner) :
+        CPUSidePort(const std::string& name, int id, SimpleCache *owner,
+                    unsigned queue_depth) :
             SlavePort(name, owner), id(id), owner(owner), needRetry(false),
-            blockedPacket(nullptr)
+            queueDepth(queue_depth)
         { }
 
+        /// @return true if there is a request waiting for the arbiter
+        bool hasRequest() const { return !requestQueue.empty(); }
+
+        /// @return the oldest queued request. There must be one.
+        const QueuedRequest& peekRequest() const
+        { return requestQueue.front(); }
+
+        /// @return true if there are no queued requests or responses
+        bool isIdle() const
+        { return requestQueue.empty() && blockedPackets.empty(); }
+
+        /**
+         * Remove the oldest queued request. There must be one. Sends a
+         * retry to the peer if it was waiting for room in the queue.
+         *
+         * @return the request and when it arrived
+         */
+        QueuedRequest popRequest();
+
         /**
          * Send a packet across this port. This is called by the owner and
          * all of the flow control is hanled in this function.
@@ -94,18 +172,20 @@ class SimpleCache : public MemObject
         AddrRangeList getAddrRanges() const override;
 
         /**
-         * Send a retry to the peer port only if it is needed. This is called
-         * from the SimpleCache whenever it is unblocked.
+         * Send a retry to the peer port only if it is needed and there is
+         * room in the request queue.
          */
         void trySendRetry();
 
       protected:
         /**
          * Receive an atomic request packet from the master port.
-         * No need to implement in this simple cache.
+         * Just forwards to the cache.
+         *
+         * @param packet the requestor sent.
+         * @return an estimate of the latency of this access
          */
-        Tick recvAtomic(PacketPtr pkt) override
-        { panic("recvAtomic unimpl."); }
+        Tick recvAtomic(PacketPtr pkt) override;
 
         /**
          * Receive a functional request packet from the master port.
@@ -143,15 +223,22 @@ class SimpleCache : public MemObject
         /// The object that owns this object (SimpleCache)
         SimpleCache *owner;
 
-        /// If we tried to send a packet and it was blocked, store it here
-        PacketPtr blockedPacket;
+        /// Requests that we tried to send but were blocked, in order
+        std::deque<PacketPtr> blockedPackets;
+
+        /// True if the peer refused a request and will send a retry. A snoop
+        /// can remove blocked packets, so blockedPackets may be empty.
+        bool needRetry;
+
+        /// Snoop responses that we tried to send but were blocked, in order
+        std::deque<PacketPtr> blockedSnoopResps;
 
       public:
         /**
          * Constructor. Just calls the superclass constructor.
          */
         MemSidePort(const std::string& name, SimpleCache *owner) :
-            MasterPort(name, owner), owner(owner), blockedPacket(nullptr)
+            MasterPort(name, owner), owner(owner), needRetry(false)
         { }
 
         /**
@@ -163,6 +250,41 @@ class SimpleCache : public MemObject
          */
         void sendPacket(PacketPtr pkt);
 
+        /**
+         * @return true if there are packets waiting for a retry
+         */
+        bool isBlocked() const
+        { return needRetry || !blockedPackets.empty(); }
+
+        /**
+         * Send a snoop response across this port, or queue it until the
+         * peer can take it.
+         *
+         * @param the snoop response to send
+         */
+        void sendSnoopResp(PacketPtr pkt);
+
+        /// @return true if there are snoop responses waiting for a retry
+        bool hasBlockedSnoopResps() const
+        { return !blockedSnoopResps.empty(); }
+
+        /**
+         * Find an eviction (WritebackDirty or CleanEvict) for a block that
+         * is waiting for a retry. The rest of the system hasn't seen it yet.
+         *
+         * @param the block address
+         * @return the eviction or nullptr if there is none
+         */
+        PacketPtr findBlockedEviction(Addr block_addr) const;
+
+        /**
+         * Remove a packet that is waiting for a retry. The caller owns the
+         * packet again.
+         *
+         * @param the packet. It must be blocked.
+         */
+        void removeBlocked(PacketPtr pkt);
+
       protected:
         /**
          * Receive a timing response from the slave port.
@@ -176,6 +298,42 @@ class SimpleCache : public MemObject
          */
         void recvReqRetry() override;
 
+        /**
+         * Receive a timing snoop request from the crossbar. Only happens in
+         * coherent mode. Just forwards to the cache.
+         *
+         * @param the snoop
+         */
+        void recvTimingSnoopReq(PacketPtr pkt) override;
+
+        /**
+         * Receive an atomic snoop request from the crossbar. Only happens in
+         * coherent mode. Just forwards to the cache.
+         *
+         * @param the snoop
+         * @return the latency of the snoop lookup
+         */
+        Tick recvAtomicSnoop(PacketPtr pkt) override;
+
+        /**
+         * Receive a functional snoop request from the crossbar. Just
+         * forwards to the cache.
+         *
+         * @param the snoop
+         */
+        void recvFunctionalSnoop(PacketPtr pkt) override;
+
+        /**
+         * Called by the crossbar when it can take a snoop response that it
+         * refused before.
+         */
+        void recvRetrySnoopResp() override;
+
+        /**
+         * @return true in coherent mode so that the crossbar sends us snoops
+         */
+        bool isSnooping() const override;
+
         /**
          * Called to receive an address range change from the peer slave
          * port. The default implementation ignores the change and does
@@ -187,15 +345,31 @@ class SimpleCache : public MemObject
     };
 
     /**
-     * Handle the request from the CPU side. Called from the CPU port
-     * on a timing request.
+     * Handle a request from the CPU side. Called by the arbiter once the
+     * request has been granted. Schedules the access after the cache
+     * latency.
      *
      * @param requesting packet
      * @param id of the port to send the response
-     * @return true if we can handle the request this cycle, false if the
-     *         requestor needs to retry later
      */
-    bool handleRequest(PacketPtr pkt, int port_id);
+    void handleRequest(PacketPtr pkt, int port_id);
+
+    /**
+     * Make sure the arbiter runs on the next cycle it is allowed to if any
+     * port has a queued request and the cache can take it.
+     */
+    void scheduleArbitration();
+
+    /**
+     * Grant queued requests, choosing between the ports round-robin. Each
+     * bank takes at most one request per cycle and each port gets at most
+     * one grant per cycle. Called from arbitrateEvent.
+     */
+    void arbitrate();
+
+    /// @return the bank that holds the block for an address
+    unsigned extractBank(Addr addr) const
+    { return (addr >> setShift) & (numBanks - 1); }
 
     /**
      * Handle the response from the memory side. Called from the memory port
@@ -210,12 +384,12 @@ class SimpleCache : public MemObject
     /**
      * Send the packet to the CPU side.
      * This function assumes the pkt is already a response packet and forwards
-     * it to the correct port. This function also unblocks this object and
-     * cleans up the whole request.
+     * it to the correct port.
      *
      * @param the packet to send to the cpu side
+     * @param id of the port to send the response
      */
-    void sendResponse(PacketPtr pkt);
+    void sendResponse(PacketPtr pkt, int port_id);
 
     /**
      * Handle a packet functionally. Update the data on a write and get the
@@ -225,27 +399,645 @@ class SimpleCache : public MemObject
      */
     void handleFunctional(PacketPtr pkt);
 
+    /**
+     * Handle an atomic access. Updates the tags (and data) and sends the
+     * fill for a miss to memory with an atomic access.
+     *
+     * @param packet to handle
+     * @return the estimated latency of the access
+     */
+    Tick handleAtomic(PacketPtr pkt);
+
+    /**
+     * Handle an atomic access when only warming the tags. Updates the tag
+     * and replacement state as if the access happened, then sends the
+     * original packet on to memory which holds all of the data. Since
+     * memory always has the data, blocks are never dirty while warming and
+     * the victim buffer isn't used.
+     *
+     * @param packet to handle
+     * @return the estimated latency of the access
+     */
+    Tick handleAtomicWarming(PacketPtr pkt);
+
+    /**
+     * Write back all of the dirty data in the cache (and the victim buffer)
+     * with functional accesses and mark it clean. The victim buffer is
+     * emptied. Used before entering the tag-only warming mode.
+     */
+    void functionalWritebackAll();
+
+    /**
+     * Write the dirty sectors of a block to memory with functional accesses.
+     *
+     * @param the address of the block
+     * @param the block's data
+     * @param the mask of dirty sectors
+     */
+    void functionalWriteback(Addr block_addr, const uint8_t *data,
+                             uint64_t dirty);
+
+    /**
+     * Read the data for every valid block from memory with functional
+     * accesses. Used when leaving the tag-only warming mode since the data
+     * array was not kept up to date.
+     */
+    void functionalRefillAll();
+
+    /**
+     * Enter or leave the tag-only warming mode depending on the current
+     * memory mode of the system.
+     */
+    void updateWarming();
+
     /**
      * Access the cache for a timing access. This is called after the cache
      * access latency has already elapsed.
+     *
+     * @param the packet to access the cache with
+     * @param id of the port to send the response
+     */
+    void accessTiming(PacketPtr pkt, int port_id);
+
+    /**
+     * Handle a timing miss. Either merges the packet onto an existing MSHR
+     * for the block or allocates a new MSHR and sends a fill to memory.
+     *
+     * @param the packet that missed
+     * @param id of the port to send the response
+     * @return false if there is no MSHR or target available for this miss
+     */
+    bool handleMiss(PacketPtr pkt, int port_id);
+
+    /**
+     * Retry the accesses that stalled because there were no free MSHRs or
+     * targets. Called whenever an MSHR is freed.
+     */
+    void retryStalledAccesses();
+
+    /**
+     * Called when the memory side accepts a request. In coherent mode, the
+     * crossbar has ordered a fill with the other caches' requests once it
+     * is accepted, so snoops for the block that come after this are for
+     * requests that are ordered after the fill.
+     *
+     * @param the request that was sent
+     */
+    void requestSent(PacketPtr pkt);
+
+    /**
+     * Handle a snoop for another cache's request (coherent mode). Supplies
+     * the data if we have the only up-to-date copy of the block and
+     * invalidates or downgrades our copy. If our fill for the block is
+     * already ordered, the snoop is dealt with when the fill returns.
+     *
+     * @param the snoop
+     * @param true for a timing snoop, false for an atomic one
+     */
+    void handleSnoop(PacketPtr pkt, bool timing);
+
+    /**
+     * Handle a snoop for an eviction of ours that is waiting in the write
+     * buffer or for a retry. A WritebackDirty still holds the only
+     * up-to-date copy of the block, so it supplies the data.
+     *
+     * @param the snoop
+     * @param the eviction for the same block
+     * @param true for a timing snoop, false for an atomic one
+     * @return true if the eviction must be dropped since the snooper is
+     *         taking over the block
+     */
+    bool snoopEviction(PacketPtr pkt, PacketPtr eviction, bool timing);
+
+    /**
+     * Handle a functional snoop. Writes update our copies of the block and
+     * reads get our data if it is newer than memory's.
+     *
+     * @param the functional access
+     */
+    void handleFunctionalSnoop(PacketPtr pkt);
+
+    /**
+     * Answer a snoop with a block's data. The snoop must already be marked
+     * as having a cache respond. In timing mode the response is a copy of
+     * the snoop, which is sent after the cache latency.
+     *
+     * @param the snoop
+     * @param the block's data
+     * @param true for a timing snoop, false for an atomic one
+     */
+    void supplySnoopData(PacketPtr pkt, const uint8_t *data, bool timing);
+
+    /**
+     * Respond to a snoop that was deferred until our fill returned. Then
+     * our copy is downgraded or invalidated.
+     *
+     * @param the copy of the snoop made when it was deferred. It is turned
+     *        into the response.
+     */
+    void respondDeferredSnoop(PacketPtr snoop);
+
+    /**
+     * Queue a snoop response to be sent after the cache latency.
+     *
+     * @param the response
+     */
+    void queueSnoopResp(PacketPtr pkt);
+
+    /**
+     * Send the queued snoop responses that are ready. Called from
+     * snoopRespEvent.
+     */
+    void sendSnoopResponses();
+
+    /// @return true if the access must have a writable copy of the block
+    ///         (coherent mode only). Locked reads are about to write.
+    bool needsWritableCopy(PacketPtr pkt) const
+    { return coherent && (pkt->isWrite() || pkt->req->isLockedRMW()); }
+
+    /**
+     * @return true if this cache cannot accept any new requests right now
+     */
+    bool isBlocked() const;
+
+    /// @return true if the packet touches more than one cache block
+    bool spansBlocks(PacketPtr pkt) const
+    { return pkt->getAddr() - pkt->getBlockAddr(blockSize) + pkt->getSize() >
+             blockSize; }
+
+    /**
+     * Split a packet that spans multiple blocks into one packet per block.
+     * The new packets point to the original packet's data, so the data
+     * doesn't need to be copied back when they complete. The caller owns
+     * the new packets.
+     *
+     * @param the packet to split
+     * @return a packet for each block, in address order
+     */
+    std::vector<PacketPtr> splitPacket(PacketPtr pkt);
+
+    /**
+     * Tracks the pieces of a timing request that was split because it
+     * spans multiple blocks. Every piece's senderState points to the same
+     * SplitState.
+     */
+    struct SplitState : public Packet::SenderState
+    {
+        /// The original request packet
+        PacketPtr parent;
+
+        /// The port to send the response to
+        int portId;
+
+        /// Number of pieces that still need to complete
+        unsigned outstanding;
+
+        SplitState(PacketPtr parent, int port_id, unsigned outstanding) :
+            parent(parent), portId(port_id), outstanding(outstanding)
+        { }
+    };
+
+    /**
+     * An eviction waiting in the write buffer. With the write-through or
+     * write-no-allocate policies, an entry can also hold stores to a block
+     * that are on their way to memory.
+     */
+    struct WriteBufferEntry
+    {
+        /// A block-sized WritebackDirty, CleanEvict, or WriteReq for stores
+        PacketPtr pkt;
+
+        /// The bytes of the block to write. Empty for a CleanEvict.
+        std::vector<bool> dirtyBytes;
+
+        /// True while the entry is held back so that more stores to the
+        /// block can be combined into it. Only the newest entry is open.
+        bool open;
+    };
+
+    /**
+     * Send a writeback to memory. If only some of the block has data to
+     * write, each run of bytes is sent as a separate WriteReq.
+     *
+     * @param the writeback. The cache is done with it after this call.
+     * @param true to send it with an atomic access, false for timing
+     */
+    void sendWriteback(const WriteBufferEntry &wb, bool atomic);
+
+    /**
+     * Try to satisfy an access from a block that is waiting in the write
+     * buffer. Reads get their data from the buffered block and writes are
+     * merged into it. A queued CleanEvict for the block is dropped since the
+     * block is about to be fetched again. If the buffered block doesn't have
+     * all of the data for a read, it is sent to memory right away so that
+     * it gets there before the fill.
+     *
+     * @param the packet that missed in the cache
+     * @return true if the access was satisfied by the write buffer
+     */
+    bool accessWriteBuffer(PacketPtr pkt);
+
+    /**
+     * Send as many writebacks from the write buffer as the memory side can
+     * take right now. Demand misses are never stuck behind more than one
+     * writeback. An open entry stays until it is closed.
+     */
+    void drainWriteBuffer();
+
+    /**
+     * Add an entry to the back of the write buffer and send whatever the
+     * memory side can take. The entry that was open is closed.
+     *
+     * @param the new entry
      */
-    void accessTiming(PacketPtr pkt);
+    void pushWriteBuffer(WriteBufferEntry &&wb);
 
+    /**
+     * Send everything in the write buffer for a block to memory right away.
+     * Used before a fill so that memory has the newest data.
+     *
+     * @param the block address
+     */
+    void flushWriteBuffer(Addr block_addr);
+
+    /**
+     * Copy a write into a write buffer entry for the same block.
+     *
+     * @param the write
+     * @param the entry. It must have data (not a CleanEvict).
+     */
+    void mergeWrite(PacketPtr pkt, WriteBufferEntry &wb);
+
+    /**
+     * @return true if a store to the block can go in the write buffer now.
+     *         Either there is a free entry or the store can be combined.
+     */
+    bool canBufferWrite(Addr block_addr) const;
+
+    /**
+     * Send a store on to memory through the write buffer. It is combined
+     * with the block's entry if there is one. Otherwise it gets a new
+     * (open) entry, which must fit (see canBufferWrite).
+     *
+     * @param the store
+     */
+    void bufferWrite(PacketPtr pkt);
+
+    /**
+     * With the write-through policy, send a write that was just done in the
+     * cache on to memory as well. Does nothing for reads.
+     *
+     * @param the access that was just done in the cache
+     */
+    void sendWriteThrough(PacketPtr pkt);
+
+    /**
+     * With write-no-allocate, send a timing write miss on to memory through
+     * the write buffer instead of fetching the block. If some of the block
+     * is in the cache or being filled, the write must go there instead.
+     *
+     * @param the access that missed
+     * @return true if the write was sent on to memory
+     */
+    bool writeNoAllocate(PacketPtr pkt);
+
+    /**
+     * @return true if the access is a write that needs room in the write
+     *         buffer to complete (see the write policy parameters)
+     */
+    bool needsWriteBuffer(PacketPtr pkt) const;
+
+    /**
+     * Close the write buffer's open entry so that it can be sent. Called
+     * when no more stores have come for writeCombineLatency.
+     */
+    void closeWriteCombining();
+
+    /**
+     * Finish an atomic access that the cache has done. With the
+     * write-through policy, writes are sent on to memory, which makes the
+     * response.
+     *
+     * @param the access
+     */
+    void respondAtomic(PacketPtr pkt);
+
+    /**
+     * @return true if there is a writeback or CleanEvict for the block in
+     *         the write buffer
+     */
+    bool inWriteBuffer(Addr block_addr) const;
+
+    /**
+     * Tell the prefetcher about a demand access and queue up any new
+     * prefetch candidates that aren't already in the cache. This takes the
+     * access's address and PC rather than the packet since the packet may
+     * have been responded to (and freed) by the time the prefetcher runs.
+     *
+     * @param the address of the demand access
+     * @param true if the access has a PC
+     * @param the PC of the access (if it has one)
+     */
+    void notifyPrefetcher(Addr addr, bool has_pc, Addr pc);
+
+    /**
+     * Issue queued prefetches while the memory side is idle and there are
+     * spare MSHRs. One MSHR is always kept for demand misses.
+     */
+    void issuePrefetches();
     /**
      * This is where we actually update / read from the cache. This function
      * is executed on both timing and functional accesses.
      *
+     * @param the packet to access the cache with
+     * @param true for demand accesses, which update the replacement state
+     *        and the prefetch stats on a hit. Debug accesses should not
+     *        affect which block is evicted next.
      * @return true if a hit, false otherwise
      */
-    bool accessFunctional(PacketPtr pkt);
+    bool accessFunctional(PacketPtr pkt, bool demand = true);
 
     /**
-     * Insert a block into the cache. If there is no room left in the cache,
-     * then this function evicts a random entry t make room for the new block.
+     * Insert the data from a fill into the cache. If the block isn't in the
+     * cache and there is no room left in the set, then this function evicts
+     * an entry chosen by the replacement policy to make room for it.
      *
      * @param packet with the data (and address) to insert into the cache
+     * @param the sectors to fill. Sectors that are already valid are left
+     *        alone since they may have been written since the fill was sent.
+     * @param true if the block was prefetched and no demand access has
+     *        used it yet
+     * @return the writeback for the evicted block. Its pkt is nullptr if
+     *         there is nothing to write back. The caller must send it.
+     */
+    WriteBufferEntry insert(PacketPtr pkt, uint64_t sectors,
+                            bool prefetched_block = false);
+
+    /**
+     * Allocate an entry for a block with none of its sectors valid. If the
+     * block is in the victim buffer, it is moved back into the entry with
+     * its sectors instead.
+     *
+     * @param the address of the block
+     * @param set to the writeback for the victim (see evictBlock)
+     * @return the entry for the block
+     */
+    int allocateBlock(Addr addr, WriteBufferEntry *writeback);
+
+    /**
+     * Write to the cache without fetching the block. Only possible when the
+     * write covers every sector it touches that the cache doesn't have.
+     *
+     * @param the write
+     * @param true if in atomic mode. The victim's writeback is sent right
+     *        away instead of being queued.
+     * @return true if the write was done, false if it is a normal miss
+     */
+    bool allocateForWrite(PacketPtr pkt, bool atomic);
+
+    /**
+     * Create the packet to fetch some sectors of a block from memory. It
+     * covers every sector from the first to the last one in the mask. The
+     * caller must give the packet somewhere to put the data.
+     *
+     * @param the address of the block
+     * @param the sectors that need to be fetched
+     * @param the master to make the request for
+     * @param true if the access needs a writable copy of the block. Only
+     *        matters in coherent mode.
+     * @return the fill packet
      */
-    void insert(PacketPtr pkt);
+    PacketPtr createFill(Addr block_addr, uint64_t sectors,
+                         MasterID master_id, bool writable = false);
+
+    /**
+     * Create the writeback (or CleanEvict) for a block that is leaving the
+     * cache.
+     *
+     * @param the address of the block
+     * @param the block's data
+     * @param the dirty sectors. Nothing is written back if none are dirty.
+     * @param true if other caches may still have copies (coherent mode)
+     * @param set to the writeback, if there is one
+     */
+    void makeWriteback(Addr block_addr, const uint8_t *data, uint64_t dirty,
+                       bool has_sharers, WriteBufferEntry *writeback);
+
+    /**
+     * Move an evicted block into the victim buffer. The oldest victim is
+     * spilled if the buffer is full.
+     *
+     * @param the block's entry in the cache
+     * @param the address of the block
+     * @param set to the writeback for the spilled victim, if there is one
+     */
+    void insertVictim(int entry, Addr block_addr,
+                      WriteBufferEntry *writeback);
+
+    /**
+     * If the block for an address isn't in the cache but is in the victim
+     * buffer, swap it back into the cache. Done in parallel with the tag
+     * lookup, so there is no extra latency.
+     *
+     * @param any address within the block
+     * @return true if the block was swapped in
+     */
+    bool accessVictimBuffer(Addr addr);
+
+    /**
+     * Send the blocks in the victim buffer to the write buffer, as many as
+     * there are free write buffer entries. Victims aren't saved in
+     * checkpoints, so this is done when draining. The rest are spilled
+     * from checkDrain as the write buffer empties.
+     */
+    void spillVictimBuffer();
+
+    /**
+     * Choose a victim for a block and remove it from the cache.
+     *
+     * @param the address of the block that is going to be inserted
+     * @param set to the writeback (or CleanEvict) for the victim if there is
+     *        one. If this is nullptr the victim is always dropped. With a
+     *        victim buffer, the victim goes there instead and this is the
+     *        writeback for a victim spilled from it.
+     * @return the (now invalid) entry to put the new block in
+     */
+    int evictBlock(Addr addr, WriteBufferEntry *writeback);
+
+    /**
+     * Remove a block from the cache without writing it back and give its
+     * frame back. The data is either clean or was passed on to another
+     * cache.
+     *
+     * @param the block's entry
+     */
+    void invalidateBlock(int entry);
+
+    /**
+     * Copy data between a functional access and some bytes of a block.
+     * Writes update the block and reads are updated from it.
+     *
+     * @param the functional access. It must be within the block.
+     * @param the address of the block
+     * @param the bytes of the block that have data
+     * @param the block's data
+     */
+    void functionalOverlay(PacketPtr pkt, Addr block_addr,
+                           const std::vector<bool> &bytes,
+                           uint8_t *block_data);
+
+    /// @return a mask with the sectors from first up to (not including) end
+    uint64_t sectorRange(unsigned first, unsigned end) const
+    { return end - first == 64 ? ~0ULL :
+             ((1ULL << (end - first)) - 1) << first; }
+
+    /// @return the sectors that an access (within one block) touches
+    uint64_t touchedSectors(PacketPtr pkt) const
+    {
+        Addr offset = pkt->getAddr() - pkt->getBlockAddr(blockSize);
+        return sectorRange(offset / sectorSize,
+                           divCeil(offset + pkt->getSize(), sectorSize));
+    }
+
+    /// @return the sectors that an access (within one block) completely
+    ///         overwrites if it is a write
+    uint64_t coveredSectors(PacketPtr pkt) const
+    {
+        Addr offset = pkt->getAddr() - pkt->getBlockAddr(blockSize);
+        unsigned first = divCeil(offset, sectorSize);
+        unsigned end = (offset + pkt->getSize()) / sectorSize;
+        return first < end ? sectorRange(first, end) : 0;
+    }
+
+    /**
+     * Find the next run of sectors in a mask. Use it to loop over the runs:
+     * for (unsigned s = 0, n; (n = nextSectorRun(mask, s)) != 0; s += n)
+     *
+     * @param the mask of sectors
+     * @param the first sector to look at. Set to the start of the run.
+     * @return the number of sectors in the run, 0 if there are no more
+     */
+    unsigned nextSectorRun(uint64_t mask, unsigned &sector) const;
+
+    /**
+     * Find the next run of set bytes in a byte mask, like nextSectorRun.
+     *
+     * @param the mask of bytes
+     * @param the first byte to look at. Set to the start of the run.
+     * @return the number of bytes in the run, 0 if there are no more
+     */
+    static unsigned nextByteRun(const std::vector<bool> &bytes,
+                                unsigned &byte);
+
+    /**
+     * Expand a mask of sectors to a mask of the bytes in those sectors.
+     *
+     * @param the mask of sectors
+     * @param set to a blockSize mask of bytes
+     */
+    void sectorsToBytes(uint64_t sectors, std::vector<bool> &bytes) const;
+
+    /**
+     * @return true if there is no outstanding work in the cache. All MSHRs
+     *         are free and all of the queues are empty.
+     */
+    bool isDrained() const;
+
+    /**
+     * If we are draining and have finished all outstanding work, tell the
+     * drain manager. Called whenever some outstanding work completes.
+     */
+    void checkDrain();
+
+    /**
+     * The header of the binary file that holds the cache contents in a
+     * checkpoint. It is followed by the tags, the valid bits, the valid
+     * sector masks, the dirty sector masks and then the data for each valid
+     * block (in entry order).
+     */
+    struct CheckpointHeader
+    {
+        uint32_t magic;
+        uint32_t version;
+        uint32_t blockSize;
+        uint32_t capacity;
+        uint32_t assoc;
+        uint32_t sectors;
+        /// False if the data array was stale (tag-only warming mode)
+        uint32_t hasData;
+        uint32_t padding;
+        uint64_t validBlocks;
+    };
+
+    /// Identifies a SimpleCache checkpoint file ("SCCP")
+    static const uint32_t checkpointMagic = 0x50434353;
+
+    /// Bump this whenever the checkpoint file layout changes
+    static const uint32_t checkpointVersion = 2;
+
+    /**
+     * Look up a block in the tag array. Only the ways of the block's set are
+     * searched.
+     *
+     * @param any address within the block
+     * @return the index of the block's entry or -1 if it is not present
+     */
+    int findBlock(Addr addr) const;
+
+    /**
+     * Choose the entry to replace for a new block. Prefers an invalid way
+     * and otherwise asks the replacement policy.
+     *
+     * @param the address of the block that is going to be inserted
+     * @return the index of the entry to replace
+     */
+    int findVictim(Addr addr);
+
+    /// @return the set index for an address
+    unsigned extractSet(Addr addr) const
+    { return (addr >> setShift) & setMask; }
+
+    /// @return the tag for an address
+    Addr extractTag(Addr addr) const
+    { return addr >> tagShift; }
+
+    /// @return the block address that a tag in the given set refers to
+    Addr regenerateBlockAddr(Addr tag, unsigned set) const
+    { return (tag << tagShift) | ((Addr)set << setShift); }
+
+    /**
+     * @return a pointer to the data for a valid entry in the data arena.
+     *         With compressed storage, the block is decompressed into a
+     *         scratch buffer that is only good until the next call.
+     */
+    const uint8_t *readBlockData(int entry) const;
+
+    /// @return a pointer to a valid entry's data that can be changed. Call
+    ///         blockWritten after changing it (see readBlockData).
+    uint8_t *getBlockData(int entry)
+    { return const_cast<uint8_t*>(readBlockData(entry)); }
+
+    /**
+     * Called after a block's data is changed through getBlockData. With
+     * compressed storage, the block is compressed again.
+     *
+     * @param the block's entry
+     */
+    void blockWritten(int entry);
+
+    /// @return the uncompressed size of the valid blocks over their
+    ///         compressed size. 1 without compressed storage.
+    double dataCompressionRatio() const;
+
+    /// @return bytes of host memory the compressed storage saves over a
+    ///         full data arena
+    double hostBytesSavedByCompression() const;
+
+    /**
+     * @return the number of bytes of host memory used for the tag and data
+     *         storage of this cache
+     */
+    size_t hostMemoryFootprint() const;
 
     /**
      * Return the address ranges this cache is responsible for. Just use the
@@ -260,6 +1052,9 @@ class SimpleCache : public MemObject
      */
     void sendRangeChange() const;
 
+    /// The system this cache is part of. Used to check the memory mode.
+    System *system;
+
     /// Latency to check the cache. Number of cycles for both hit and miss
     const Cycles latency;
 
@@ -269,31 +1064,294 @@ class SimpleCache : public MemObject
     /// Number of blocks in the cache (size of cache / block size)
     const unsigned capacity;
 
+    /// Number of ways in each set
+    const unsigned assoc;
+
+    /// Number of sets in the cache (capacity / associativity)
+    const unsigned numSets;
+
+    /// Amount to shift an address by to get the set index
+    const unsigned setShift;
+
+    /// Mask to get the set index after shifting
+    const Addr setMask;
+
+    /// Amount to shift an address by to get the tag
+    const unsigned tagShift;
+
+    /// Number of sectors in each block
+    const unsigned numSectors;
+
+    /// Bytes in each sector (blockSize / numSectors)
+    const unsigned sectorSize;
+
+    /// Mask with every sector set
+    const uint64_t allSectors;
+
     /// Instantiation of the CPU-side port
     std::vector<CPUSidePort> cpuPorts;
 
     /// Instantiation of the memory-side port
     MemSidePort memPort;
 
-    /// True if this cache is currently blocked waiting for a response.
-    bool blocked;
+    /// Event that runs the arbiter between the CPU-side ports
+    EventFunctionWrapper arbitrateEvent;
+
+    /// The port that gets the first chance at the next grant
+    unsigned nextPort;
+
+    /// The arbiter runs at most once per cycle. This is the earliest the
+    /// next arbitration can happen.
+    Tick nextGrantTick;
 
-    /// Packet that we are currently handling. Used for upgrading to larger
-    /// cache line sizes
-    PacketPtr outstandingPacket;
+    /// Number of banks. Consecutive blocks are in different banks.
+    const unsigned numBanks;
 
-    /// The port to send the response when we recieve it back
-    int waitingPortId;
+    /// The tick each bank can start its next access
+    std::vector<Tick> bankBusyUntil;
 
-    /// For tracking the miss latency
-    Tick missTime;
+    /// Number of AccessEvents that are scheduled but haven't happened
+    unsigned pendingAccesses;
 
-    /// An incredibly simple cache storage. Maps block addresses to data
-    std::unordered_map<Addr, uint8_t*> cacheStore;
+    /**
+     * A miss status holding register. Tracks one outstanding fill for a
+     * cache block and all of the requests (targets) waiting on it.
+     */
+    struct MSHR
+    {
+        /// A request that is waiting on this MSHR
+        struct Target
+        {
+            /// The original request packet from the CPU side
+            PacketPtr pkt;
+            /// The port to send the response to
+            int portId;
+        };
+
+        /// True if this MSHR is tracking an outstanding miss
+        bool valid = false;
+
+        /// The block address that is being filled
+        Addr blockAddr = 0;
+
+        /// When this MSHR was allocated. For tracking the miss latency
+        Tick allocTime = 0;
+
+        /// True if this fill was started by the prefetcher
+        bool isPrefetch = false;
+
+        /// The sectors that the fill is fetching
+        uint64_t fetchSectors = 0;
+
+        /// The requests to respond to when the fill returns
+        std::vector<Target> targets;
+
+        /// True once the crossbar has accepted the fill (coherent mode)
+        bool inService = false;
+
+        /// True if the fill will give us a writable copy of the block
+        bool pendingModified = false;
+
+        /// True if a snoop that came after the fill wants the block. Our
+        /// copy is invalidated once the targets are done.
+        bool postInvalidate = false;
+
+        /// True if a snoop that came after the fill reads the block. Our
+        /// copy can't be written once the targets are done.
+        bool postDowngrade = false;
+
+        /// Copies of the snoops that we must respond to once the fill
+        /// returns since the fill makes us the owner of the block
+        std::vector<PacketPtr> deferredSnoops;
+
+        /// Buffer that the fill's data is written into. Reused by every
+        /// fill this MSHR tracks.
+        std::vector<uint8_t> data;
+    };
+
+    /**
+     * Find the MSHR that is tracking a block
+     *
+     * @param the block address
+     * @return the MSHR or nullptr if there is no outstanding miss
+     */
+    MSHR *findMSHR(Addr block_addr);
+
+    /**
+     * Allocate a new MSHR for a block. There must be a free MSHR.
+     *
+     * @param the block address
+     * @return the newly allocated MSHR
+     */
+    MSHR *allocateMSHR(Addr block_addr);
+
+    /**
+     * Release an MSHR so it can be used for another miss.
+     */
+    void freeMSHR(MSHR *mshr);
+
+    /// Number of MSHRs (i.e., maximum number of outstanding misses)
+    const unsigned numMSHRs;
+
+    /// Maximum number of requests that can wait on a single MSHR
+    const unsigned tgtsPerMSHR;
+
+    /// The MSHR file. Never resized after construction.
+    std::vector<MSHR> mshrs;
+
+    /// Number of MSHRs that are currently valid
+    unsigned allocatedMSHRs;
+
+    /// Misses that are waiting for an MSHR or a target to free up
+    std::deque<MSHR::Target> stalledAccesses;
+
+    /// The targets of the MSHR that was just filled. Reused for each fill.
+    std::vector<MSHR::Target> completedTargets;
+
+    /// The deferred snoops of the MSHR that was just filled
+    std::vector<PacketPtr> completedSnoops;
+
+    /// Maximum number of entries (evictions or blocks of stores) in the
+    /// write buffer
+    const unsigned numWriteBuffers;
+
+    /// Writebacks, CleanEvicts and stores waiting to be sent to memory, in
+    /// order
+    std::deque<WriteBufferEntry> writeBuffer;
+
+    /// True if we refused a response because the write buffer was full
+    bool needRespRetry;
+
+    /// Number of WriteReqs (partial writebacks and stores) that are waiting
+    /// for a response
+    unsigned outstandingWrites;
+
+    /// True for the write-through policy. Every write is also sent on to
+    /// memory, so blocks are never dirty.
+    const bool writeThrough;
+
+    /// If false, write misses are sent on to memory instead of fetching the
+    /// block (write-no-allocate)
+    const bool writeAllocate;
+
+    /// Cycles the open write buffer entry waits for more stores to its block
+    const Cycles writeCombineLatency;
+
+    /// Event that closes the open write buffer entry
+    EventFunctionWrapper writeCombineEvent;
+
+    /**
+     * The tag array. Entry (set * assoc + way) in each of these vectors
+     * describes one way of one set, so all of the ways of a set are
+     * contiguous and a lookup only touches a few neighboring elements.
+     */
+    std::vector<Addr> tags;
+    std::vector<uint8_t> valid;
+
+    /// The valid and dirty sectors of each entry. Bit i is sector i.
+    std::vector<uint64_t> sectorValid;
+    std::vector<uint64_t> sectorDirty;
+
+    /// True for each entry that no other cache has a copy of, so it can be
+    /// written without asking (coherent mode only)
+    std::vector<uint8_t> writable;
+
+    /// All of the data storage for the cache. Allocated once in the
+    /// constructor and split into blockSize frames. Empty with compressed
+    /// storage.
+    std::vector<uint8_t> dataArena;
+
+    /// The compressed data storage. nullptr if the data isn't compressed.
+    std::unique_ptr<SimpleCompressedStore> compressedStore;
+
+    /// Where compressed blocks are decompressed to be accessed
+    mutable std::vector<uint8_t> blockScratch;
+
+    /// The data arena frame for each entry. -1 if the entry is invalid.
+    std::vector<int> frames;
+
+    /// Frames in the data arena that do not hold a block
+    std::vector<int> freeFrames;
+
+    /// Chooses which way to evict when a set is full
+    std::unique_ptr<SimpleReplacementPolicy> replPolicy;
+
+    /// A block in the victim buffer
+    struct VictimEntry
+    {
+        bool valid = false;
+        Addr blockAddr = 0;
+        uint64_t sectorValid = 0;
+        uint64_t sectorDirty = 0;
+        /// True if the block was prefetched and hasn't been used yet
+        bool prefetched = false;
+        /// When the block was inserted. The oldest victim is spilled first.
+        uint64_t inserted = 0;
+        /// The block's data
+        std::vector<uint8_t> data;
+    };
+
+    /// The victim buffer. Empty if it is disabled.
+    std::vector<VictimEntry> victimBuffer;
+
+    /// Sequence number for the next block moved to the victim buffer
+    uint64_t victimSequence;
+
+    /// Holds a block's data while it is swapped out of the victim buffer
+    std::vector<uint8_t> victimSwap;
+
+    /**
+     * Look up a block in the victim buffer.
+     *
+     * @param any address within the block
+     * @return the block's victim entry or nullptr if it isn't there
+     */
+    VictimEntry *findVictimEntry(Addr addr);
+
+    /// True for each entry that was prefetched and hasn't been used yet
+    std::vector<uint8_t> prefetched;
+
+    /// The prefetcher. nullptr if prefetching is disabled.
+    std::unique_ptr<SimplePrefetcher> prefetcher;
+
+    /// Block addresses waiting to be prefetched, oldest first
+    std::deque<Addr> prefetchQueue;
+
+    /// Maximum number of queued prefetches. The oldest are dropped.
+    const unsigned prefetchQueueSize;
+
+    /// Reused buffer for the prefetcher's candidates
+    std::vector<Addr> prefetchCandidates;
+
+    /// If true, only warm the tags in atomic mode (see the class comment)
+    const bool warmTagsOnly;
+
+    /// True while the data array is stale because we're only warming tags
+    bool warming;
+
+    /// If true, send a CleanEvict downstream when a clean block is evicted
+    const bool sendCleanEvicts;
+
+    /// If true, snoop the memory side to stay coherent with other caches
+    const bool coherent;
+
+    /// A snoop response waiting for the cache latency
+    struct QueuedSnoopResp
+    {
+        PacketPtr pkt;
+        /// When the response can be sent
+        Tick ready;
+    };
+
+    /// Snoop responses waiting to be sent, in order
+    std::deque<QueuedSnoopResp> pendingSnoopResps;
+
+    /// Event that sends the snoop responses
+    EventFunctionWrapper snoopRespEvent;
 
     /**
      * Class for an event to delay handling a packet.
-     * Automatically deletes itself after process is called.
+     * Returns itself to the cache's pool after process is called.
      */
     class AccessEvent : public Event
     {
@@ -303,25 +1361,142 @@ class SimpleCache : public MemObject
 
         /// The packet we need to handle
         PacketPtr pkt;
+
+        /// The port the packet came from
+        int portId;
       public:
-        AccessEvent(SimpleCache *cache, PacketPtr pkt) :
-            Event(Default_Pri, AutoDelete), cache(cache), pkt(pkt)
+        AccessEvent(SimpleCache *cache) :
+            Event(Default_Pri), cache(cache), pkt(nullptr), portId(-1)
         { }
 
+        /// Set the access to do the next time this event is scheduled
+        void setAccess(PacketPtr pkt, int port_id)
+        { this->pkt = pkt; portId = port_id; }
+
         /** Process the event. Just call into the cache.
          */
         void process() override {
-            cache->accessTiming(pkt);
+            cache->pendingAccesses--;
+            // Free ourselves first. The access may need another event.
+            cache->freeAccessEvents.push_back(this);
+            cache->accessTiming(pkt, portId);
         }
     };
 
     friend class AccessEvent;
 
+    /// The kinds of objects that are pooled. Used to index the pool stats.
+    enum PoolType
+    {
+        EventPool,
+        RequestPool,
+        PacketPool,
+        NumPoolTypes
+    };
+
+    /// Every AccessEvent this cache has created
+    std::vector<std::unique_ptr<AccessEvent>> accessEvents;
+
+    /// AccessEvents that aren't scheduled and can be reused
+    std::vector<AccessEvent*> freeAccessEvents;
+
+    /// Requests this cache can reuse. An entry can be reused once the pool
+    /// holds the only reference to it.
+    std::vector<RequestPtr> requestPool;
+
+    /// Where to start looking for a free request in requestPool
+    unsigned requestPoolNext;
+
+    /// Storage of packets we're done with. The packets have been destroyed,
+    /// so new packets can be constructed in place.
+    std::vector<void*> freePackets;
+
+    /**
+     * Get an AccessEvent from the pool (or the heap if the pool is empty).
+     *
+     * @param the packet to access the cache with
+     * @param id of the port to send the response
+     * @return an unscheduled event that will access the cache
+     */
+    AccessEvent *allocAccessEvent(PacketPtr pkt, int port_id);
+
+    /**
+     * Get a request from the pool (or the heap if every pooled request is
+     * still in use) and initialize it.
+     *
+     * @return the request
+     */
+    RequestPtr allocRequest(Addr addr, unsigned size, Request::Flags flags,
+                            MasterID master_id = 0);
+
+    /**
+     * Construct a packet in storage from the pool (or the heap if the pool
+     * is empty). Packets that leave the cache (e.g., writebacks) can be
+     * deleted by whoever ends up owning them as usual.
+     *
+     * @param the request for the packet
+     * @param the packet's command
+     * @param if not 0, make a block-sized packet aligned to this size
+     * @return the new packet
+     */
+    PacketPtr allocPacket(const RequestPtr &req, MemCmd cmd,
+                          unsigned block_size = 0);
+
+    /**
+     * Destroy a packet that this cache allocated and keep its storage for
+     * the next allocPacket.
+     *
+     * @param the packet. It must not be used after this call.
+     */
+    void freePacket(PacketPtr pkt);
+
     /// Cache statistics
     Stats::Scalar hits;
     Stats::Scalar misses;
     Stats::Histogram missLatency;
     Stats::Formula hitRatio;
+    Stats::Average mshrOccupancy;
+    Stats::Scalar mergedTargets;
+    Stats::Scalar mshrStalls;
+    Stats::Scalar cleanEvictions;
+    Stats::Scalar dirtyEvictions;
+    Stats::Scalar writebackBytes;
+    Stats::Scalar splitAccesses;
+    Stats::Scalar sectorMisses;
+    Stats::Scalar noFetchWrites;
+    Stats::Scalar partialWritebacks;
+    Stats::Scalar fetchedBytes;
+    Stats::Scalar prefetchesIssued;
+    Stats::Scalar usefulPrefetches;
+    Stats::Scalar latePrefetches;
+    Stats::Scalar unusedPrefetches;
+    Stats::Formula prefetchAccuracy;
+    Stats::Formula prefetchCoverage;
+    Stats::Scalar writeBufferHits;
+    Stats::Scalar writeBufferMerges;
+    Stats::Scalar writeBufferFullStalls;
+    Stats::Scalar writeThroughs;
+    Stats::Scalar uncachedWrites;
+    Stats::Scalar snoopHits;
+    Stats::Scalar snoopDataResponses;
+    Stats::Scalar snoopInvalidations;
+    Stats::Scalar deferredSnoops;
+    Stats::Scalar upgradeMisses;
+    Stats::Scalar victimHits;
+    Stats::Scalar victimsInserted;
+    Stats::Scalar victimsSpilled;
+    Stats::Value hostMemory;
+    Stats::Value compressionRatio;
+    Stats::Value compressionBytesSaved;
+    Stats::Vector compressedWrites;
+    Stats::Vector portServed;
+    Stats::Vector portRetries;
+    Stats::Vector portQueueTicks;
+    Stats::Formula portQueueDelay;
+    Stats::Vector bankAccesses;
+    Stats::Vector bankConflicts;
+    Stats::Vector poolHits;
+    Stats::Vector poolAllocs;
 
   public:
 
@@ -329,6 +1504,10 @@ class SimpleCache : public MemObject
      */
     SimpleCache(SimpleCacheParams *params);
 
+    /** destructor. Releases everything held in the object pools.
+     */
+    ~SimpleCache();
+
     /**
      * Get a port with a given name and index. This is used at
      * binding time and returns a reference to a protocol-agnostic
@@ -346,6 +1525,39 @@ class SimpleCache : public MemObject
      * Register the stats
      */
     void regStats() override;
+
+    /**
+     * Called after all objects are initialized. Enters the tag-only warming
+     * mode if we start in atomic mode.
+     */
+    void startup() override;
+
+    /**
+     * Called when the simulation resumes after draining (e.g., after
+     * switching CPUs). Enters or leaves the tag-only warming mode.
+     */
+    void drainResume() override;
+
+    /**
+     * Drain the cache before a checkpoint or CPU switch. Finishes all
+     * outstanding accesses and misses and sends all queued writebacks.
+     * Prefetching stops while draining.
+     *
+     * @return Drained if there is nothing outstanding, else Draining
+     */
+    DrainState drain() override;
+
+    /**
+     * Write the tags, dirty bits, and data into a binary file in the
+     * checkpoint directory. The cache must be drained.
+     */
+    void serialize(CheckpointOut &cp) const override;
+
+    /**
+     * Restore the cache from a checkpoint. The binary file is mmapped and
+     * copied straight into the tag and data arrays.
+     */
+    void unserialize(CheckpointIn &cp) override;
 };
 
 
@@ -0,0 +1,189 @@
+/*
+ * Copyright (c) 2017 Jason Lowe-Power
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ *
+ * Authors: Jason Lowe-Power
+ */
+
+#include "learning_gem5/simple_cache/simple_prefetcher.hh"
+
+#include <algorithm>
+
+#include "base/intmath.hh"
+#include "base/logging.hh"
+
+const uint8_t SimplePrefetcher::confidenceThreshold;
+const uint8_t SimplePrefetcher::maxConfidence;
+const unsigned SimplePrefetcher::numStreams;
+const Addr SimplePrefetcher::pageBytes;
+
+SimplePrefetcher::SimplePrefetcher(const std::string &type,
+                                   unsigned block_size, unsigned degree,
+                                   unsigned table_entries) :
+    useStride(type == "stride" || type == "stride_stream"),
+    useStream(type == "stream" || type == "stride_stream"),
+    blockSize(block_size), degree(degree),
+    strideTable(useStride ? table_entries : 0),
+    streams(useStream ? numStreams : 0),
+    nextStream(0)
+{
+    fatal_if(!useStride && !useStream,
+             "Unknown SimpleCache prefetcher '%s'", type);
+    fatal_if(degree == 0, "SimpleCache prefetch degree must be at least 1");
+    fatal_if(useStride && table_entries == 0,
+             "SimpleCache stride prefetcher needs at least one table entry");
+}
+
+void
+SimplePrefetcher::notify(Addr addr, bool has_pc, Addr pc,
+                         std::vector<Addr> &candidates)
+{
+    if (useStride && has_pc) {
+        notifyStride(addr, pc, candidates);
+    }
+    if (useStream) {
+        notifyStream(addr, candidates);
+    }
+}
+
+void
+SimplePrefetcher::notifyStride(Addr addr, Addr pc,
+                               std::vector<Addr> &candidates)
+{
+    // Instructions are at least 2-byte aligned on every ISA we care about
+    StrideEntry &entry = strideTable[(pc >> 1) % strideTable.size()];
+
+    // Train on blocks so that strides smaller than a block still give
+    // each candidate its own block ahead of the demand stream
+    Addr block = addr / blockSize;
+
+    if (!entry.valid || entry.pc != pc) {
+        // Start tracking this PC
+        entry.valid = true;
+        entry.pc = pc;
+        entry.lastBlock = block;
+        entry.stride = 0;
+        entry.confidence = 0;
+        return;
+    }
+
+    int64_t stride = (int64_t)(block - entry.lastBlock);
+    entry.lastBlock = block;
+
+    if (stride == 0) {
+        // Still in the same block. This tells us nothing.
+        return;
+    }
+
+    if (stride == entry.stride) {
+        entry.confidence = std::min<uint8_t>(entry.confidence + 1,
+                                             maxConfidence);
+    } else {
+        // Only replace the stride once we've lost confidence in the old one
+        if (entry.confidence > 0) {
+            entry.confidence--;
+        } else {
+            entry.stride = stride;
+        }
+        return;
+    }
+
+    if (entry.confidence < confidenceThreshold) {
+        return;
+    }
+
+    for (unsigned i = 1; i <= degree; i++) {
+        addCandidate(addr, (block + entry.stride * (int64_t)i) * blockSize,
+                     candidates);
+    }
+}
+
+void
+SimplePrefetcher::notifyStream(Addr addr, std::vector<Addr> &candidates)
+{
+    Addr block = addr / blockSize;
+
+    for (auto& stream : streams) {
+        if (!stream.valid) {
+            continue;
+        }
+        if (block == stream.lastBlock) {
+            // Still in the same block. Nothing new to learn.
+            return;
+        }
+
+        int direction = 0;
+        if (block == stream.lastBlock + 1) {
+            direction = 1;
+        } else if (block == stream.lastBlock - 1) {
+            direction = -1;
+        } else {
+            continue;
+        }
+
+        // This access continues the stream
+        if (direction == stream.direction) {
+            stream.confidence = std::min<uint8_t>(stream.confidence + 1,
+                                                  maxConfidence);
+        } else {
+            stream.direction = direction;
+            stream.confidence = 1;
+        }
+        stream.lastBlock = block;
+
+        if (stream.confidence >= confidenceThreshold) {
+            for (unsigned i = 1; i <= degree; i++) {
+                addCandidate(addr,
+                             (block + direction * (int64_t)i) * blockSize,
+                             candidates);
+            }
+        }
+        return;
+    }
+
+    // This doesn't match any stream. Start a new one.
+    StreamEntry &stream = streams[nextStream];
+    nextStream = (nextStream + 1) % streams.size();
+    stream.valid = true;
+    stream.lastBlock = block;
+    stream.direction = 0;
+    stream.confidence = 0;
+}
+
+void
+SimplePrefetcher::addCandidate(Addr trigger, Addr addr,
+                               std::vector<Addr> &candidates)
+{
+    if (roundDown(addr, pageBytes) != roundDown(trigger, pageBytes)) {
+        return;
+    }
+
+    Addr block_addr = roundDown(addr, blockSize);
+    if (std::find(candidates.begin(), candidates.end(), block_addr) ==
+        candidates.end()) {
+        candidates.push_back(block_addr);
+    }
+}
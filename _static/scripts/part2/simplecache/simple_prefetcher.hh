@@ -0,0 +1,153 @@
+/*
+ * Copyright (c) 2017 Jason Lowe-Power
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ *
+ * Authors: Jason Lowe-Power
+ */
+
+#ifndef __LEARNING_GEM5_SIMPLE_CACHE_SIMPLE_PREFETCHER_HH__
+#define __LEARNING_GEM5_SIMPLE_CACHE_SIMPLE_PREFETCHER_HH__
+
+#include <cstdint>
+#include <string>
+#include <vector>
+
+#include "base/types.hh"
+
+/**
+ * A very simple prefetcher for the SimpleCache. It has two parts that can be
+ * enabled separately.
+ *  - A per-PC stride table. Each entry remembers the last block and stride
+ *    (in blocks) for one load/store PC. Once the same stride is seen twice
+ *    in a row, the next few strided blocks are prefetched.
+ *  - A next-N-line stream detector. It remembers a few recent streams of
+ *    accesses to consecutive blocks. Once a stream has moved two blocks in
+ *    the same direction, the next N blocks in that direction are prefetched.
+ *
+ * Prefetches never cross a 4 kB page boundary since physically consecutive
+ * pages are usually unrelated (and may not even exist).
+ *
+ * The prefetcher only generates candidate block addresses. The cache decides
+ * whether (and when) to actually issue them.
+ */
+class SimplePrefetcher
+{
+  private:
+    /// One entry in the per-PC stride table
+    struct StrideEntry
+    {
+        bool valid = false;
+        Addr pc = 0;
+        /// The last block number (address / block size) this PC touched
+        Addr lastBlock = 0;
+        /// Distance between the last two blocks, in blocks
+        int64_t stride = 0;
+        uint8_t confidence = 0;
+    };
+
+    /// One entry in the stream detector
+    struct StreamEntry
+    {
+        bool valid = false;
+        /// The last block number (address / block size) in the stream
+        Addr lastBlock = 0;
+        /// +1 for ascending, -1 for descending, 0 if unknown
+        int direction = 0;
+        uint8_t confidence = 0;
+    };
+
+    /// Number of matching observations needed before prefetching
+    static const uint8_t confidenceThreshold = 2;
+
+    /// The largest value of the saturating confidence counters
+    static const uint8_t maxConfidence = 3;
+
+    /// Number of streams that the stream detector tracks
+    static const unsigned numStreams = 8;
+
+    /// Prefetches stay within a page of this size
+    static const Addr pageBytes = 4096;
+
+    /// True if the stride table is used
+    const bool useStride;
+
+    /// True if the stream detector is used
+    const bool useStream;
+
+    /// The cache's block size
+    const unsigned blockSize;
+
+    /// Number of blocks to prefetch ahead on each trigger
+    const unsigned degree;
+
+    /// The stride table. Direct mapped by PC.
+    std::vector<StrideEntry> strideTable;
+
+    /// The streams being tracked
+    std::vector<StreamEntry> streams;
+
+    /// The stream to replace next when a new stream starts
+    unsigned nextStream;
+
+    /**
+     * Train the stride table and generate candidates.
+     */
+    void notifyStride(Addr addr, Addr pc, std::vector<Addr> &candidates);
+
+    /**
+     * Train the stream detector and generate candidates.
+     */
+    void notifyStream(Addr addr, std::vector<Addr> &candidates);
+
+    /**
+     * Add a block address to the candidates if it isn't already there and
+     * it is in the same page as the access that triggered it.
+     */
+    void addCandidate(Addr trigger, Addr addr, std::vector<Addr> &candidates);
+
+  public:
+    /**
+     * @param which parts to enable: stride, stream, or stride_stream
+     * @param the block size of the cache
+     * @param number of blocks to prefetch ahead
+     * @param number of entries in the stride table
+     */
+    SimplePrefetcher(const std::string &type, unsigned block_size,
+                     unsigned degree, unsigned table_entries);
+
+    /**
+     * Observe a demand access and generate prefetch candidates.
+     *
+     * @param the address of the access
+     * @param true if the access has a PC
+     * @param the PC of the access (only used if has_pc)
+     * @param block addresses to prefetch are appended to this
+     */
+    void notify(Addr addr, bool has_pc, Addr pc,
+                std::vector<Addr> &candidates);
+};
+
+#endif // __LEARNING_GEM5_SIMPLE_CACHE_SIMPLE_PREFETCHER_HH__
@@ -0,0 +1,308 @@
+/*
+ * Copyright (c) 2017 Jason Lowe-Power
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ *
+ * Authors: Jason Lowe-Power
+ */
+
+#include "learning_gem5/trace_replay/trace_replay.hh"
+
+#include <cstring>
+
+#include "debug/Drain.hh"
+#include "debug/TraceReplay.hh"
+#include "sim/sim_exit.hh"
+#include "sim/system.hh"
+
+TraceReplay::TraceReplay(TraceReplayParams *params) :
+    MemObject(params),
+    icachePort(params->name + ".icache_port", this),
+    dcachePort(params->name + ".dcache_port", this),
+    masterId(params->system->getMasterId(this)),
+    issueWidth(params->issue_width),
+    maxOutstanding(params->max_outstanding),
+    dependenceDistance(params->dependence_distance),
+    reader(params->trace_file),
+    haveRecord(false),
+    nextSeq(0),
+    lastIssueTick(MaxTick),
+    issuedThisCycle(0),
+    issueEvent([this]{ issue(); }, name() + ".issueEvent")
+{
+    fatal_if(issueWidth == 0, "TraceReplay needs issue_width > 0");
+    fatal_if(maxOutstanding == 0, "TraceReplay needs max_outstanding > 0");
+
+    haveRecord = reader.next(nextRecord);
+}
+
+Port&
+TraceReplay::getPort(const std::string& if_name, PortID idx)
+{
+    panic_if(idx != InvalidPortID, "This object doesn't support vector ports");
+
+    // This is the name from the Python SimObject declaration (TraceReplay.py)
+    if (if_name == "icache_port") {
+        return icachePort;
+    } else if (if_name == "dcache_port") {
+        return dcachePort;
+    } else {
+        // pass it along to our super class
+        return MemObject::getPort(if_name, idx);
+    }
+}
+
+void
+TraceReplay::ReplayPort::sendPacket(PacketPtr pkt)
+{
+    // Note: The replay only sends a request when this port isn't blocked.
+
+    panic_if(blockedPacket != nullptr, "Should never try to send if blocked!");
+
+    // If we can't send the packet across the port, store it for later.
+    if (!sendTimingReq(pkt)) {
+        blockedPacket = pkt;
+    }
+}
+
+bool
+TraceReplay::ReplayPort::recvTimingResp(PacketPtr pkt)
+{
+    // Just forward to the replay.
+    return owner->handleResponse(pkt);
+}
+
+void
+TraceReplay::ReplayPort::recvReqRetry()
+{
+    // We should have a blocked packet if this function is called.
+    assert(blockedPacket != nullptr);
+
+    // Grab the blocked packet.
+    PacketPtr pkt = blockedPacket;
+    blockedPacket = nullptr;
+
+    // Try to resend it. It's possible that it fails again.
+    sendPacket(pkt);
+
+    // Requests behind it may be able to go now.
+    owner->scheduleIssue();
+}
+
+void
+TraceReplay::startup()
+{
+    MemObject::startup();
+    scheduleIssue();
+}
+
+void
+TraceReplay::scheduleIssue()
+{
+    if (!issueEvent.scheduled()) {
+        schedule(issueEvent, clockEdge());
+    }
+}
+
+void
+TraceReplay::issue()
+{
+    if (curTick() != lastIssueTick) {
+        lastIssueTick = curTick();
+        issuedThisCycle = 0;
+    }
+
+    while (haveRecord) {
+        if (drainState() == DrainState::Draining) {
+            // drainResume will start issuing again.
+            return;
+        }
+        if (issuedThisCycle == issueWidth) {
+            schedule(issueEvent, clockEdge(Cycles(1)));
+            return;
+        }
+        if (inFlight.size() >= maxOutstanding) {
+            // A response will start issuing again.
+            outstandingStalls++;
+            return;
+        }
+        if (dependenceDistance > 0 && nextSeq >= dependenceDistance &&
+            inFlight.count(nextSeq - dependenceDistance)) {
+            // The response to that request will start issuing again.
+            dependenceStalls++;
+            return;
+        }
+
+        ReplayPort &port = nextRecord.port == 0 ? icachePort : dcachePort;
+        if (port.isBlocked()) {
+            // The retry will start issuing again.
+            return;
+        }
+
+        PacketPtr pkt = createPacket(nextRecord);
+        if (pkt) {
+            DPRINTF(TraceReplay, "Issuing %s for entry %d\n", pkt->print(),
+                    nextSeq);
+            pkt->pushSenderState(new ReplayState(nextSeq, curTick()));
+            inFlight.insert(nextSeq);
+            issuedThisCycle++;
+            port.sendPacket(pkt);
+        } else {
+            skippedRecords++;
+        }
+
+        nextSeq++;
+        haveRecord = reader.next(nextRecord);
+    }
+
+    if (inFlight.empty()) {
+        exitSimLoop("trace replay complete");
+    }
+}
+
+PacketPtr
+TraceReplay::createPacket(const PacketTrace::Record &rec)
+{
+    if (rec.cmd >= MemCmd::NUM_MEM_CMDS) {
+        return nullptr;
+    }
+
+    // Atomics and locked accesses are replayed as plain reads and writes
+    MemCmd recorded(static_cast<MemCmd::Command>(rec.cmd));
+    MemCmd cmd;
+    if (recorded.isWrite()) {
+        cmd = MemCmd::WriteReq;
+    } else if (recorded.isRead()) {
+        cmd = MemCmd::ReadReq;
+    } else {
+        return nullptr;
+    }
+
+    Request::Flags flags = rec.port == 0 ? Request::INST_FETCH : 0;
+    RequestPtr req;
+    if (rec.flags & PacketTrace::pcValid) {
+        // The trace only has the physical address, so use it for the
+        // virtual address as well.
+        req = std::make_shared<Request>(0, rec.addr, rec.size, flags,
+                                        masterId, rec.pc, 0);
+        req->setPaddr(rec.addr);
+    } else {
+        req = std::make_shared<Request>(rec.addr, rec.size, flags, masterId);
+    }
+
+    PacketPtr pkt = new Packet(req, cmd);
+    pkt->allocate();
+    if (pkt->isWrite()) {
+        std::memset(pkt->getPtr<uint8_t>(), 0, rec.size);
+    }
+    return pkt;
+}
+
+bool
+TraceReplay::handleResponse(PacketPtr pkt)
+{
+    DPRINTF(TraceReplay, "Got response %s\n", pkt->print());
+
+    ReplayState *state = dynamic_cast<ReplayState*>(pkt->popSenderState());
+    assert(state);
+
+    accessLatency.sample(curTick() - state->issueTick);
+    if (pkt->isRead()) {
+        reads++;
+    } else {
+        writes++;
+    }
+    inFlight.erase(state->seq);
+
+    delete state;
+    delete pkt;
+
+    if (drainState() == DrainState::Draining && inFlight.empty()) {
+        DPRINTF(Drain, "TraceReplay done draining\n");
+        signalDrainDone();
+    }
+
+    // A request may have been waiting for this one, or for a free slot.
+    scheduleIssue();
+
+    return true;
+}
+
+void
+TraceReplay::regStats()
+{
+    // If you don't do this you get errors about uninitialized stats.
+    MemObject::regStats();
+
+    reads.name(name() + ".reads")
+        .desc("Number of reads replayed")
+        ;
+
+    writes.name(name() + ".writes")
+        .desc("Number of writes replayed")
+        ;
+
+    skippedRecords.name(name() + ".skippedRecords")
+        .desc("Number of trace entries that weren't reads or writes")
+        ;
+
+    outstandingStalls.name(name() + ".outstandingStalls")
+        .desc("Number of times issue stopped at max_outstanding")
+        ;
+
+    dependenceStalls.name(name() + ".dependenceStalls")
+        .desc("Number of times issue waited for an earlier request")
+        ;
+
+    accessLatency.name(name() + ".accessLatency")
+        .desc("Ticks from sending a request to its response")
+        .init(16) // number of buckets
+        ;
+}
+
+DrainState
+TraceReplay::drain()
+{
+    if (inFlight.empty()) {
+        return DrainState::Drained;
+    }
+
+    DPRINTF(Drain, "TraceReplay not drained. %d requests in flight\n",
+            inFlight.size());
+    return DrainState::Draining;
+}
+
+void
+TraceReplay::drainResume()
+{
+    MemObject::drainResume();
+    scheduleIssue();
+}
+
+TraceReplay*
+TraceReplayParams::create()
+{
+    return new TraceReplay(this);
+}
@@ -0,0 +1,236 @@
+/*
+ * Copyright (c) 2017 Jason Lowe-Power
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are
+ * met: redistributions of source code must retain the above copyright
+ * notice, this list of conditions and the following disclaimer;
+ * redistributions in binary form must reproduce the above copyright
+ * notice, this list of conditions and the following disclaimer in the
+ * documentation and/or other materials provided with the distribution;
+ * neither the name of the copyright holders nor the names of its
+ * contributors may be used to endorse or promote products derived from
+ * this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+ * "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+ * LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+ * A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+ * OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+ * SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+ * LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+ * OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ *
+ * Authors: Jason Lowe-Power
+ */
+
+#ifndef __LEARNING_GEM5_TRACE_REPLAY_TRACE_REPLAY_HH__
+#define __LEARNING_GEM5_TRACE_REPLAY_TRACE_REPLAY_HH__
+
+#include <set>
+
+#include "base/statistics.hh"
+#include "learning_gem5/simple_memobj/packet_trace.hh"
+#include "mem/mem_object.hh"
+#include "params/TraceReplay.hh"
+
+/**
+ * Replays a packet trace recorded by a SimpleMemobj in place of a CPU.
+ * Requests are read from the trace in order and sent out of the
+ * instruction or data port they were recorded on, as fast as the memory
+ * system accepts them. Up to issue_width requests are sent each cycle and
+ * up to max_outstanding can be in flight. With a dependence_distance of N,
+ * each request also waits for the response to the request N entries
+ * earlier in the trace, which approximates the dependences a CPU would
+ * have. The trace doesn't include data, so writes store zeros.
+ * Simulation exits when the whole trace has been replayed.
+ */
+class TraceReplay : public MemObject
+{
+  private:
+
+    /**
+     * Port that sends the requests on one side (instruction or data).
+     */
+    class ReplayPort : public MasterPort
+    {
+      private:
+        /// The object that owns this object (TraceReplay)
+        TraceReplay *owner;
+
+        /// If we tried to send a packet and it was blocked, store it here
+        PacketPtr blockedPacket;
+
+      public:
+        /**
+         * Constructor. Just calls the superclass constructor.
+         */
+        ReplayPort(const std::string& name, TraceReplay *owner) :
+            MasterPort(name, owner), owner(owner), blockedPacket(nullptr)
+        { }
+
+        /**
+         * Send a packet across this port. If the peer is busy, hold the
+         * packet until it sends a retry.
+         *
+         * @param packet to send.
+         */
+        void sendPacket(PacketPtr pkt);
+
+        /**
+         * @return true if a request is waiting for a retry from the peer
+         */
+        bool isBlocked() const { return blockedPacket != nullptr; }
+
+      protected:
+        /**
+         * Receive a timing response from the slave port.
+         */
+        bool recvTimingResp(PacketPtr pkt) override;
+
+        /**
+         * Called by the slave port if sendTimingReq was called on this
+         * master port (causing recvTimingReq to be called on the slave
+         * port) and was unsuccesful.
+         */
+        void recvReqRetry() override;
+    };
+
+    /**
+     * Attached to each request to find its trace entry when it completes.
+     */
+    struct ReplayState : public Packet::SenderState
+    {
+        /// The position of the request in the trace
+        uint64_t seq;
+
+        /// The tick the request was sent
+        Tick issueTick;
+
+        ReplayState(uint64_t seq, Tick issue_tick) :
+            seq(seq), issueTick(issue_tick)
+        { }
+    };
+
+    /**
+     * Send as many requests as the issue width, the outstanding limit and
+     * the dependences allow. Exits the simulation when the trace is done.
+     */
+    void issue();
+
+    /**
+     * Schedule the issue event for this cycle if it isn't scheduled.
+     */
+    void scheduleIssue();
+
+    /**
+     * Create the request for a trace entry. Reads are replayed as
+     * ReadReqs and writes as WriteReqs.
+     *
+     * @param the trace entry
+     * @return the packet or null if the command isn't a read or write
+     */
+    PacketPtr createPacket(const PacketTrace::Record &rec);
+
+    /**
+     * Handle the response to a replayed request.
+     *
+     * @param responding packet
+     * @return true, the responses are always consumed
+     */
+    bool handleResponse(PacketPtr pkt);
+
+    /// Instantiation of the ports
+    ReplayPort icachePort;
+    ReplayPort dcachePort;
+
+    /// The master ID for the replayed requests
+    const MasterID masterId;
+
+    /// Maximum requests sent each cycle
+    const unsigned issueWidth;
+
+    /// Maximum requests in flight at a time
+    const unsigned maxOutstanding;
+
+    /// Distance back in the trace of the request each one waits for
+    const unsigned dependenceDistance;
+
+    /// The trace being replayed
+    PacketTraceReader reader;
+
+    /// The next entry to issue. Only valid if haveRecord is true.
+    PacketTrace::Record nextRecord;
+
+    /// False once the whole trace has been read
+    bool haveRecord;
+
+    /// The position of nextRecord in the trace
+    uint64_t nextSeq;
+
+    /// The positions of the requests that are in flight
+    std::set<uint64_t> inFlight;
+
+    /// The last tick requests were issued and how many were issued then
+    Tick lastIssueTick;
+    unsigned issuedThisCycle;
+
+    /// Event to issue more requests
+    EventFunctionWrapper issueEvent;
+
+    /// Replay statistics
+    Stats::Scalar reads;
+    Stats::Scalar writes;
+    Stats::Scalar skippedRecords;
+    Stats::Scalar outstandingStalls;
+    Stats::Scalar dependenceStalls;
+    Stats::Histogram accessLatency;
+
+  public:
+
+    /** constructor
+     */
+    TraceReplay(TraceReplayParams *params);
+
+    /**
+     * Get a port with a given name and index. This is used at
+     * binding time and returns a reference to a protocol-agnostic
+     * base master port.
+     *
+     * @param if_name Port name
+     * @param idx Index in the case of a VectorPort
+     *
+     * @return A reference to the given port
+     */
+    Port& getPort(const std::string& if_name,
+                  PortID idx = InvalidPortID) override;
+
+    /**
+     * Start replaying once the simulation starts.
+     */
+    void startup() override;
+
+    /**
+     * Register the stats
+     */
+    void regStats() override;
+
+    /**
+     * Stop issuing and wait for the requests in flight to complete.
+     *
+     * @return Drained if nothing is in flight, else Draining
+     */
+    DrainState drain() override;
+
+    /**
+     * Start issuing again after draining.
+     */
+    void drainResume() override;
+};
+
+
+#endif // __LEARNING_GEM5_TRACE_REPLAY_TRACE_REPLAY_HH__
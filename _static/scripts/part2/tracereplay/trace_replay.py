@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Jason Lowe-Power
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met: redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer;
+# redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution;
+# neither the name of the copyright holders nor the names of its
+# contributors may be used to endorse or promote products derived from
+# this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# Authors: Jason Lowe-Power
+
+""" This file replays a packet trace recorded by a SimpleMemobj (with its
+trace_file parameter) through a cache hierarchy without simulating a CPU.
+By default the trace drives the L1 I/D and L2 caches from Part 1. With
+--simple_cache it drives a single SimpleCache instead.
+
+The trace is found in the output directory of the run that recorded it,
+e.g. m5out/memobj.trc.
+"""
+
+# import the m5 (gem5) library created when gem5 is built
+import m5
+# import all of the SimObjects
+from m5.objects import *
+
+# import the caches from Part 1
+m5.util.addToPath('../part1')
+from caches_opts import *
+
+# import the options parser
+from optparse import OptionParser
+
+# add the options we want to be able to control from the command line
+parser = OptionParser()
+parser.add_option('--trace', help="Packet trace to replay")
+parser.add_option('--issue_width', type='int', default=2,
+                  help="Maximum requests issued per cycle")
+parser.add_option('--max_outstanding', type='int', default=16,
+                  help="Maximum requests in flight")
+parser.add_option('--dependence_distance', type='int', default=0,
+                  help="Each request waits for the one this many earlier")
+parser.add_option('--simple_cache', action='store_true',
+                  help="Replay through a SimpleCache instead of L1s and L2")
+parser.add_option('--simple_cache_size', default='1kB',
+                  help="SimpleCache size")
+parser.add_option('--l1i_size', help="L1 instruction cache size")
+parser.add_option('--l1d_size', help="L1 data cache size")
+parser.add_option('--l2_size', help="Unified L2 cache size")
+
+(options, args) = parser.parse_args()
+
+if not options.trace:
+    parser.error("--trace is required")
+
+# create the system we are going to simulate
+system = System()
+
+# Set the clock fequency of the system (and all of its children)
+system.clk_domain = SrcClockDomain()
+system.clk_domain.clock = '1GHz'
+system.clk_domain.voltage_domain = VoltageDomain()
+
+# Set up the system
+system.mem_mode = 'timing'               # Use timing accesses
+system.mem_ranges = [AddrRange('512MB')] # Create an address range
+
+# Create the trace replay in place of a CPU. It has icache_port and
+# dcache_port like a CPU, so the caches can connect to it the same way.
+system.cpu = TraceReplay(trace_file = options.trace,
+                         issue_width = options.issue_width,
+                         max_outstanding = options.max_outstanding,
+                         dependence_distance = options.dependence_distance)
+
+# Create a memory bus, a coherent crossbar, in this case
+system.membus = SystemXBar()
+
+if options.simple_cache:
+    # Create a simple cache and connect both replay ports to it
+    system.cache = SimpleCache(size = options.simple_cache_size)
+    system.cpu.icache_port = system.cache.cpu_side
+    system.cpu.dcache_port = system.cache.cpu_side
+    system.cache.mem_side = system.membus.slave
+else:
+    # Create an L1 instruction and data cache
+    system.cpu.icache = L1ICache(options)
+    system.cpu.dcache = L1DCache(options)
+
+    # Connect the instruction and data caches to the replay
+    system.cpu.icache.connectCPU(system.cpu)
+    system.cpu.dcache.connectCPU(system.cpu)
+
+    # Create a memory bus, a coherent crossbar, in this case
+    system.l2bus = L2XBar()
+
+    # Hook the L1 caches up to the l2bus
+    system.cpu.icache.connectBus(system.l2bus)
+    system.cpu.dcache.connectBus(system.l2bus)
+
+    # Create an L2 cache and connect it to the l2bus and the membus
+    system.l2cache = L2Cache(options)
+    system.l2cache.connectCPUSideBus(system.l2bus)
+    system.l2cache.connectMemSideBus(system.membus)
+
+# Connect the system up to the membus
+system.system_port = system.membus.slave
+
+# Create a DDR3 memory controller
+system.mem_ctrl = DDR3_1600_8x8()
+system.mem_ctrl.range = system.mem_ranges[0]
+system.mem_ctrl.port = system.membus.master
+
+# set up the root SimObject and start the simulation
+root = Root(full_system = False, system = system)
+# instantiate all of the objects we've created above
+m5.instantiate()
+
+print('Beginning replay!')
+exit_event = m5.simulate()
+print('Exiting @ tick %i because %s' % (m5.curTick(), exit_event.getCause()))